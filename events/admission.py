@@ -0,0 +1,171 @@
+# events/admission.py
+# 役割: 先着受付モード（Event.burst_mode）の参加受付キュー。
+#       API は RsvpRequest を1行積んで 202 を返すだけにし、確定は単一のアドミッタが
+#       イベントごとに受付順でまとめて行う（Participant は bulk_create、人数カラムの更新は1回）。
+#       申込が何百件集中しても、Event/Participant への書き込みはバッチ数ぶんしか発生しない。
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import rsvp
+from .models import Event, Participant, RsvpRequest
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _batch_size() -> int:
+    return int(getattr(settings, "LINE_RSVP_ADMIT_BATCH", 500))
+
+
+# =========================
+# 受付（ビュー）
+# =========================
+
+def _position(event_id: int, request_id: int) -> int:
+    """自分より前に並んでいる未確定の申込数＋1。"""
+    return RsvpRequest.objects.filter(event_id=event_id, status="queued", id__lt=request_id).count() + 1
+
+
+def enqueue(event_id: int, user_id: str) -> dict:
+    """
+    参加申込を受付キューに積む。既に申込済みならその状態を返す。
+    戻り値の status: 'queued'（確定待ち）/ 'joined' / 'waiting' / 'already'
+    """
+    try:
+        with transaction.atomic():
+            req = RsvpRequest.objects.create(event_id=event_id, user_id=user_id)
+    except IntegrityError:
+        req = RsvpRequest.objects.filter(event_id=event_id, user_id=user_id).first()
+        if req is None:
+            # 一意制約ではなく外部キー（イベントが無い）
+            raise Event.DoesNotExist(f"Event {event_id} does not exist")
+    if req.status != "queued":
+        return {"status": req.status, "is_waiting": req.status == "waiting"}
+    return {"status": "queued", "position": _position(event_id, req.id)}
+
+
+def cancel(event_id: int, user_id: str) -> dict:
+    """
+    確定前ならキューから取り下げ、確定済みなら通常のキャンセル（繰り上げ含む）。
+    burst_mode に関係なく使う（受付モードを外した後に残った申込も取り下げる）。
+    """
+    deleted, _ = RsvpRequest.objects.filter(event_id=event_id, user_id=user_id, status="queued").delete()
+    if deleted:
+        return {"status": "canceled", "promoted_user_id": None}
+    # 確定済みの申込記録も消して、再申込できるようにする
+    RsvpRequest.objects.filter(event_id=event_id, user_id=user_id).delete()
+    return rsvp.cancel(event_id, user_id)
+
+
+def queued_event_ids(user_id: str, event_ids) -> set[int]:
+    """確定待ちの申込があるイベントID（rsvp-status 用）。"""
+    return set(RsvpRequest.objects
+               .filter(user_id=user_id, event_id__in=event_ids, status="queued")
+               .values_list("event_id", flat=True))
+
+
+# =========================
+# 確定（アドミッタ）
+# =========================
+
+def admit_batch(event_id: int, *, limit: int | None = None) -> dict:
+    """
+    1イベントの未確定申込を受付順に最大 limit 件まとめて確定する。
+    戻り値: 結果ごとの件数 {'joined': n, 'waiting': n, 'already': n}
+    """
+    limit = limit or _batch_size()
+    with transaction.atomic():
+        # 最初にイベントの書き込みロックを取り、直接のキャンセル/繰り上げと直列化する
+        if not rsvp.lock_event(event_id):
+            RsvpRequest.objects.filter(event_id=event_id, status="queued").delete()
+            return {}
+        reqs = list(RsvpRequest.objects
+                    .filter(event_id=event_id, status="queued")
+                    .order_by("id")
+                    .values_list("id", "user_id")[:limit])
+        if not reqs:
+            return {}
+
+        users = [u for _, u in reqs]
+        existing = set(Participant.objects.filter(event_id=event_id, user_id__in=users).values_list("user_id", flat=True))
+        confirmed, capacity = Event.objects.values_list("confirmed_count", "capacity").get(pk=event_id)
+        seats = len(reqs) if capacity is None else max(capacity - confirmed, 0)
+
+        result = {"joined": [], "waiting": [], "already": []}
+        new_rows = []
+        for req_id, user_id in reqs:
+            if user_id in existing:
+                result["already"].append(req_id)
+                continue
+            waiting = seats <= 0
+            if not waiting:
+                seats -= 1
+            result["waiting" if waiting else "joined"].append(req_id)
+            new_rows.append(Participant(event_id=event_id, user_id=user_id, is_waiting=waiting))
+
+        Participant.objects.bulk_create(new_rows)
+        rsvp._bump(event_id, confirmed_count=len(result["joined"]), waitlist_count=len(result["waiting"]))
+        now = timezone.now()
+        for status, ids in result.items():
+            if ids:
+                RsvpRequest.objects.filter(pk__in=ids).update(status=status, processed_at=now)
+    return {status: len(ids) for status, ids in result.items()}
+
+
+def admit_once(*, limit: int | None = None) -> int:
+    """未確定の申込があるイベントを1巡処理する。戻り値は確定した申込数。"""
+    event_ids = list(RsvpRequest.objects
+                     .filter(status="queued")
+                     .values_list("event_id", flat=True)
+                     .order_by("event_id")
+                     .distinct())
+    done = 0
+    for event_id in event_ids:
+        try:
+            done += sum(admit_batch(event_id, limit=limit).values())
+        except Exception:
+            logger.exception("rsvp admission failed: event=%s", event_id)
+    return done
+
+
+def run_admitter(*, limit: int | None = None, idle_sleep: float = 0.2, stop=None, once: bool = False) -> int:
+    """
+    受付キューを確定し続けるループ（書き手はこの1本だけにする）。
+    - stop: threading.Event。セットされたら終了
+    - once: 確定するものが無くなった時点で終了
+    """
+    total = 0
+    while not (stop and stop.is_set()):
+        close_old_connections()
+        n = admit_once(limit=limit)
+        total += n
+        if n == 0:
+            if once:
+                break
+            time.sleep(idle_sleep)
+    close_old_connections()
+    return total
+
+
+# =========================
+# 監視・掃除
+# =========================
+
+def queue_stats() -> dict:
+    """未確定件数と、最古の未確定申込の待ち秒数を返す。"""
+    agg = RsvpRequest.objects.filter(status="queued").aggregate(n=Count("id"), t=Min("requested_at"))
+    lag = (timezone.now() - agg["t"]).total_seconds() if agg["t"] else 0.0
+    return {"queued": agg["n"], "lag_seconds": round(max(lag, 0.0), 3)}
+
+
+def prune_processed(older_than_seconds: int = 7 * 86400) -> int:
+    """確定済みの申込記録を削除する（参加状況は Participant に残っている）。"""
+    limit = timezone.now() - timedelta(seconds=older_than_seconds)
+    deleted, _ = RsvpRequest.objects.exclude(status="queued").filter(processed_at__lt=limit).delete()
+    return deleted
@@ -0,0 +1,130 @@
+# events/auth.py
+# 役割: LIFF API の利用者解決を一元化する。
+#       IDトークンは交換時に1回だけ検証し、以降はサーバ発行の署名付きセッションで user_id を解決する。
+
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+
+from . import idtoken
+
+import logging
+logger = logging.getLogger(__name__)
+
+SESSION_SALT = "events.liff-session"
+SESSION_COOKIE = "evb_session"
+
+
+def session_ttl() -> int:
+    return int(getattr(settings, "LIFF_SESSION_TTL", 3600))
+
+
+def issue_session(user_id: str) -> str:
+    """LINE user_id を載せた署名付きセッション文字列を発行する（'<user_id>:<ts>:<sig>'）。"""
+    return signing.TimestampSigner(salt=SESSION_SALT).sign(user_id)
+
+
+def resolve_session(token: str) -> str | None:
+    """セッション文字列を検証して user_id を返す。期限切れ/改ざんは None。"""
+    if not token:
+        return None
+    try:
+        return signing.TimestampSigner(salt=SESSION_SALT).unsign(token, max_age=session_ttl()) or None
+    except signing.BadSignature:
+        return None
+
+
+def get_json_body(request) -> dict:
+    """
+    JSONボディを1回だけパースして request にキャッシュする。
+    空ボディは {}、不正JSONは ValueError。
+    """
+    cached = getattr(request, "_json_body", None)
+    if cached is not None:
+        return cached
+    raw = request.body
+    body = json.loads(raw.decode("utf-8")) if raw else {}
+    if not isinstance(body, dict):
+        raise ValueError("json body must be an object")
+    request._json_body = body
+    return body
+
+
+def _session_from_request(request) -> str:
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if header[:7].lower() == "bearer ":
+        return header[7:].strip()
+    return request.COOKIES.get(SESSION_COOKIE, "")
+
+
+def _user_from_session(request) -> str | None:
+    return resolve_session(_session_from_request(request))
+
+
+def _user_from_id_token(request) -> str | None:
+    try:
+        id_token = (get_json_body(request).get("id_token") or "").strip()
+    except Exception:
+        return None
+    if not id_token:
+        return None
+    try:
+        return idtoken.verify_id_token_cached(id_token).get("sub") or None
+    except Exception as ex:
+        logger.info("id_token verify failed: %s", ex)
+        return None
+
+
+def resolve_line_user(request) -> str | None:
+    """
+    リクエストから LINE user_id を解決する。
+    1) Authorization: Bearer / セッションCookie（ネットワーク・ボディ解析なし）
+    2) 互換: JSONボディの id_token（検証キャッシュ経由）
+    """
+    return _user_from_session(request) or _user_from_id_token(request)
+
+
+async def aresolve_line_user(request) -> str | None:
+    """resolve_line_user の async 版。id_token 検証（リモートフォールバックあり）はスレッドで行う。"""
+    return _user_from_session(request) or await sync_to_async(_user_from_id_token)(request)
+
+
+def _unauthorized():
+    return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
+
+
+def require_line_user(view=None, *, methods: tuple[str, ...] | None = None):
+    """
+    ビュー用デコレータ（sync / async ビューの両方に対応）。解決した user_id を request.line_user_id に載せる。
+    - methods を指定した場合、そのHTTPメソッドのときだけ認証を要求する
+    - 解決できなければ 401 {'ok': False, 'reason': 'invalid_id_token'}
+    """
+    def decorator(fn):
+        if iscoroutinefunction(fn):
+            @wraps(fn)
+            async def awrapped(request, *args, **kwargs):
+                request.line_user_id = None
+                if methods is None or request.method in methods:
+                    user_id = await aresolve_line_user(request)
+                    if not user_id:
+                        return _unauthorized()
+                    request.line_user_id = user_id
+                return await fn(request, *args, **kwargs)
+            return awrapped
+
+        @wraps(fn)
+        def wrapped(request, *args, **kwargs):
+            request.line_user_id = None
+            if methods is None or request.method in methods:
+                user_id = resolve_line_user(request)
+                if not user_id:
+                    return _unauthorized()
+                request.line_user_id = user_id
+            return fn(request, *args, **kwargs)
+        return wrapped
+
+    return decorator(view) if view is not None else decorator
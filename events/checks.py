@@ -0,0 +1,63 @@
+# events/checks.py
+# 役割: 起動時の設定チェック（manage.py check / runserver / 各コマンドの開始時に Django が実行する）。
+
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches)
+def check_draft_cache(app_configs, **kwargs):
+    """
+    ウィザード下書きのキャッシュがプロセス内（locmem）なのに複数プロセスで動かす設定を止める。
+    下書きの途中経過はキャッシュにしか無いため、別プロセスに届いた次の入力が古い状態で処理されてしまう。
+    """
+    caches = getattr(settings, "CACHES", {})
+    backend = caches.get("drafts", caches.get("default", {})).get("BACKEND", "")
+    if int(getattr(settings, "APP_PROCESSES", 1)) > 1 and backend.endswith("LocMemCache"):
+        return [checks.Error(
+            "ウィザード下書きのキャッシュ（CACHES['drafts']）が locmem のまま複数プロセス（APP_PROCESSES > 1）で動かそうとしています",
+            hint="CACHE_BACKEND=file（同一ホスト）など、プロセス間で共有されるキャッシュを使ってください",
+            id="events.E001",
+        )]
+    return []
+
+
+@checks.register(checks.Tags.caches)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """
+    読み取りレプリカの read-your-writes 固定（db_router.pin）は CACHES['default'] に記録する。
+    locmem のまま複数プロセスで動かすと、書き込んだプロセス以外は固定を知らずに遅れたレプリカから読む。
+    """
+    alias = getattr(settings, "DB_READ_REPLICA", "")
+    if not alias or alias not in getattr(settings, "DATABASES", {}):
+        return []
+    backend = getattr(settings, "CACHES", {}).get("default", {}).get("BACKEND", "")
+    if int(getattr(settings, "APP_PROCESSES", 1)) > 1 and backend.endswith("LocMemCache"):
+        return [checks.Error(
+            "読み取りレプリカを使う設定で、書き込み直後の固定を記録するキャッシュ（CACHES['default']）が locmem のまま"
+            "複数プロセス（APP_PROCESSES > 1）で動かそうとしています",
+            hint="CACHE_BACKEND=file（同一ホスト）など、プロセス間で共有されるキャッシュを使ってください",
+            id="events.E003",
+        )]
+    return []
+
+
+@checks.register(checks.Tags.security)
+def check_idtoken_es256(app_configs, **kwargs):
+    """
+    LIFF の IDトークンは ES256。cryptography が無いとローカル検証できず、全トークンが verify エンドポイント行きになる。
+    フォールバックが有効なら警告（毎回 api.line.me へ往復する）、無効ならエラー（全トークンが検証できない）。
+    """
+    from . import idtoken
+    if getattr(settings, "LINE_IDTOKEN_VERIFY_MODE", "local") != "local" or idtoken.ec is not None:
+        return []
+    hint = "pip install cryptography でローカル検証を有効にするか、LINE_IDTOKEN_VERIFY_MODE=remote を明示してください"
+    if getattr(settings, "LINE_IDTOKEN_REMOTE_FALLBACK", True):
+        return [checks.Warning(
+            "cryptography が無いため ES256 の IDトークンをローカル検証できません（毎回 api.line.me の verify で検証します）",
+            hint=hint, id="events.W001",
+        )]
+    return [checks.Error(
+        "cryptography が無く LINE_IDTOKEN_REMOTE_FALLBACK=False のため、ES256 の IDトークンを検証できません",
+        hint=hint, id="events.E002",
+    )]
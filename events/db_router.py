@@ -0,0 +1,116 @@
+# events/db_router.py
+# 役割: LIFF の読み取り専用エンドポイントだけを読み取りレプリカへ向ける DB ルーター。
+#       ビューを @replica_reads で包むと、そのリクエストの間（contextvars）の読み取りがレプリカへ行く。
+#       自分で書き込んだ直後のユーザーは短時間プライマリに固定し（read-your-writes）、
+#       RSVP の結果がレプリカの遅れで消えて見えないようにする。
+
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import auth
+
+_reads_from_replica = contextvars.ContextVar("reads_from_replica", default=False)
+
+
+def replica_alias() -> str | None:
+    """設定されたレプリカの alias（未設定なら None）。"""
+    alias = getattr(settings, "DB_READ_REPLICA", "") or None
+    return alias if alias in connections else None
+
+
+def _pin_seconds() -> int:
+    return int(getattr(settings, "DB_READ_PIN_SECONDS", 5))
+
+
+def _pin_key(user_id: str) -> str:
+    return f"dbpin:{user_id}"
+
+
+# =========================
+# read-your-writes
+# =========================
+
+def pin(user_id: str | None) -> None:
+    """ユーザーの書き込み直後に呼ぶ。一定時間そのユーザーの読み取りをプライマリに固定する。"""
+    if user_id and replica_alias():
+        cache.set(_pin_key(user_id), 1, _pin_seconds())
+
+
+def is_pinned(user_id: str | None) -> bool:
+    return bool(user_id) and cache.get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def use_replica(enabled: bool = True):
+    """with の中の読み取りをレプリカへ向ける（enabled=False ならプライマリ）。"""
+    token = _reads_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reads_from_replica.reset(token)
+
+
+def replica_reads(view=None, *, methods: tuple[str, ...] | None = None):
+    """
+    読み取り専用ビュー用デコレータ。書き込み直後のユーザーはプライマリのまま。
+    - methods を指定した場合、そのHTTPメソッドのときだけレプリカを使う（同じビューの書き込み側は対象外）
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapped(request, *args, **kwargs):
+            if not replica_alias() or (methods is not None and request.method not in methods):
+                return fn(request, *args, **kwargs)
+            user_id = getattr(request, "line_user_id", None) or auth.resolve_line_user(request)
+            with use_replica(not is_pinned(user_id)):
+                return fn(request, *args, **kwargs)
+        return wrapped
+
+    return decorator(view) if view is not None else decorator
+
+
+def pins_writer(view):
+    """書き込みビュー用デコレータ。成功した書き込み（GET 以外）の後に、そのユーザーを固定する。"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method not in ("GET", "HEAD") and response.status_code < 400:
+            pin(getattr(request, "line_user_id", None))
+        return response
+    return wrapped
+
+
+# =========================
+# ルーター
+# =========================
+
+class ReadReplicaRouter:
+    """
+    settings.DATABASE_ROUTERS に登録する。
+    - 読み取り: replica_reads の中で、かつプライマリのトランザクション外ならレプリカ
+    - 書き込み/マイグレーション: プライマリ（レプリカは sync_replica やストリーミングレプリケーションで追従）
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _reads_from_replica.get():
+            return None
+        alias = replica_alias()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # None だとレプリカから読んだインスタンスの保存がレプリカへ行くため、明示的にプライマリを返す
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == getattr(settings, "DB_READ_REPLICA", ""):
+            return False
+        return None
@@ -0,0 +1,319 @@
+# events/drafts.py
+# 役割: チャットウィザードの下書き（EventDraft / EventEditDraft）のストア。
+#       ウィザードの開始（作成）と破棄（確定/終了）はすぐ DB に書き、途中のステップはキャッシュ（CACHES['drafts']）だけで済ませて、
+#       放置（DRAFT_FLUSH_IDLE_SECONDS）されたときにまとめて書く（write-behind）。
+#       キャッシュに無い（期限切れ/再起動）ときは DB の行から復元する。
+#       ボタンのポストバックには署名付きの下書き（to_token）を載せ、キャッシュに無くても DB を読まずに続行できる。
+
+import atexit, threading, time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db.models import Min
+from django.utils import timezone
+
+import logging
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# まだ DB に書いていない下書き: (model, user_id) -> (最終更新のepoch秒, 状態, 変更フィールド（None は全部）)
+_dirty: dict[tuple, tuple[float, dict, set | None]] = {}
+# 破棄済みの印（トークンや DB から復活させない）
+_GONE = "gone"
+TOKEN_VERSION = 2
+
+
+def _cache():
+    return caches["drafts" if "drafts" in settings.CACHES else "default"]
+
+
+def _idle_seconds() -> int:
+    return int(getattr(settings, "DRAFT_FLUSH_IDLE_SECONDS", 300))
+
+
+def _token_max_age() -> int:
+    return int(getattr(settings, "DRAFT_TOKEN_MAX_AGE", 3600))
+
+
+def _expire_seconds() -> int:
+    return int(getattr(settings, "DRAFT_EXPIRE_SECONDS", 3 * 86400))
+
+
+def _models():
+    from .models import EventDraft, EventEditDraft
+    return (EventDraft, EventEditDraft)
+
+
+def _key(model, user_id: str) -> str:
+    return f"draft:{model._meta.model_name}:{user_id}"
+
+
+def _fields(model) -> list[str]:
+    return [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+
+
+def _state_of(draft) -> dict:
+    return {"pk": draft.pk, **{name: getattr(draft, name) for name in _fields(type(draft))}}
+
+
+def _from_state(model, state: dict):
+    fields = {k: v for k, v in state.items() if k != "pk"}
+    obj = model(pk=state["pk"], **fields)
+    obj._state.adding = state["pk"] is None
+    return obj
+
+
+# =========================
+# 読み書き（ウィザード）
+# =========================
+
+def get(model, user_id: str):
+    """下書きを返す（無ければ None）。キャッシュに無ければ DB の行を読んでキャッシュに載せる。"""
+    return resume(model, user_id)
+
+
+def resume(model, user_id: str, token: str = ""):
+    """
+    キャッシュ → ポストバックのトークン → DB の順で下書きを探す。
+    トークンが有効なら DB には触れない（別プロセス/キャッシュ切れでもボタン操作は DB 不要）。
+    """
+    cache, key = _cache(), _key(model, user_id)
+    state = cache.get(key)
+    if state == _GONE:
+        return None
+    if state is not None:
+        return _from_state(model, state)
+    if token:
+        obj = from_token(model, user_id, token)
+        if obj is not None:
+            return obj
+    obj = model.objects.filter(user_id=user_id).first()
+    if obj is not None:
+        cache.set(key, _state_of(obj))
+    return obj
+
+
+def replace(model, user_id: str, **fields):
+    """
+    下書きを fields の内容で作り直す（既存があれば置き換え）。ウィザード開始時なので DB にもすぐ書く
+    （キャッシュを共有しない別プロセスに次の入力が届いても、下書きが見つかるように）。
+    """
+    obj = model(user_id=user_id, **fields)
+    save(obj, persist=True)
+    return obj
+
+
+def save(draft, *, fields=None, persist: bool = False) -> None:
+    """
+    下書きをキャッシュに保存する。DB へは persist=True のときか、放置されたときの flush() で書く。
+    flush() までの間に別プロセスが DB の行を読むと1つ前の状態に見えるので、CACHES['drafts'] はプロセス間で共有すること
+    （locmem を複数プロセスで使う設定は起動時チェック events.E001 で止める）。
+    - fields: 変更したフィールド名。DB の行があれば、その列だけを UPDATE する（前回の書き込み以降の分をまとめる）
+    """
+    model, user_id = type(draft), draft.user_id
+    draft.touched_at = timezone.now()
+    state = _state_of(draft)
+    _cache().set(_key(model, user_id), state)
+    if getattr(draft, "_from_token", False):
+        fields = None
+    elif fields is not None:
+        fields = [*fields, "touched_at"]
+    with _lock:
+        prev = _dirty.pop((model, user_id), None)
+        if fields is not None:
+            fields = {model._meta.get_field(f).attname for f in fields}
+            if prev is not None:
+                fields = None if prev[2] is None else fields | prev[2]
+        if not persist:
+            _dirty[(model, user_id)] = (time.time(), state, fields)
+    if persist:
+        _write(model, state, fields)
+        draft.pk = state["pk"]
+        draft._state.adding = False
+
+
+def delete(draft) -> None:
+    """下書きを破棄する（確定/終了）。"""
+    discard(type(draft), draft.user_id)
+
+
+def discard(model, user_id: str) -> None:
+    """user_id の下書きをキャッシュと DB から消す（DB へはすぐ書く）。"""
+    # 古いボタンのトークンで復活しないよう、トークンの有効期間だけ印を残す
+    _cache().set(_key(model, user_id), _GONE, _token_max_age())
+    with _lock:
+        _dirty.pop((model, user_id), None)
+    # 行を消しておけば、他プロセス/他スレッドの flush() が後から書いても復活しない（_write を参照）
+    model.objects.filter(user_id=user_id).delete()
+
+
+# =========================
+# ポストバック用トークン
+# =========================
+
+def _salt(model, user_id: str) -> str:
+    # 本人以外（グループで他人がボタンを押した場合など）には読めないようにする
+    return f"events.drafts.{model._meta.model_name}:{user_id}"
+
+
+def to_token(draft) -> str:
+    """下書きを署名付きの短い文字列にする（[版, pk, 各フィールド...] を圧縮して署名）。"""
+    model = type(draft)
+    values = []
+    for name in _fields(model):
+        if name == "user_id":
+            continue
+        v = getattr(draft, name)
+        if isinstance(v, datetime):
+            v = int(v.timestamp())
+        elif isinstance(v, bool):
+            v = int(v)
+        values.append(v)
+    return signing.dumps([TOKEN_VERSION, draft.pk, *values], salt=_salt(model, draft.user_id), compress=True)
+
+
+def from_token(model, user_id: str, token: str):
+    """to_token の逆。署名不一致・期限切れ・版違いは None。"""
+    try:
+        payload = signing.loads(token, salt=_salt(model, user_id), max_age=_token_max_age())
+    except signing.BadSignature:
+        return None
+    names = [n for n in _fields(model) if n != "user_id"]
+    if not isinstance(payload, list) or payload[:1] != [TOKEN_VERSION] or len(payload) != len(names) + 2:
+        return None
+    state = {"pk": payload[1], "user_id": user_id}
+    for name, v in zip(names, payload[2:]):
+        kind = model._meta.get_field(name).get_internal_type()
+        if kind == "DateTimeField" and v is not None:
+            v = datetime.fromtimestamp(v, tz=dt_timezone.utc)
+        elif kind == "BooleanField":
+            v = bool(v)
+        state[name] = v
+    obj = _from_state(model, state)
+    obj._from_token = True  # DB の行より新しい可能性があるので、保存時は全列を書く
+    return obj
+
+
+def split_token(data: str) -> tuple[str, str]:
+    """ポストバックの data から末尾のトークン（&s=...）を切り離す。"""
+    head, sep, token = (data or "").rpartition("&s=")
+    return (head, token) if sep else (data, "")
+
+
+# =========================
+# write-behind
+# =========================
+
+def _write(model, state: dict, fields: set | None = None) -> bool:
+    """
+    下書きを DB に書く。戻り値は書いたかどうか。
+    - pk が無い（作成時）: user_id で upsert し、pk をキャッシュに反映する
+    - pk がある: その行だけを UPDATE する。行が無いのはスナップショットの後に破棄（終了/確定/掃除）されたということなので、
+      作り直さずに何もしない
+    """
+    if state["pk"] is None:
+        values = {k: v for k, v in state.items() if k not in ("pk", "user_id")}
+        obj, _ = model.objects.update_or_create(user_id=state["user_id"], defaults=values)
+        state["pk"] = obj.pk
+        _cache().set(_key(model, state["user_id"]), state)
+        return True
+    names = fields if fields is not None else [k for k in state if k not in ("pk", "user_id")]
+    if not names:
+        return True
+    return bool(model.objects.filter(pk=state["pk"]).update(**{f: state[f] for f in names}))
+
+
+def flush(idle_seconds: float | None = None) -> int:
+    """
+    最後の更新から idle_seconds（既定 DRAFT_FLUSH_IDLE_SECONDS）以上たった未保存の下書きを DB に書く。
+    戻り値は書いた件数。0 を渡すと全件を書く（終了時など）。
+    """
+    idle = _idle_seconds() if idle_seconds is None else idle_seconds
+    now = time.time()
+    with _lock:
+        due = [(k, v) for k, v in _dirty.items() if now - v[0] >= idle]
+        for k, _ in due:
+            del _dirty[k]
+
+    written = 0
+    for (model, user_id), (touched, snapshot, fields) in due:
+        # 他プロセス（file キャッシュ共有時）が後から進めた分があればそちらを書く
+        state = _cache().get(_key(model, user_id)) or snapshot
+        if state == _GONE:
+            continue
+        if state != snapshot:
+            fields = None  # どの列が変わったか分からないので全列
+        try:
+            if _write(model, state, fields):
+                written += 1
+        except Exception:
+            logger.exception("draft flush failed: %s user=%s", model._meta.model_name, user_id)
+            with _lock:
+                _dirty.setdefault((model, user_id), (touched, snapshot, fields))
+    return written
+
+
+# =========================
+# 期限切れの掃除
+# =========================
+
+def _sweep_model(model, cutoff, chunk: int, pause: float) -> int:
+    total = 0
+    while True:
+        # 古い順に chunk 件ずつ、短いトランザクション（autocommit の DELETE 1文）で消す
+        ids = list(model.objects.filter(touched_at__lt=cutoff)
+                   .order_by("touched_at").values_list("pk", flat=True)[:chunk])
+        if not ids:
+            break
+        # 選んだ後に触られた行は残す
+        deleted, _ = model.objects.filter(pk__in=ids, touched_at__lt=cutoff).delete()
+        total += deleted
+        if len(ids) < chunk:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def sweep_expired(older_than_seconds: int | None = None, *, chunk: int = 500, pause: float = 0.0) -> dict:
+    """
+    最後の操作から older_than_seconds（既定 DRAFT_EXPIRE_SECONDS）以上たった下書きを削除する。
+    戻り値はモデルごとの削除件数。
+    """
+    seconds = _expire_seconds() if older_than_seconds is None else older_than_seconds
+    cutoff = timezone.now() - timedelta(seconds=seconds)
+    return {model._meta.model_name: _sweep_model(model, cutoff, max(1, chunk), pause) for model in _models()}
+
+
+def table_stats(older_than_seconds: int | None = None) -> dict:
+    """モデルごとの下書き行数（live）、期限切れの行数、最古の下書きの経過秒数。"""
+    seconds = _expire_seconds() if older_than_seconds is None else older_than_seconds
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=seconds)
+    out = {}
+    for model in _models():
+        oldest = model.objects.aggregate(t=Min("touched_at"))["t"]
+        out[model._meta.model_name] = {
+            "live": model.objects.count(),
+            "expired": model.objects.filter(touched_at__lt=cutoff).count(),
+            "oldest_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        }
+    return out
+
+
+def stats() -> dict:
+    with _lock:
+        unflushed = len(_dirty)
+    return {"unflushed": unflushed, "flush_idle_seconds": _idle_seconds(), "tables": table_stats()}
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if not _dirty:
+        return
+    try:
+        flush(0)
+    except Exception:
+        logger.exception("draft flush on exit failed")
@@ -0,0 +1,156 @@
+# events/group_summary.py
+# 役割: グループ名/アイコン（get_group_summary）の stale-while-revalidate キャッシュ。
+#       KnownGroup に保存済みの値を即座に返し、last_summary_at が TTL を過ぎたものだけ
+#       バックグラウンドで取り直す（DB の条件付き UPDATE で全プロセス合わせて TTL 内に1回まで）。
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import KnownGroup
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "LINE_GROUP_SUMMARY_TTL", 21600))
+
+
+def _retry_after() -> int:
+    return int(getattr(settings, "LINE_GROUP_SUMMARY_RETRY", 300))
+
+
+def _api():
+    # LineBotApi は views が共有プール付きで保持している
+    from . import views
+    return views.line_bot_api
+
+
+def is_stale(group: KnownGroup, now=None) -> bool:
+    now = now or timezone.now()
+    return group.last_summary_at is None or group.last_summary_at < now - timedelta(seconds=_ttl())
+
+
+# =========================
+# 取得・保存
+# =========================
+
+def _claim(group_id: str) -> bool:
+    """
+    期限切れの行だけ last_summary_at を今にして確保する（1回の UPDATE）。
+    確保できた呼び出しだけが LINE API を叩くので、同時アクセスが重なっても TTL 内に1回まで。
+    """
+    now = timezone.now()
+    stale = Q(last_summary_at__isnull=True) | Q(last_summary_at__lt=now - timedelta(seconds=_ttl()))
+    return KnownGroup.objects.filter(stale, group_id=group_id).update(last_summary_at=now) == 1
+
+
+def fetch_and_store(group_id: str) -> bool:
+    """get_group_summary を呼んで名前/アイコンを保存する。失敗時は RETRY 秒後に再取得可能にする。"""
+    try:
+        s = _api().get_group_summary(group_id)
+    except Exception as ex:
+        logger.info("get_group_summary failed: group=%s %s", group_id, ex)
+        retry_at = timezone.now() - timedelta(seconds=max(_ttl() - _retry_after(), 0))
+        KnownGroup.objects.filter(group_id=group_id).update(last_summary_at=retry_at)
+        return False
+    fields = {"last_summary_at": timezone.now()}
+    name = getattr(s, "group_name", None) or getattr(s, "groupName", "") or ""
+    picture = getattr(s, "picture_url", None) or getattr(s, "pictureUrl", "") or ""
+    if name:
+        fields["name"] = name
+    if picture:
+        fields["picture_url"] = picture
+    KnownGroup.objects.filter(group_id=group_id).update(**fields)
+    return True
+
+
+def refresh(group_id: str, *, force: bool = False) -> bool:
+    """期限切れ（force なら無条件）のグループを取り直す。取り直さなかった場合は False。"""
+    if not force and not _claim(group_id):
+        return False
+    return fetch_and_store(group_id)
+
+
+# =========================
+# バックグラウンド更新
+# =========================
+
+_lock = threading.Lock()
+_inflight: set[str] = set()
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = int(getattr(settings, "LINE_GROUP_SUMMARY_WORKERS", 2))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="group-summary")
+    return _executor
+
+
+def _in_worker(fn, *args):
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+def _submit(fn, *args):
+    return _get_executor().submit(_in_worker, fn, *args)
+
+
+def schedule_refresh(group_id: str) -> bool:
+    """バックグラウンド更新を1件予約する（同じグループの更新がプロセス内で進行中なら何もしない）。"""
+    with _lock:
+        if group_id in _inflight:
+            return False
+        _inflight.add(group_id)
+
+    def task():
+        try:
+            refresh(group_id)
+        except Exception as ex:
+            logger.warning("group summary refresh failed: group=%s %s", group_id, ex)
+        finally:
+            with _lock:
+                _inflight.discard(group_id)
+
+    _submit(task)
+    return True
+
+
+def ensure_fresh(group: KnownGroup) -> None:
+    """保存済みの値はそのまま使わせ、期限切れならバックグラウンド更新だけ予約する。"""
+    if group.group_id and is_stale(group):
+        schedule_refresh(group.group_id)
+
+
+# =========================
+# 一括更新（管理コマンド）
+# =========================
+
+def refresh_all(*, concurrency: int = 4, force: bool = False) -> dict:
+    """参加中グループ（force でなければ期限切れのみ）を並列数 concurrency で取り直す。"""
+    qs = KnownGroup.objects.filter(joined=True)
+    if not force:
+        limit = timezone.now() - timedelta(seconds=_ttl())
+        qs = qs.filter(Q(last_summary_at__isnull=True) | Q(last_summary_at__lt=limit))
+    group_ids = list(qs.values_list("group_id", flat=True))
+
+    def one(gid):
+        return _in_worker(lambda: refresh(gid, force=force))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="group-summary-bulk") as pool:
+        results = list(pool.map(one, group_ids))
+    return {"targets": len(group_ids), "refreshed": sum(1 for r in results if r),
+            "failed_or_skipped": sum(1 for r in results if not r)}
@@ -4,7 +4,7 @@
 import re
 from linebot.models import TextSendMessage
 from ..models import Event, EventEditDraft
-from .. import ui
+from .. import drafts, ui
 from .. import policies
 
 
@@ -31,18 +31,16 @@ def handle_evt_shortcut(user_id: str, scope_id: str, data: str):
     if not policies.can_edit_event(user_id, e):
         return TextSendMessage(text="イベントの作成者だけが編集できるよ")
 
-    EventEditDraft.objects.update_or_create(
-        user_id=user_id,
-        defaults={
-            "event": e,
-            "step": "menu",
-            "name": e.name,
-            "start_time": e.start_time,
-            "start_time_has_clock": getattr(e, "start_time_has_clock", True),
-            "end_time": e.end_time,
-            "end_time_has_clock": bool(e.end_time),
-            "capacity": e.capacity,
-            "scope_id": scope_id,
-        }
+    drafts.replace(
+        EventEditDraft, user_id,
+        event=e,
+        step="menu",
+        name=e.name,
+        start_time=e.start_time,
+        start_time_has_clock=getattr(e, "start_time_has_clock", True),
+        end_time=e.end_time,
+        end_time_has_clock=bool(e.end_time),
+        capacity=e.capacity,
+        scope_id=scope_id,
     )
     return ui.ask_edit_menu()
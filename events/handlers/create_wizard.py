@@ -1,60 +1,41 @@
 # events/handlers/create_wizard.py
 # 役割: 「作成ウィザード」テキスト/ポストバックの処理を担当する
+#       各ステップの入力処理は TEXT_STEPS / POSTBACK_STEPS / BACK_STEPS の表で定義する（steps.py）
 
-import re
 import logging
 from linebot.models import TextSendMessage
 from ..models import Event, EventDraft, EventEditDraft
-from .. import ui, utils
+from .. import drafts, ui, utils
+from . import steps
+from .steps import Step, NO_END
 
 logger = logging.getLogger(__name__)
 
-# --- ドラフトを1段階戻す ---
-def _go_back_one_step(draft: "EventDraft"):
-    """
-    現在のdraft.stepから一段階前に戻し、必要なフィールドを巻き戻した上で
-    適切なメニューを返す。
-    """
-    if draft.step == "title":
-        return [
-            TextSendMessage(text="これ以上は戻れないよ"),
-            ui.msg("ask_title"),
-        ]
-        
-    if draft.step == "start_date":
-        draft.step = "title"; draft.save()
-        return ui.msg("ask_title")
 
-    if draft.step == "start_time":
-        draft.start_time = None; draft.step = "start_date"; draft.save()
-        return ui.ask_date_picker(data="pick=start_date")
-    
-    if draft.step == "end_mode":
-        draft.end_time = None; draft.capacity = None
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "start_time"; draft.save()
-        return ui.ask_time_menu(prefix="start")
-    
-    if draft.step == "end_time":
-        draft.end_time = None
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "end_mode"; draft.save()
-        return ui.ask_end_mode_menu()
-    
-    if draft.step == "duration":
-        draft.end_time = None
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "end_mode"; draft.save()
-        return ui.ask_end_mode_menu()
-    
-    if draft.step == "cap":
-        draft.capacity = None; draft.step = "end_mode"; draft.save()
-        return ui.ask_end_mode_menu()
-
-    return TextSendMessage(text="これ以上は戻れないよ")
+# --- プロンプト（次の質問） ---
+def _ask_title(draft):
+    return ui.msg("ask_title")
+
+def _ask_start_date(draft):
+    return ui.ask_date_picker(data="pick=start_date", state=drafts.to_token(draft))
+
+def _ask_start_time(draft):
+    return ui.ask_time_menu(prefix="start", state=drafts.to_token(draft))
+
+def _ask_end_mode(draft):
+    return ui.ask_end_mode_menu(state=drafts.to_token(draft))
+
+def _ask_end_time(draft):
+    return ui.ask_time_menu(prefix="end", state=drafts.to_token(draft))
+
+def _ask_duration(draft):
+    return ui.ask_duration_menu(state=drafts.to_token(draft))
+
+def _ask_capacity(draft):
+    return ui.ask_capacity_menu(state=drafts.to_token(draft))
+
+def _error(key, draft):
+    return ui.msg(key)
 
 
 # --- 確定処理 ---
@@ -95,78 +76,80 @@ def _finalize_event(draft: "EventDraft"):
         f"{cap_text}"
     )
 
-    draft.delete()
-    
+    drafts.delete(draft)
+
     msg = TextSendMessage(text=summary, quick_reply=ui.make_quick_reply())
     return msg
 
 
+# --- 状態遷移表 ---
+RESET = {"name": "", "start_time": None, "end_time": None, "capacity": None, "end_time_has_clock": False}
+
+# テキスト入力: 現在ステップ → Step
+TEXT_STEPS = {
+    "title":      Step(steps.parse_title,       "start_date", _ask_start_date),
+    "start_time": Step(steps.parse_start_clock, "end_mode",   _ask_end_mode),
+    "end_time":   Step(steps.parse_end_clock,   "cap",        _ask_capacity),
+    "duration":   Step(steps.parse_duration,    "cap",        _ask_capacity),
+    "cap":        Step(steps.parse_capacity,    "done",       _finalize_event),
+}
+
+# ポストバック: data のキー（steps.postback_key）→ Step
+POSTBACK_STEPS = {
+    "reset":            Step(steps.changes(RESET), "title", _ask_title),
+    "pick=start_date":  Step(steps.parse_start_date, "start_time", _ask_start_time, when="start_date"),
+    "time=start":       Step(steps.skippable(steps.parse_start_clock, {"start_time_has_clock": False}),
+                             "end_mode", _ask_end_mode, when="start_time"),
+    "time=end":         Step(steps.skippable(steps.parse_end_clock, NO_END), "cap", _ask_capacity, when="end_time"),
+    "endmode=enddt":    Step(steps.parse_end_of_day, "end_time", _ask_end_time),
+    "endmode=duration": Step(steps.changes({"end_time_has_clock": False}), "duration", _ask_duration),
+    "endmode=skip":     Step(steps.changes(NO_END), "cap", _ask_capacity),
+    "dur":              Step(steps.skippable(steps.parse_duration, NO_END), "cap", _ask_capacity, when="duration"),
+    "cap=skip":         Step(steps.changes({"capacity": None}), "done", _finalize_event, when="cap"),
+}
+
+# 「戻る」: 現在ステップ → 巻き戻すフィールドと1つ前のステップ
+BACK_STEPS = {
+    "start_date": Step(steps.changes({}), "title", _ask_title),
+    "start_time": Step(steps.changes({"start_time": None}), "start_date", _ask_start_date),
+    "end_mode":   Step(steps.changes({"end_time": None, "capacity": None, "end_time_has_clock": False}),
+                       "start_time", _ask_start_time),
+    "end_time":   Step(steps.changes(NO_END), "end_mode", _ask_end_mode),
+    "duration":   Step(steps.changes(NO_END), "end_mode", _ask_end_mode),
+    "cap":        Step(steps.changes({"capacity": None}), "end_mode", _ask_end_mode),
+}
+
+
+# --- ドラフトを1段階戻す ---
+def _go_back_one_step(draft: "EventDraft"):
+    """
+    現在のdraft.stepから一段階前に戻し、必要なフィールドを巻き戻した上で
+    適切なメニューを返す。
+    """
+    if draft.step == "title":
+        return [
+            TextSendMessage(text="これ以上は戻れないよ"),
+            ui.msg("ask_title"),
+        ]
+    step = BACK_STEPS.get(draft.step)
+    if step is None:
+        return TextSendMessage(text="これ以上は戻れないよ")
+    return steps.run(step, draft, None, {}, error=_error)
+
+
 # --- テキスト処理 ---
 def handle_wizard_text(user_id: str, text: str):
     """
     ユーザーのテキスト入力を処理する。
     タイトル、開始時刻の手入力、終了時刻の手入力、所要時間、定員。
     """
-    try:
-        draft = EventDraft.objects.get(user_id=user_id)
-    except EventDraft.DoesNotExist:
+    draft = drafts.get(EventDraft, user_id)
+    if draft is None:
         return None
-
-    # タイトル → 開始日
-    if draft.step == "title":
-        if not text:
-            ui.msg("ask_title")
-        draft.name = text; draft.step = "start_date"
-        draft.save()
-        return ui.ask_date_picker(data="pick=start_date")
-
-    # 開始時刻 手入力
-    if draft.step == "start_time":
-        new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, text)
-        if new_dt is None:
-            return ui.msg("invalid_time")
-        draft.start_time = new_dt
-        draft.start_time_has_clock = True
-        draft.step = "end_mode"
-        draft.save()
-        return ui.ask_end_mode_menu()
-
-    # 終了時刻 手入力
-    if draft.step == "end_time":
-        new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, text)
-        if new_dt is None:
-            return ui.msg("invalid_time")
-        if draft.start_time and new_dt <= draft.start_time:
-            return ui.msg("invalid_end_time")
-        draft.end_time = new_dt
-        try: draft.end_time_has_clock = True
-        except Exception: pass
-        draft.step = "cap"; draft.save()
-        return ui.ask_capacity_menu()
-
-    # 所要時間 手入力
-    if draft.step == "duration":
-        delta = utils.parse_duration_to_delta(text)
-        if not delta or delta.total_seconds() <= 0:
-            return ui.msg("invalid_duration")
-        draft.end_time = draft.start_time + delta
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "cap"
-        draft.save()
-        return ui.ask_capacity_menu()
-
-    # 定員 手入力
-    if draft.step == "cap":
-        capacity = utils.parse_int_safe(text)
-        if capacity is None or capacity <= 0:
-            return ui.msg("invalid_cap")
-        draft.capacity = capacity
-        draft.step = "done"
-        draft.save()
-        return _finalize_event(draft)
-
-    return None
+    step = TEXT_STEPS.get(draft.step)
+    if step is None:
+        return None
+    return steps.run(step, draft, text, {}, error=_error)
 
 
 # --- ポストバック処理 ---
@@ -174,20 +157,13 @@ def handle_wizard_postback(user_id: str, data: str, params: dict, scope_id: str)
     """
     作成ウィザードのPostback（ボタン選択・DatetimePickerの戻り）を処理する。
     （日付ピッカー、時刻候補、所要時間候補、スキップ/戻る/リセットなど）
+    ボタンの data に下書きトークン（&s=...）が付いていれば、キャッシュに無くても DB を読まずに続行する。
     """
-        
+    data, token = drafts.split_token(data)
+
     # ホームメニュー（ドラフトの有無に関係なく動く）
     if data == "home=create":
-        draft, _ = EventDraft.objects.get_or_create(user_id=user_id, defaults={"step": "title"})
-        draft.step = "title"; draft.name = ""
-        draft.start_time = None
-        draft.end_time = None
-        draft.capacity = None
-        try: 
-            draft.end_time_has_clock = False
-        except Exception: 
-            pass
-        draft.scope_id = scope_id; draft.save()
+        drafts.replace(EventDraft, user_id, step="title", scope_id=scope_id)
         return ui.msg("ask_title")
 
     if data == "home=help":
@@ -195,136 +171,29 @@ def handle_wizard_postback(user_id: str, data: str, params: dict, scope_id: str)
 
     if data == "home=exit":
         # イベントドラフトを破棄
-        EventDraft.objects.filter(user_id=user_id).delete()
-        EventEditDraft.objects.filter(user_id=user_id).delete()       
-         
+        drafts.discard(EventDraft, user_id)
+        drafts.discard(EventEditDraft, user_id)
         return ui.msg("exit")
-    
+
     # --- 以降、ドラフト必須 --------
-    
+
     # 作成ウィザードの処理
-    try:
-        draft = EventDraft.objects.get(user_id=user_id)
-    except EventDraft.DoesNotExist:
+    draft = drafts.resume(EventDraft, user_id, token)
+    if draft is None:
         return None
 
     if data == "back":
         return _go_back_one_step(draft)
 
-    if data == "reset":
-        draft.step = "title"; draft.name = ""
-        draft.start_time = None
-        draft.end_time = None
-        draft.capacity = None
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.save()
-        return ui.msg("ask_title")
-
     if data == "exit":
         # 作成ドラフトを破棄して終了
-        draft.delete()
+        drafts.delete(draft)
         return ui.msg("exit")
-        
+
     logger.debug("wizard postback step=%s data=%s", draft.step, data)
-    
-    # 開始日選択（DatetimePicker）
-    if data == "pick=start_date" and draft.step == "start_date":
-        d0 = utils.extract_dt_from_params_date_only(params)
-        if not d0:
-            return ui.msg("invalid_date")
-        draft.start_time = d0
-        draft.start_time_has_clock = False
-        draft.step = "start_time"
-        draft.save()
-        return ui.ask_time_menu(prefix="start")
-
-    # 時刻候補（start/end）
-    m = re.search(r"time=(start|end)&v=([^&]+)$", data or "")
-    if m:
-        kind, v = m.group(1), m.group(2)
-
-        if kind == "start" and draft.step == "start_time":
-            if v == "__skip__":
-                draft.start_time_has_clock = False
-                draft.step = "end_mode"
-                draft.save()
-                return ui.ask_end_mode_menu()
-            new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, v)
-            if new_dt is None:
-                return ui.msg("invalid_time")
-            draft.start_time = new_dt
-            draft.start_time_has_clock = True
-            draft.step = "end_mode"
-            draft.save()
-            return ui.ask_end_mode_menu()
-
-        if kind == "end" and draft.step == "end_time":
-            if v == "__skip__":
-                draft.end_time = None
-                try: draft.end_time_has_clock = False
-                except Exception: pass
-                draft.step = "cap"
-                draft.save()
-                return ui.ask_capacity_menu()
-            new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, v)
-            if new_dt is None:
-                return ui.msg("invalid_time")
-            if draft.start_time and new_dt <= draft.start_time:
-                return ui.msg("invalid_end_time")
-            draft.end_time = new_dt
-            try: draft.end_time_has_clock = True
-            except Exception: pass
-            draft.step = "cap"
-            draft.save()
-            return ui.ask_capacity_menu()
-
-    # 終了の指定方法
-    if data == "endmode=enddt":
-        draft.end_time = utils.hhmm_to_utc_on_same_day(draft.start_time, "00:00")
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "end_time"
-        draft.save()
-        return ui.ask_time_menu(prefix="end")
-    if data == "endmode=duration":
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "duration"
-        draft.save()
-        return ui.ask_duration_menu()
-
-    if data == "endmode=skip":
-        draft.end_time = None
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "cap"
-        draft.save()
-        return ui.ask_capacity_menu()
-
-    # 所要時間プリセット/スキップ
-    if data.startswith("dur=") and draft.step == "duration":
-        code = data.split("=", 1)[1]
-        if code == "skip":
-            draft.end_time = None
-            try: draft.end_time_has_clock = False
-            except Exception: pass
-            draft.step = "cap"
-            draft.save()
-            return ui.ask_capacity_menu()
-
-        delta = utils.parse_duration_to_delta(code)
-        if not delta or delta.total_seconds() <= 0:
-            return ui.msg("invalid_duration")
-        draft.end_time = draft.start_time + delta
-        try: draft.end_time_has_clock = False
-        except Exception: pass
-        draft.step = "cap"; draft.save()
-        return ui.ask_capacity_menu()
-
-    # 定員スキップ
-    if data == "cap=skip" and draft.step == "cap":
-        draft.capacity = None; draft.step = "done"; draft.save()
-        return _finalize_event(draft)
-
-    return None
+
+    key, value = steps.postback_key(data)
+    step = steps.lookup(POSTBACK_STEPS, key, draft)
+    if step is None:
+        return None
+    return steps.run(step, draft, value, params, error=_error)
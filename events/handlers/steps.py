@@ -0,0 +1,133 @@
+# events/handlers/steps.py
+# 役割: チャットウィザードの状態遷移表（ステップ → パーサ → 次ステップ → プロンプト）を動かす共通部分と、
+#       作成/編集ウィザードで共通の入力パーサ。
+#       各ウィザードは「入力の種類（テキストなら現在ステップ、ポストバックなら data のキー）→ Step」の dict を持ち、
+#       1イベントあたり dict を1回引くだけで処理が決まる。
+
+from typing import Callable, NamedTuple
+
+from .. import drafts, utils
+
+
+class Step(NamedTuple):
+    """
+    状態遷移表の1行。
+    - parse   : (draft, value, params) -> 変更するフィールドの dict、または不正入力のメッセージキー（str）
+    - next    : 遷移先ステップ（None なら現在のまま）
+    - prompt  : (draft) -> 返信
+    - when    : このステップのときだけ受け付ける（None なら常に）
+    - on_error: (key, draft) -> 返信。省略時はウィザード既定のエラー表示
+    """
+    parse: Callable
+    next: str | None
+    prompt: Callable
+    when: str | None = None
+    on_error: Callable | None = None
+
+
+def postback_key(data: str) -> tuple[str, str | None]:
+    """
+    ポストバックの data を表のキーと値に分ける。
+    'time=start&v=19:00' → ('time=start', '19:00') / 'dur=90m' → ('dur', '90m') / 'cap=skip' → ('cap=skip', None)
+    """
+    head, sep, value = (data or "").partition("&v=")
+    if sep:
+        return head, value
+    name, _, code = head.partition("=")
+    if name == "dur":
+        return name, code
+    return head, None
+
+
+def lookup(table: dict, key: str, draft) -> Step | None:
+    step = table.get(key)
+    if step is None or (step.when is not None and draft.step != step.when):
+        return None
+    return step
+
+
+def run(step: Step, draft, value, params, *, error: Callable):
+    """
+    1ステップを実行する。変わったフィールド（と step）だけを下書きストアに記録し、次のプロンプトを返す。
+    """
+    result = step.parse(draft, value, params)
+    if isinstance(result, str):
+        return (step.on_error or error)(result, draft)
+    fields = list(result)
+    for name, v in result.items():
+        setattr(draft, name, v)
+    if step.next is not None and step.next != draft.step:
+        draft.step = step.next
+        fields.append("step")
+    if fields:
+        drafts.save(draft, fields=fields)
+    return step.prompt(draft)
+
+
+# =========================
+# パーサ（作成/編集で共通）
+# =========================
+
+NO_END = {"end_time": None, "end_time_has_clock": False}
+
+
+def changes(values: dict) -> Callable:
+    """入力に関係なく固定の変更を返すパーサ（ボタンの選択など）。"""
+    return lambda draft, value, params: dict(values)
+
+
+def skippable(parser: Callable, on_skip: dict) -> Callable:
+    """値が '__skip__' / 'skip'（「設定しない」ボタン）なら on_skip、それ以外は parser に任せる。"""
+    def parse(draft, value, params):
+        if value in ("__skip__", "skip"):
+            return dict(on_skip)
+        return parser(draft, value, params)
+    return parse
+
+
+def parse_title(draft, text, params):
+    if not text:
+        return "ask_title"
+    return {"name": text}
+
+
+def parse_start_date(draft, value, params):
+    d0 = utils.extract_dt_from_params_date_only(params)
+    if not d0:
+        return "invalid_date"
+    return {"start_time": d0, "start_time_has_clock": False}
+
+
+def parse_start_clock(draft, text, params):
+    new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, text)
+    if new_dt is None:
+        return "invalid_time"
+    return {"start_time": new_dt, "start_time_has_clock": True}
+
+
+def parse_end_clock(draft, text, params):
+    new_dt = utils.hhmm_to_utc_on_same_day(draft.start_time, text)
+    if new_dt is None:
+        return "invalid_time"
+    if draft.start_time and new_dt <= draft.start_time:
+        return "invalid_end_time"
+    return {"end_time": new_dt, "end_time_has_clock": True}
+
+
+def parse_end_of_day(draft, value, params):
+    # 「終了時刻を入力」: 開始日の 00:00 を仮置きして時刻入力へ
+    return {"end_time": utils.hhmm_to_utc_on_same_day(draft.start_time, "00:00"), "end_time_has_clock": False}
+
+
+def parse_duration(draft, text, params):
+    delta = utils.parse_duration_to_delta(text)
+    if not delta or delta.total_seconds() <= 0:
+        return "invalid_duration"
+    return {"end_time": draft.start_time + delta, "end_time_has_clock": False}
+
+
+def parse_capacity(draft, text, params):
+    capacity = utils.parse_int_safe(text)
+    if capacity is None or capacity <= 0:
+        return "invalid_cap"
+    return {"capacity": capacity}
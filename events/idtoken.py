@@ -0,0 +1,311 @@
+# events/idtoken.py
+# 役割: LIFF の IDトークン(JWT)をサーバ内で検証する（署名/aud/iss/exp/nonce）。
+#       api.line.me への検証リクエストは、ローカル検証できない場合のフォールバックに限定する。
+#       ES256（LIFF の既定署名）のローカル検証には cryptography が必要。入れていない環境では ES256 は
+#       これまでどおり verify エンドポイントで検証する（LINE_IDTOKEN_REMOTE_FALLBACK=True が既定）。
+
+import base64, hashlib, hmac, json, threading, time
+
+from django.conf import settings
+
+from . import line_client
+from .ttlcache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:  # ES256（LIFF/ミニアプリの既定署名）の検証には cryptography が必要（任意依存）
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+except ImportError:  # pragma: no cover - 環境依存
+    ec = None
+
+VERIFY_ENDPOINT = "https://api.line.me/oauth2/v2.1/verify"
+DEFAULT_JWKS_URL = "https://api.line.me/oauth2/v2.1/certs"
+DEFAULT_ISSUER = "https://access.line.me"
+
+
+class IdTokenError(ValueError):
+    """IDトークンが不正（署名/期限/aud/iss/nonce のいずれかがNG）。"""
+
+
+class IdTokenUnsupported(IdTokenError):
+    """ローカルでは検証できない（鍵が見つからない/ライブラリ不足など）。"""
+
+
+# =========================
+# 署名鍵（JWKS）のキャッシュ
+# =========================
+
+_jwks_lock = threading.Lock()
+# fetched_at: 最後に取得できた時刻 / attempted_at: 最後に取りに行った時刻 / failed_at: 最後に失敗した時刻（monotonic）
+_jwks_cache = {"keys": {}, "fetched_at": 0.0, "attempted_at": 0.0, "failed_at": 0.0, "last_error": ""}
+
+
+def _b64url_decode(s: str) -> bytes:
+    s = s or ""
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _load_local_jwks() -> dict | None:
+    """
+    settings.LINE_IDTOKEN_JWKS（JSON文字列 or dict）を読む。
+    テスト/オフライン環境向けの代替鍵セットで、設定されていればリモート取得より優先する。
+    """
+    raw = getattr(settings, "LINE_IDTOKEN_JWKS", None)
+    if not raw:
+        return None
+    if isinstance(raw, (str, bytes)):
+        raw = json.loads(raw)
+    return raw
+
+
+def _fetch_remote_jwks() -> dict:
+    url = getattr(settings, "LINE_IDTOKEN_JWKS_URL", "") or DEFAULT_JWKS_URL
+    resp = line_client.request("GET", url, timeout=(3.05, 5))
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _index_keys(jwks: dict) -> dict:
+    """JWKS を kid -> JWK の dict にする（kid 無しは '' で保持）。"""
+    out = {}
+    for k in (jwks or {}).get("keys", []) or []:
+        out[k.get("kid", "")] = k
+    return out
+
+
+def get_signing_keys(force: bool = False) -> dict:
+    """
+    署名鍵を kid -> JWK で返す。
+    - 代替鍵セットが設定されていればそれを使う
+    - それ以外は JWKS をTTL付きでプロセス内キャッシュする（force=True で再取得）
+    - 取りに行くのは LINE_IDTOKEN_JWKS_MIN_REFRESH 秒に1回まで（未知の kid を付けたトークンの連打や
+      取得失敗が続いても certs を叩き続けない）。間隔内はキャッシュ済みの鍵を返す
+    """
+    local = _load_local_jwks()
+    if local is not None:
+        return _index_keys(local)
+
+    ttl = int(getattr(settings, "LINE_IDTOKEN_JWKS_TTL", 3600))
+    min_interval = float(getattr(settings, "LINE_IDTOKEN_JWKS_MIN_REFRESH", 60))
+    now = time.monotonic()
+    with _jwks_lock:
+        fresh = _jwks_cache["keys"] and (now - _jwks_cache["fetched_at"]) < ttl
+        if fresh and not force:
+            return _jwks_cache["keys"]
+        if _jwks_cache["attempted_at"] and now - _jwks_cache["attempted_at"] < min_interval:
+            return _jwks_cache["keys"]
+        _jwks_cache["attempted_at"] = now  # 同時に来た他スレッドは取りに行かない
+    try:
+        keys = _index_keys(_fetch_remote_jwks())
+    except Exception as ex:
+        logger.warning("jwks fetch failed: %s", ex)
+        with _jwks_lock:
+            _jwks_cache["failed_at"] = now
+            _jwks_cache["last_error"] = str(ex)[:200]
+        return _jwks_cache["keys"]  # 取得失敗時は古い鍵で継続
+    with _jwks_lock:
+        _jwks_cache["keys"] = keys
+        _jwks_cache["fetched_at"] = now
+    return keys
+
+
+def clear_signing_keys() -> None:
+    """キャッシュ済みの鍵を破棄する（主にテスト用）。"""
+    with _jwks_lock:
+        _jwks_cache.update(keys={}, fetched_at=0.0, attempted_at=0.0, failed_at=0.0, last_error="")
+
+
+def jwks_stats() -> dict:
+    """JWKS キャッシュの状態（鍵の数、最後の取得/失敗からの経過秒数、ES256 をローカル検証できるか）。"""
+    now = time.monotonic()
+    with _jwks_lock:
+        c = dict(_jwks_cache)
+
+    def age(t):
+        return round(now - t, 1) if t else None
+    return {
+        "keys": len(c["keys"]),
+        "fetched_ago": age(c["fetched_at"]),
+        "failed_ago": age(c["failed_at"]),
+        "last_error": c["last_error"],
+        "es256_local": ec is not None,
+    }
+
+
+# =========================
+# 署名検証
+# =========================
+
+def _verify_hs256(signing_input: bytes, sig: bytes, header: dict) -> None:
+    """HS256: 代替鍵セットの oct 鍵、無ければチャネルシークレットで検証する。"""
+    key = None
+    local = _load_local_jwks()
+    jwk = _index_keys(local).get(header.get("kid", "")) if local else None
+    if jwk and jwk.get("kty") == "oct":
+        key = _b64url_decode(jwk.get("k", ""))
+    if key is None:
+        secret = getattr(settings, "MINIAPP_CHANNEL_SECRET", "")
+        if not secret:
+            raise IdTokenUnsupported("no key for HS256")
+        key = secret.encode("utf-8")
+    expected = hmac.new(key, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, sig):
+        raise IdTokenError("bad signature")
+
+
+def _verify_es256(signing_input: bytes, sig: bytes, header: dict) -> None:
+    """
+    ES256: JWKS の EC(P-256) 公開鍵で検証する。未知の kid は鍵を取り直す（get_signing_keys の最小間隔内なら取り直さない）。
+    cryptography が無ければ IdTokenUnsupported（verify_id_token がリモート検証へ回す）。
+    """
+    if ec is None:
+        raise IdTokenUnsupported("cryptography is not installed")
+    kid = header.get("kid", "")
+    jwk = get_signing_keys().get(kid) or get_signing_keys(force=True).get(kid)
+    if not jwk or jwk.get("kty") != "EC":
+        raise IdTokenUnsupported(f"unknown kid: {kid}")
+    if len(sig) != 64:
+        raise IdTokenError("bad signature length")
+
+    pub = ec.EllipticCurvePublicNumbers(
+        int.from_bytes(_b64url_decode(jwk["x"]), "big"),
+        int.from_bytes(_b64url_decode(jwk["y"]), "big"),
+        ec.SECP256R1(),
+    ).public_key()
+    der = encode_dss_signature(int.from_bytes(sig[:32], "big"), int.from_bytes(sig[32:], "big"))
+    try:
+        pub.verify(der, signing_input, ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature:
+        raise IdTokenError("bad signature")
+
+
+_VERIFIERS = {
+    "HS256": _verify_hs256,
+    "ES256": _verify_es256,
+}
+
+
+def _check_claims(claims: dict, *, nonce: str | None) -> None:
+    channel_id = str(getattr(settings, "MINIAPP_CHANNEL_ID", "") or "")
+    issuer = getattr(settings, "LINE_IDTOKEN_ISSUER", "") or DEFAULT_ISSUER
+    leeway = int(getattr(settings, "LINE_IDTOKEN_LEEWAY", 30))
+    now = time.time()
+
+    aud = claims.get("aud")
+    auds = aud if isinstance(aud, list) else [aud]
+    if not channel_id or channel_id not in [str(a) for a in auds]:
+        raise IdTokenError("aud mismatch")
+    if claims.get("iss") != issuer:
+        raise IdTokenError("iss mismatch")
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or now > exp + leeway:
+        raise IdTokenError("expired")
+    iat = claims.get("iat")
+    if isinstance(iat, (int, float)) and iat > now + leeway:
+        raise IdTokenError("issued in the future")
+    if nonce is not None and claims.get("nonce") != nonce:
+        raise IdTokenError("nonce mismatch")
+    if not claims.get("sub"):
+        raise IdTokenError("no sub")
+
+
+def verify_locally(id_token: str, *, nonce: str | None = None) -> dict:
+    """
+    IDトークンをネットワークアクセスなしで検証し、claims を返す。
+    - 署名（HS256/ES256）、aud=MINIAPP_CHANNEL_ID、iss、exp、nonce（指定時）を確認
+    - 検証不能な場合は IdTokenUnsupported、不正な場合は IdTokenError
+    """
+    try:
+        h64, p64, s64 = (id_token or "").split(".")
+        header = json.loads(_b64url_decode(h64))
+        claims = json.loads(_b64url_decode(p64))
+        sig = _b64url_decode(s64)
+    except Exception:
+        raise IdTokenError("malformed token")
+
+    verifier = _VERIFIERS.get(header.get("alg"))
+    if verifier is None:
+        raise IdTokenUnsupported(f"unsupported alg: {header.get('alg')}")
+    verifier(f"{h64}.{p64}".encode("ascii"), sig, header)
+    _check_claims(claims, nonce=nonce)
+    return claims
+
+
+def verify_remotely(id_token: str, *, nonce: str | None = None) -> dict:
+    """api.line.me の検証エンドポイントで検証する（フォールバック用）。"""
+    data = {"id_token": id_token, "client_id": getattr(settings, "MINIAPP_CHANNEL_ID", "")}
+    if nonce is not None:
+        data["nonce"] = nonce
+    resp = line_client.request("POST", VERIFY_ENDPOINT, data=data, timeout=(3.05, 10))
+    body = resp.json()
+    if resp.status_code != 200 or not body.get("sub"):
+        logger.warning("verify status=%s body=%s", resp.status_code, body)
+        raise IdTokenError("verify failed")
+    return body
+
+
+def verify_id_token(id_token: str, *, nonce: str | None = None) -> dict:
+    """
+    IDトークン検証の共通入口。OKで claims（sub 等）を返し、NGで IdTokenError。
+    - LINE_IDTOKEN_VERIFY_MODE="remote" なら常に api.line.me で検証
+    - 既定はローカル検証。検証不能時のみ LINE_IDTOKEN_REMOTE_FALLBACK に従いリモートへ
+    """
+    if not id_token:
+        raise IdTokenError("id_token is required")
+    mode = getattr(settings, "LINE_IDTOKEN_VERIFY_MODE", "local")
+    if mode == "remote":
+        return verify_remotely(id_token, nonce=nonce)
+    try:
+        return verify_locally(id_token, nonce=nonce)
+    except IdTokenUnsupported as ex:
+        if not getattr(settings, "LINE_IDTOKEN_REMOTE_FALLBACK", True):
+            raise
+        logger.info("local verify unavailable (%s); falling back to remote", ex)
+        return verify_remotely(id_token, nonce=nonce)
+
+
+# =========================
+# 検証結果キャッシュ
+# =========================
+# LIFF は同じ id_token を数秒おきに複数APIへ送るため、検証済み claims を
+# トークンのダイジェスト単位でトークン自身の exp まで保持する。
+
+_verified = TTLCache(maxsize=int(getattr(settings, "LINE_IDTOKEN_CACHE_SIZE", 4096)))
+
+
+def _token_digest(id_token: str) -> str:
+    return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+
+def verify_id_token_cached(id_token: str, *, nonce: str | None = None) -> dict:
+    """
+    verify_id_token() の前段キャッシュ。ヒット時は検証を省略して claims を返す。
+    - キーは id_token の SHA-256（生トークンは保持しない）
+    - 期限は claims の exp（それ以降はミスとして再検証）
+    """
+    if not id_token:
+        raise IdTokenError("id_token is required")
+    key = _token_digest(id_token)
+    claims = _verified.get(key)
+    if claims is None:
+        claims = verify_id_token(id_token, nonce=nonce)
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            _verified.set(key, claims, expires_at=float(exp))
+        return claims
+    if nonce is not None and claims.get("nonce") != nonce:
+        raise IdTokenError("nonce mismatch")
+    return claims
+
+
+def cache_stats() -> dict:
+    """検証キャッシュの hit/miss 等を返す（監視用）。"""
+    return _verified.stats()
+
+
+def clear_cache() -> None:
+    _verified.clear()
@@ -0,0 +1,154 @@
+# events/line_client.py
+# 役割: LINE への外向きHTTPを1か所に集約する。
+#       keep-alive／コネクションプール付きの requests.Session を全呼び出し（プロフィール、グループ概要、
+#       push、reply、IDトークン検証、JWKS取得）で共有し、エンドポイント別のレイテンシを記録する。
+
+import re, threading, time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from linebot import LineBotApi
+from linebot.http_client import HttpClient, RequestsHttpResponse
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# エンドポイント別レイテンシ
+# =========================
+
+# パス中のID（ユーザー/グループ/ルームID、数値、replyToken等）を {id} に畳んで集計キーを作る
+_ID_SEGMENT = re.compile(r"/(?:[UCR][0-9a-f]{32}|\d+|[0-9a-f]{32,})(?=/|$)", re.I)
+
+
+def endpoint_key(method: str, url: str) -> str:
+    path = re.sub(r"^https?://[^/]+", "", url or "").split("?", 1)[0]
+    return f"{method.upper()} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+class LatencyStats:
+    """エンドポイント別に件数・エラー数・平均/最大/p50/p95（直近N件）を保持する。"""
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def record(self, key: str, seconds: float, *, error: bool = False) -> None:
+        with self._lock:
+            d = self._data.get(key)
+            if d is None:
+                d = self._data[key] = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                                       "recent": deque(maxlen=self.window)}
+            d["count"] += 1
+            d["errors"] += int(error)
+            d["total"] += seconds
+            d["max"] = max(d["max"], seconds)
+            d["recent"].append(seconds)
+
+    def snapshot(self) -> dict:
+        out = {}
+        with self._lock:
+            for key, d in self._data.items():
+                recent = sorted(d["recent"])
+                pick = lambda q: recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+                out[key] = {
+                    "count": d["count"],
+                    "errors": d["errors"],
+                    "avg_ms": round(d["total"] / d["count"] * 1000, 1),
+                    "p50_ms": round(pick(0.50) * 1000, 1),
+                    "p95_ms": round(pick(0.95) * 1000, 1),
+                    "max_ms": round(d["max"] * 1000, 1),
+                }
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+stats = LatencyStats()
+
+
+# =========================
+# 共有セッション
+# =========================
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def default_timeout():
+    """(connect, read) のタイムアウト秒。settings.LINE_HTTP_TIMEOUT で上書き可。"""
+    return tuple(getattr(settings, "LINE_HTTP_TIMEOUT", (3.05, 10)))
+
+
+def get_session() -> requests.Session:
+    """プロセス共有の keep-alive セッション（プールサイズは LINE_HTTP_POOL_SIZE）。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                size = int(getattr(settings, "LINE_HTTP_POOL_SIZE", 20))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size, pool_block=False, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def request(method: str, url: str, *, timeout=None, **kwargs) -> requests.Response:
+    """共有セッションで1リクエスト送り、レイテンシを記録する（SDK外の呼び出し用）。"""
+    key = endpoint_key(method, url)
+    t0 = time.perf_counter()
+    error = True
+    try:
+        resp = get_session().request(method, url, timeout=timeout or default_timeout(), **kwargs)
+        error = resp.status_code >= 400
+        return resp
+    finally:
+        stats.record(key, time.perf_counter() - t0, error=error)
+
+
+class PooledHttpClient(HttpClient):
+    """LineBotApi 用の HttpClient。共有セッションを使い、呼び出し毎のレイテンシを記録する。"""
+
+    def _send(self, method, url, timeout=None, **kwargs):
+        resp = request(method, url, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+        return RequestsHttpResponse(resp)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._send("GET", url, headers=headers, params=params, stream=stream, timeout=timeout)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._send("POST", url, headers=headers, data=data, timeout=timeout)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._send("DELETE", url, headers=headers, data=data, timeout=timeout)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._send("PUT", url, headers=headers, data=data, timeout=timeout)
+
+
+# =========================
+# Messaging API クライアント
+# =========================
+
+_apis = {}
+
+
+def get_line_bot_api(access_token: str) -> LineBotApi:
+    """アクセストークン毎に1つの LineBotApi（共有プール使用）を返す。"""
+    api = _apis.get(access_token)
+    if api is None:
+        with _session_lock:
+            api = _apis.get(access_token)
+            if api is None:
+                api = _apis[access_token] = LineBotApi(access_token, timeout=default_timeout(), http_client=PooledHttpClient)
+    return api
@@ -0,0 +1,109 @@
+# events/management/commands/bench_db_writes.py
+# 役割: DB プロファイルごとの書き込みスループットを比べる負荷試験。
+#       参加登録と同じ形（読み取り → 人数カラムの UPDATE ＋ Participant の INSERT を1トランザクション）を
+#       複数スレッドから並行に流し、合間に一覧の読み取りも混ぜる。
+#       legacy（Django 既定の SQLite）/ tuned（settings の SQLite プロファイル）は一時ファイルで測り、
+#       --include-default で実際の default（PostgreSQL など）も測る。
+
+import shutil, tempfile, threading, time, uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from events.models import Event, Participant
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Command(BaseCommand):
+    help = "DB プロファイル（legacy / tuned / default）ごとに並行書き込みのスループットを測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="並行スレッド数")
+        parser.add_argument("--ops", type=int, default=200, help="スレッドあたりの書き込み回数")
+        parser.add_argument("--reads-per-write", type=int, default=4, help="書き込み1回ごとの一覧読み取り回数")
+        parser.add_argument("--include-default", action="store_true",
+                            help="設定中の default DB も測る（一時イベントを作って最後に削除する）")
+
+    def handle(self, *args, **opts):
+        tmp = Path(tempfile.mkdtemp(prefix="bench-db-"))
+        profiles = {"legacy": {}}
+        default = settings.DATABASES["default"]
+        if default["ENGINE"].endswith("sqlite3"):
+            profiles["tuned"] = default.get("OPTIONS", {})
+        try:
+            for name, options in profiles.items():
+                alias = f"bench_{name}"
+                connections.settings[alias] = connections.configure_settings({"default": default, alias: {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": str(tmp / f"{name}.sqlite3"),
+                    "CONN_MAX_AGE": default.get("CONN_MAX_AGE", 0) if options else 0,
+                    "OPTIONS": options,
+                }})[alias]
+                call_command("migrate", "events", database=alias, verbosity=0)
+                self._report(name, self._run(alias, opts))
+                connections[alias].close()
+            if opts["include_default"]:
+                self._report(f"default({default['ENGINE'].rsplit('.', 1)[-1]})", self._run("default", opts))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _run(self, alias: str, opts) -> dict:
+        event = Event.objects.using(alias).create(name=f"bench-{uuid.uuid4().hex[:8]}", start_time=timezone.now())
+        latencies, errors, reads = [], [0], [0]
+        lock = threading.Lock()
+
+        def worker(t: int):
+            mine, failed, nread = [], 0, 0
+            try:
+                for i in range(opts["ops"]):
+                    t0 = time.perf_counter()
+                    try:
+                        with transaction.atomic(using=alias):
+                            # Webhook の下書き処理や旧 RSVP と同じく「読んでから書く」トランザクション
+                            Event.objects.using(alias).values_list("capacity").get(pk=event.pk)
+                            Event.objects.using(alias).filter(pk=event.pk).update(confirmed_count=F("confirmed_count") + 1)
+                            Participant.objects.using(alias).create(event_id=event.pk, user_id=f"bench-{t}-{i}")
+                        mine.append(time.perf_counter() - t0)
+                    except OperationalError:  # "database is locked" など
+                        failed += 1
+                    for _ in range(opts["reads_per_write"]):
+                        list(Event.objects.using(alias).filter(pk__gte=event.pk).order_by("start_time", "id")
+                             .values("id", "name", "confirmed_count")[:50])
+                        nread += 1
+            finally:
+                connections[alias].close()
+                with lock:
+                    latencies.extend(mine)
+                    errors[0] += failed
+                    reads[0] += nread
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(max(1, opts["threads"]))]
+        started = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        elapsed = time.perf_counter() - started
+
+        Event.objects.using(alias).filter(pk=event.pk).delete()
+        return {
+            "writes": len(latencies), "errors": errors[0], "reads": reads[0], "elapsed": elapsed,
+            "p50_ms": _percentile(latencies, 0.50) * 1000, "p95_ms": _percentile(latencies, 0.95) * 1000,
+        }
+
+    def _report(self, name: str, r: dict) -> None:
+        self.stdout.write(
+            f"{name:18s} writes/s={r['writes'] / r['elapsed']:8.1f} reads/s={r['reads'] / r['elapsed']:8.1f} "
+            f"errors={r['errors']:4d} p50={r['p50_ms']:6.1f}ms p95={r['p95_ms']:6.1f}ms"
+        )
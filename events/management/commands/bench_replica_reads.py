@@ -0,0 +1,101 @@
+# events/management/commands/bench_replica_reads.py
+# 役割: 読み取りレプリカのルーターを使う/使わないで、イベント一覧APIの読み取りスループットを比べる。
+#       読み取りスレッドが /api/events を叩く間、書き込みスレッドが default に参加登録を流し続ける。
+#       SQLite ではレプリカを sync_replica と同じ方法で複製してから測る。
+
+import threading, time, uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from events import rsvp, views
+from events.models import Event
+
+from .bench_db_writes import _percentile
+from .sync_replica import sync_once
+
+
+class Command(BaseCommand):
+    help = "読み取りレプリカ（ルーター有効/無効）ごとのイベント一覧の読み取りスループットを測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8, help="読み取りスレッド数")
+        parser.add_argument("--writers", type=int, default=2, help="書き込みスレッド数")
+        parser.add_argument("--seconds", type=float, default=5.0, help="1回の計測時間（秒）")
+        parser.add_argument("--events", type=int, default=200, help="一覧に並べる一時イベント数")
+
+    def handle(self, *args, **opts):
+        alias = getattr(settings, "DB_READ_REPLICA", "")
+        if not alias:
+            raise CommandError("読み取りレプリカが設定されていません（SQLITE_REPLICA_PATH / POSTGRES_REPLICA_HOST）")
+
+        scope_id = f"bench-{uuid.uuid4().hex[:8]}"
+        now = timezone.now()
+        Event.objects.bulk_create([Event(name=f"bench{i}", start_time=now + timedelta(minutes=i), scope_id=scope_id)
+                                   for i in range(opts["events"])])
+        target = Event.objects.create(name="bench-rsvp", start_time=now, scope_id=f"{scope_id}-w")
+        self._sync(alias)
+        try:
+            with override_settings(DB_READ_REPLICA=""):
+                self._report("primary only", self._run(scope_id, target.pk, opts))
+            self._report(f"router ({alias})", self._run(scope_id, target.pk, opts))
+        finally:
+            Event.objects.filter(scope_id__startswith=scope_id).delete()
+            self._sync(alias)
+
+    def _sync(self, alias: str) -> None:
+        src, dst = settings.DATABASES["default"], settings.DATABASES[alias]
+        if src["ENGINE"].endswith("sqlite3") and dst["ENGINE"].endswith("sqlite3"):
+            connections.close_all()
+            sync_once(str(src["NAME"]), str(dst["NAME"]))
+
+    def _run(self, scope_id: str, target_id: int, opts) -> dict:
+        factory = RequestFactory()
+        stop = threading.Event()
+        lock = threading.Lock()
+        latencies, writes = [], [0]
+
+        def reader():
+            mine = []
+            try:
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    res = views.events_list(factory.get("/api/events", {"scope_id": scope_id, "limit": 100}))
+                    if res.status_code == 200:
+                        mine.append(time.perf_counter() - t0)
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(mine)
+
+        def writer(w: int):
+            n = 0
+            try:
+                while not stop.is_set():
+                    rsvp.join(target_id, f"bench-{uuid.uuid4().hex[:12]}")
+                    n += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    writes[0] += n
+
+        threads = ([threading.Thread(target=reader) for _ in range(opts["readers"])]
+                   + [threading.Thread(target=writer, args=(w,)) for w in range(opts["writers"])])
+        for th in threads:
+            th.start()
+        time.sleep(opts["seconds"])
+        stop.set()
+        for th in threads:
+            th.join()
+        return {"reads": len(latencies), "writes": writes[0], "elapsed": opts["seconds"],
+                "p50_ms": _percentile(latencies, 0.50) * 1000, "p95_ms": _percentile(latencies, 0.95) * 1000}
+
+    def _report(self, name: str, r: dict) -> None:
+        self.stdout.write(
+            f"{name:18s} reads/s={r['reads'] / r['elapsed']:8.1f} p50={r['p50_ms']:6.1f}ms p95={r['p95_ms']:6.1f}ms "
+            f"(writes/s={r['writes'] / r['elapsed']:.1f})"
+        )
@@ -0,0 +1,56 @@
+# events/management/commands/bench_serializers.py
+# 役割: イベント一覧の直列化コストを1行あたりで測る（旧: モデル→getattr→isoformat→json / 新: .values()→encoder）。
+#       DB は使わず、メモリ上の行だけで比較する。
+
+import json, time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events import serializers
+from events.models import Event
+
+
+def _legacy_item(e) -> dict:
+    # 以前の events_list の組み立て方（項目ごとに getattr と型判定）
+    obj = {}
+    for key in serializers.EVENT_FIELDS:
+        v = getattr(e, key, None)
+        if hasattr(v, "isoformat"):
+            v = v.isoformat()
+        elif not isinstance(v, (int, float, bool)) and v is not None:
+            v = str(v)
+        obj[key] = v
+    return obj
+
+
+class Command(BaseCommand):
+    help = "イベント一覧の直列化コスト（1行あたり）を旧実装と比較する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200, help="1応答あたりの行数")
+        parser.add_argument("--repeat", type=int, default=200, help="繰り返し回数")
+
+    def handle(self, *args, **opts):
+        rows, repeat = max(1, opts["rows"]), max(1, opts["repeat"])
+        now = timezone.now()
+        events = [Event(id=i, name=f"イベント{i}", start_time=now + timedelta(hours=i), end_time=now + timedelta(hours=i + 2),
+                        capacity=10, created_by="U" + "0" * 32, scope_id="C" + "0" * 32,
+                        confirmed_count=i % 10, waitlist_count=i % 3) for i in range(rows)]
+        values = [serializers.event_item(e) for e in events]  # .values() と同じ形
+
+        def legacy():
+            return json.dumps({"ok": True, "items": [_legacy_item(e) for e in events]}).encode("utf-8")
+
+        def current():
+            return serializers.dumps({"ok": True, "items": values})
+
+        for label, fn in (("legacy", legacy), ("current", current)):
+            fn()  # ウォームアップ
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                size = len(fn())
+            per_row_us = (time.perf_counter() - t0) / (repeat * rows) * 1e6
+            self.stdout.write(f"{label:8s} {per_row_us:7.2f} us/row  ({size} bytes/response)")
+        self.stdout.write(f"encoder: {serializers.encoder_name()}")
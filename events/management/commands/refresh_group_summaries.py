@@ -0,0 +1,18 @@
+# events/management/commands/refresh_group_summaries.py
+# 役割: 参加中グループの名前/アイコン（get_group_summary）を並列数を抑えて一括で取り直す。
+
+from django.core.management.base import BaseCommand
+
+from events import group_summary
+
+
+class Command(BaseCommand):
+    help = "参加中グループの名前/アイコンを一括更新する（既定は期限切れのみ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="LINE API への同時リクエスト数")
+        parser.add_argument("--force", action="store_true", help="期限内のグループも取り直す")
+
+    def handle(self, *args, **opts):
+        result = group_summary.refresh_all(concurrency=opts["concurrency"], force=opts["force"])
+        self.stdout.write(f"group summaries: {result}")
@@ -0,0 +1,25 @@
+# events/management/commands/repair_event_counts.py
+# 役割: Event.confirmed_count / waitlist_count を Participant から作り直す（管理画面での手修正後など）。
+
+from django.core.management.base import BaseCommand
+
+from events import rsvp
+
+
+class Command(BaseCommand):
+    help = "イベントの参加/ウェイトリスト人数カラムを Participant から再集計する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event-id", type=int, action="append", dest="event_ids", help="対象イベント（複数可、既定は全件）")
+        parser.add_argument("--dry-run", action="store_true", help="ずれているイベントを表示するだけ")
+
+    def handle(self, *args, **opts):
+        drifted = list(rsvp.drifted(opts["event_ids"])
+                       .values_list("id", "confirmed_count", "actual_confirmed", "waitlist_count", "actual_waitlist"))
+        for eid, c, ac, w, aw in drifted:
+            self.stdout.write(f"event {eid}: confirmed {c} -> {ac}, waitlist {w} -> {aw}")
+        if opts["dry_run"]:
+            self.stdout.write(f"drifted: {len(drifted)}")
+            return
+        n = rsvp.recount(opts["event_ids"])
+        self.stdout.write(f"recounted: {n} (drifted: {len(drifted)})")
@@ -0,0 +1,42 @@
+# events/management/commands/run_push_dispatcher.py
+# 役割: PushOutbox を送信するディスパッチャを起動する（レート制限・再試行・宛先ごとのまとめ送信）。
+
+import os, socket, threading
+
+from django.core.management.base import BaseCommand
+
+from events import push_outbox
+
+
+class Command(BaseCommand):
+    help = "push通知アウトボックスを送信し、未送信件数/遅延を定期的に出力する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=200, help="1巡で見る未送信行数")
+        parser.add_argument("--rate", type=float, default=None, help="送信レート（push/秒、既定は LINE_PUSH_RATE）")
+        parser.add_argument("--idle-sleep", type=float, default=1.0, help="送るものが無いときの待機秒")
+        parser.add_argument("--stats-interval", type=float, default=30.0, help="統計出力の間隔（秒）")
+        parser.add_argument("--prune-after", type=int, default=86400, help="送信済み行を削除するまでの秒数")
+        parser.add_argument("--once", action="store_true", help="送るものが無くなったら終了する")
+
+    def handle(self, *args, **opts):
+        bucket = push_outbox.TokenBucket(opts["rate"]) if opts["rate"] else push_outbox.default_bucket()
+        stop = threading.Event()
+        t = threading.Thread(
+            target=push_outbox.run_dispatcher,
+            name="push-dispatcher",
+            kwargs=dict(worker_id=f"{socket.gethostname()}:{os.getpid()}", limit=opts["limit"],
+                        idle_sleep=opts["idle_sleep"], stop=stop, once=opts["once"], bucket=bucket),
+            daemon=True,
+        )
+        t.start()
+
+        try:
+            while t.is_alive():
+                t.join(timeout=opts["stats_interval"])
+                push_outbox.prune_sent(opts["prune_after"])
+                self.stdout.write(f"push outbox: {push_outbox.outbox_stats()}")
+        except KeyboardInterrupt:
+            stop.set()
+            t.join()
+        self.stdout.write(f"push outbox: {push_outbox.outbox_stats()}")
@@ -0,0 +1,39 @@
+# events/management/commands/run_rsvp_admitter.py
+# 役割: 先着受付モードの申込キュー（RsvpRequest）を受付順にまとめて確定する、単一の書き手を起動する。
+
+import threading
+
+from django.core.management.base import BaseCommand
+
+from events import admission
+
+
+class Command(BaseCommand):
+    help = "先着受付モードの参加申込をまとめて確定し、未確定件数/遅延を定期的に出力する（1プロセスだけ起動すること）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=None, help="1回の確定でまとめる申込数（既定は LINE_RSVP_ADMIT_BATCH）")
+        parser.add_argument("--idle-sleep", type=float, default=0.2, help="確定するものが無いときの待機秒")
+        parser.add_argument("--stats-interval", type=float, default=30.0, help="統計出力の間隔（秒）")
+        parser.add_argument("--prune-after", type=int, default=7 * 86400, help="確定済みの申込記録を削除するまでの秒数")
+        parser.add_argument("--once", action="store_true", help="確定するものが無くなったら終了する")
+
+    def handle(self, *args, **opts):
+        stop = threading.Event()
+        t = threading.Thread(
+            target=admission.run_admitter,
+            name="rsvp-admitter",
+            kwargs=dict(limit=opts["batch"], idle_sleep=opts["idle_sleep"], stop=stop, once=opts["once"]),
+            daemon=True,
+        )
+        t.start()
+
+        try:
+            while t.is_alive():
+                t.join(timeout=opts["stats_interval"])
+                admission.prune_processed(opts["prune_after"])
+                self.stdout.write(f"rsvp admission: {admission.queue_stats()}")
+        except KeyboardInterrupt:
+            stop.set()
+            t.join()
+        self.stdout.write(f"rsvp admission: {admission.queue_stats()}")
@@ -0,0 +1,53 @@
+# events/management/commands/run_webhook_workers.py
+# 役割: WebhookInbox を吸い出すワーカー群を起動する（LINE_WEBHOOK_ASYNC=True 用）。
+
+import os, socket, threading
+
+from django.core.management.base import BaseCommand
+
+from events import drafts, webhook_dedup, webhook_queue
+
+
+class Command(BaseCommand):
+    help = "Webhook受付キューを複数スレッドで処理し、キュー深さ/遅延を定期的に出力する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="ワーカースレッド数")
+        parser.add_argument("--batch", type=int, default=50, help="1回の取り出しで見る未処理行数")
+        parser.add_argument("--idle-sleep", type=float, default=0.5, help="キューが空のときの待機秒")
+        parser.add_argument("--stats-interval", type=float, default=30.0, help="統計出力の間隔（秒）")
+        parser.add_argument("--prune-after", type=int, default=86400, help="処理済み行を削除するまでの秒数")
+        parser.add_argument("--once", action="store_true", help="キューが空になったら終了する")
+
+    def handle(self, *args, **opts):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=webhook_queue.run_worker,
+                name=f"webhook-worker-{i}",
+                kwargs=dict(worker_id=f"{prefix}:{i}", batch=opts["batch"], idle_sleep=opts["idle_sleep"],
+                            stop=stop, once=opts["once"]),
+                daemon=True,
+            )
+            for i in range(max(1, opts["workers"]))
+        ]
+        webhook_queue.requeue_stale()
+        for t in threads:
+            t.start()
+
+        try:
+            while any(t.is_alive() for t in threads):
+                for t in threads:
+                    t.join(timeout=opts["stats_interval"] / len(threads))
+                webhook_queue.requeue_stale()
+                webhook_queue.prune_done(opts["prune_after"])
+                webhook_dedup.prune()
+                drafts.sweep_expired()
+                self.stdout.write(f"webhook queue: {webhook_queue.queue_stats()}")
+                self.stdout.write(f"webhook dedup: {webhook_dedup.db_stats()}")
+        except KeyboardInterrupt:
+            stop.set()
+            for t in threads:
+                t.join()
+        self.stdout.write(f"webhook queue: {webhook_queue.queue_stats()}")
@@ -0,0 +1,34 @@
+# events/management/commands/sweep_drafts.py
+# 役割: 放置されたウィザード下書き（EventDraft / EventEditDraft）を一定件数ずつ削除し、残っている件数を出力する。
+#       run_webhook_workers も同じ掃除を定期的に行うので、ワーカーを動かしていない構成で cron などから使う。
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from events import drafts
+
+
+class Command(BaseCommand):
+    help = "最後の操作から一定時間たった下書きを小分けに削除し、下書きテーブルの件数を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=None,
+                            help="削除する下書きの経過秒数（既定 DRAFT_EXPIRE_SECONDS）")
+        parser.add_argument("--chunk", type=int, default=500, help="1回の DELETE で消す最大件数")
+        parser.add_argument("--pause", type=float, default=0.0, help="DELETE の間に空ける秒数（ロックを譲る）")
+        parser.add_argument("--interval", type=float, default=0.0, help="繰り返す間隔（秒、0 で1回だけ）")
+        parser.add_argument("--dry-run", action="store_true", help="件数を表示するだけ")
+
+    def handle(self, *args, **opts):
+        try:
+            while True:
+                if not opts["dry_run"]:
+                    swept = drafts.sweep_expired(opts["older_than"], chunk=opts["chunk"], pause=opts["pause"])
+                    self.stdout.write(f"swept: {swept}")
+                self.stdout.write(f"drafts: {drafts.table_stats(opts['older_than'])}")
+                if opts["interval"] <= 0:
+                    break
+                time.sleep(opts["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,48 @@
+# events/management/commands/sync_replica.py
+# 役割: SQLite の読み取りレプリカ（SQLITE_REPLICA_PATH）を default から複製する（ローカル検証用）。
+#       sqlite3 のオンラインバックアップAPIでページ単位に写すので、書き込み中の default からでも整合した複製になる。
+#       PostgreSQL ではストリーミングレプリケーションを使うこと。
+
+import sqlite3, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def sync_once(src_path: str, dst_path: str, *, pages: int = 1024) -> float:
+    """src を dst に丸ごと写す。戻り値は所要秒。"""
+    t0 = time.perf_counter()
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst, pages=pages)
+    finally:
+        dst.close()
+        src.close()
+    return time.perf_counter() - t0
+
+
+class Command(BaseCommand):
+    help = "SQLite の default を読み取りレプリカへ複製する（--interval で定期実行）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0.0, help="繰り返す間隔（秒、0 で1回だけ）")
+        parser.add_argument("--pages", type=int, default=1024, help="1ステップで写すページ数")
+
+    def handle(self, *args, **opts):
+        alias = getattr(settings, "DB_READ_REPLICA", "")
+        if not alias:
+            raise CommandError("読み取りレプリカが設定されていません（SQLITE_REPLICA_PATH）")
+        src, dst = settings.DATABASES["default"], settings.DATABASES[alias]
+        if not (src["ENGINE"].endswith("sqlite3") and dst["ENGINE"].endswith("sqlite3")):
+            raise CommandError("sync_replica は SQLite 専用です")
+
+        try:
+            while True:
+                elapsed = sync_once(str(src["NAME"]), str(dst["NAME"]), pages=opts["pages"])
+                self.stdout.write(f"replica synced in {elapsed * 1000:.1f}ms")
+                if opts["interval"] <= 0:
+                    break
+                time.sleep(opts["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,121 @@
+# events/membership.py
+# 役割: ユーザーのグループ在籍をローカルに記録し、groups_suggest(only_my) を
+#       KnownGroup × GroupMembership の索引付き結合で答える。
+#       記録が無い/古いグループだけを、時間予算つきで並列にプロフィール確認する。
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import profiles
+from .models import GroupMembership
+from .ttlcache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "LINE_MEMBERSHIP_TTL", 7 * 86400))
+
+
+def _negative_ttl() -> int:
+    return int(getattr(settings, "LINE_MEMBERSHIP_NEGATIVE_TTL", 6 * 3600))
+
+
+def _budget() -> float:
+    return float(getattr(settings, "LINE_MEMBERSHIP_CHECK_BUDGET", 1.5))
+
+
+# 発言のたびに UPSERT しないよう、直近に在籍を記録した組をプロセス内で覚えておく
+_recent = TTLCache(maxsize=10000, ttl=600)
+
+
+# =========================
+# 記録
+# =========================
+
+def _upsert(pairs, *, is_member: bool) -> None:
+    """(scope_id, user_id) の組をまとめて1回の UPSERT で記録する。"""
+    pairs = [p for p in dict.fromkeys(pairs) if p[0] and p[1]]
+    if not pairs:
+        return
+    now = timezone.now()
+    GroupMembership.objects.bulk_create(
+        [GroupMembership(scope_id=s, user_id=u, is_member=is_member, last_verified_at=now) for s, u in pairs],
+        update_conflicts=True,
+        unique_fields=["scope_id", "user_id"],
+        update_fields=["is_member", "last_verified_at"],
+    )
+    for key in pairs:
+        if is_member:
+            _recent.set(key, True)
+        else:
+            _recent.pop(key)
+
+
+def record_many(scope_id: str, user_ids, *, is_member: bool = True) -> None:
+    """同じグループの複数ユーザーの在籍（is_member=False なら非在籍）を記録する。"""
+    _upsert([(scope_id, u) for u in user_ids], is_member=is_member)
+
+
+def record(scope_id: str, user_id: str, *, is_member: bool = True) -> None:
+    record_many(scope_id, [user_id], is_member=is_member)
+
+
+def touch(scope_id: str, user_id: str) -> None:
+    """発言者など「いま在籍している」ことが分かったときに呼ぶ（直近に記録済みなら何もしない）。"""
+    if not scope_id or not user_id or _recent.get((scope_id, user_id)):
+        return
+    record(scope_id, user_id)
+
+
+def forget_scope(scope_id: str) -> None:
+    """Bot がグループを抜けたときに、そのグループの記録を消す。"""
+    GroupMembership.objects.filter(scope_id=scope_id).delete()
+    _recent.pop_matching(lambda key: key[0] == scope_id)  # 他のグループの記録はそのまま
+
+
+# =========================
+# 判定
+# =========================
+
+def annotate_membership(qs, user_id: str):
+    """KnownGroup の QuerySet に、そのユーザーの在籍記録（is_member / last_verified_at）を結合する。"""
+    rows = GroupMembership.objects.filter(scope_id=OuterRef("group_id"), user_id=user_id)
+    return qs.annotate(
+        m_is_member=Subquery(rows.values("is_member")[:1]),
+        m_verified_at=Subquery(rows.values("last_verified_at")[:1]),
+    )
+
+
+def _is_fresh(is_member, verified_at, now) -> bool:
+    if verified_at is None:
+        return False
+    ttl = _ttl() if is_member else _negative_ttl()
+    return verified_at >= now - timedelta(seconds=ttl)
+
+
+def filter_member_groups(groups, user_id: str, *, budget: float | None = None) -> tuple[list, int]:
+    """
+    annotate_membership 済みの KnownGroup 列から、ユーザーが在籍するものだけを元の順で返す。
+    期限内の記録はそのまま使い、それ以外は並列に確認して結果を記録する。
+    戻り値: (在籍グループ, 時間予算内に確認できなかったグループ数)
+    """
+    now = timezone.now()
+    groups = list(groups)
+    unknown = [g for g in groups if not _is_fresh(g.m_is_member, g.m_verified_at, now)]
+    unknown_ids = {g.group_id for g in unknown}
+
+    members = {g.group_id for g in groups if g.m_is_member and g.group_id not in unknown_ids}
+    unchecked = 0
+    if unknown:
+        keys = [(g.group_id, user_id) for g in unknown]
+        found, not_found, pending = profiles.resolve(keys, deadline=_budget() if budget is None else budget)
+        members.update(scope_id for scope_id, _ in found)
+        _upsert(list(found), is_member=True)
+        _upsert(list(not_found), is_member=False)
+        unchecked = len(pending)
+    return [g for g in groups if g.group_id in members], unchecked
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_knowngroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope_id', models.CharField(blank=True, default='', max_length=128)),
+                ('destination', models.CharField(blank=True, default='', max_length=64)),
+                ('payload', models.TextField()),
+                ('request_host', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('pending', '未処理'), ('processing', '処理中'), ('done', '処理済'), ('failed', '失敗（リトライ上限）')], default='pending', max_length=12)),
+                ('attempts', models.IntegerField(default=0)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'scope_id', 'id'], name='inbox_status_scope_idx')],
+            },
+        ),
+    ]
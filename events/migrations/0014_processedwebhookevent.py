@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_webhookinbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('webhook_event_id', models.CharField(max_length=64, unique=True)),
+                ('is_redelivery', models.BooleanField(default=False)),
+                ('received_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_processedwebhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to', models.CharField(max_length=64)),
+                ('message', models.TextField()),
+                ('status', models.CharField(choices=[('pending', '未送信'), ('sending', '送信中'), ('sent', '送信済'), ('failed', '失敗（リトライ上限/恒久エラー）')], default='pending', max_length=8)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('retry_key', models.CharField(blank=True, default='', max_length=36)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='outbox_status_idx')],
+            },
+        ),
+    ]
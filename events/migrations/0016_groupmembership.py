@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0015_pushoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope_id', models.CharField(max_length=64)),
+                ('user_id', models.CharField(max_length=64)),
+                ('is_member', models.BooleanField(default=True)),
+                ('last_verified_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'scope_id'], name='membership_user_scope_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope_id', 'user_id'), name='uniq_membership_scope_user')],
+            },
+        ),
+    ]
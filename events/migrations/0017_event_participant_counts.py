@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Event = apps.get_model('events', 'Event')
+    Participant = apps.get_model('events', 'Participant')
+
+    def count_of(waiting):
+        rows = (Participant.objects.using(db_alias).filter(event=OuterRef('pk'), is_waiting=waiting)
+                .order_by().values('event').annotate(n=Count('id')).values('n'))
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Event.objects.using(db_alias).update(confirmed_count=count_of(False), waitlist_count=count_of(True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0016_groupmembership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='confirmed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='waitlist_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:15
+
+from django.db import migrations
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_created_by(apps, schema_editor):
+    """1:1 で作られた旧イベント（created_by 未設定・scope_id がユーザーID）の作成者を scope_id で埋める。"""
+    Event = apps.get_model('events', 'Event')
+    (Event.objects.using(schema_editor.connection.alias)
+     .filter(Q(created_by__isnull=True) | Q(created_by=""), scope_id__startswith="U")
+     .update(created_by=F("scope_id")))
+
+
+def dedupe_participants(apps, schema_editor):
+    """
+    (event, user_id) の重複行を1行にまとめる（参加確定の行を優先、同順位は古い方を残す）。
+    まとめたイベントは人数カラムを数え直す。
+    """
+    db_alias = schema_editor.connection.alias
+    Event = apps.get_model('events', 'Event')
+    Participant = apps.get_model('events', 'Participant')
+
+    dups = (Participant.objects.using(db_alias)
+            .values('event_id', 'user_id')
+            .annotate(n=Count('id'))
+            .filter(n__gt=1))
+    touched = set()
+    for d in dups:
+        rows = list(Participant.objects.using(db_alias)
+                    .filter(event_id=d['event_id'], user_id=d['user_id'])
+                    .order_by('is_waiting', 'joined_at', 'id')
+                    .values_list('id', flat=True))
+        Participant.objects.using(db_alias).filter(id__in=rows[1:]).delete()
+        touched.add(d['event_id'])
+
+    if not touched:
+        return
+
+    def count_of(waiting):
+        rows = (Participant.objects.using(db_alias).filter(event=OuterRef('pk'), is_waiting=waiting)
+                .order_by().values('event').annotate(n=Count('id')).values('n'))
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Event.objects.using(db_alias).filter(pk__in=touched).update(confirmed_count=count_of(False), waitlist_count=count_of(True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0017_event_participant_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_created_by, migrations.RunPython.noop),
+        migrations.RunPython(dedupe_participants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0018_normalize_legacy_rows'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['created_by', 'start_time'], name='event_creator_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['scope_id', 'start_time'], name='event_scope_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='knowngroup',
+            index=models.Index(condition=models.Q(('joined', True)), fields=['-last_seen_at'], name='knowngroup_joined_seen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['event', 'is_waiting', 'joined_at'], name='participant_event_wait_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='participant',
+            constraint=models.UniqueConstraint(fields=('event', 'user_id'), name='uniq_participant_event_user'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0019_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='burst_mode',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='RsvpRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('queued', '受付済（未確定）'), ('joined', '参加確定'), ('waiting', 'ウェイトリスト'), ('already', '登録済み')], default='queued', max_length=8)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rsvp_requests', to='events.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'event', 'id'], name='rsvprequest_status_event_idx')],
+                'constraints': [models.UniqueConstraint(fields=('event', 'user_id'), name='uniq_rsvprequest_event_user')],
+            },
+        ),
+    ]
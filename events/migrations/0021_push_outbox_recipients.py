@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0020_burst_admission_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushoutbox',
+            name='recipients',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
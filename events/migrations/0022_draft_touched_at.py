@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0021_push_outbox_recipients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventdraft',
+            name='touched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='eventeditdraft',
+            name='touched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='eventdraft',
+            index=models.Index(fields=['touched_at'], name='eventdraft_touched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventeditdraft',
+            index=models.Index(fields=['touched_at'], name='eventeditdraft_touched_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0022_draft_touched_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookinbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
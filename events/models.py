@@ -10,6 +10,13 @@ class KnownGroup(models.Model):
     last_seen_at = models.DateTimeField(default=timezone.now)
     last_summary_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # groups_suggest: joined=True を last_seen_at 降順で。
+            # SQLite では joined=True が裸の WHERE "joined" になり (joined, ...) の複合索引を使えないため部分索引にする
+            models.Index(fields=["-last_seen_at"], condition=models.Q(joined=True), name="knowngroup_joined_seen_idx"),
+        ]
+
     def __str__(self):
         return self.name or self.group_id
     
@@ -21,6 +28,21 @@ class Event(models.Model):
     capacity = models.IntegerField(null=True, blank=True)
     created_by = models.CharField(max_length=50, null=True, blank=True) 
     scope_id = models.CharField(max_length=128, null=True, blank=True, db_index=True)
+    # 参加確定/ウェイトリスト人数（Participant の非正規化。events/rsvp.py が F() で更新する）
+    confirmed_count = models.PositiveIntegerField(default=0)
+    waitlist_count = models.PositiveIntegerField(default=0)
+    # 先着受付モード: 参加は RsvpRequest に積み、run_rsvp_admitter がまとめて確定する（events/admission.py）
+    burst_mode = models.BooleanField(default=False)
+
+    # 人数カラムは RSVP 側だけが更新する。イベント内容の保存で古い値を書き戻さないためのフィールド一覧
+    CONTENT_FIELDS = ["name", "start_time", "start_time_has_clock", "end_time", "capacity", "created_by", "scope_id",
+                      "burst_mode"]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_by", "start_time"], name="event_creator_start_idx"),  # events_mine
+            models.Index(fields=["scope_id", "start_time"], name="event_scope_start_idx"),      # events_list
+        ]
 
     def __str__(self):
         return self.name
@@ -31,6 +53,44 @@ class Participant(models.Model):
     joined_at = models.DateTimeField(auto_now_add=True)
     is_waiting = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # 1イベントにつき1ユーザー1行（rsvp_status / 重複参加の判定）
+            models.UniqueConstraint(fields=["event", "user_id"], name="uniq_participant_event_user"),
+        ]
+        indexes = [
+            # 人数集計とウェイトリストの繰り上げ（古い順）
+            models.Index(fields=["event", "is_waiting", "joined_at"], name="participant_event_wait_idx"),
+        ]
+
+
+# ---- 先着受付モードの参加受付キュー ---- #
+class RsvpRequest(models.Model):
+    """
+    burst_mode のイベントへの参加申込1件＝1行。受付順（id 順）に run_rsvp_admitter が
+    まとめて Participant に確定し、結果を status に残す（クライアントは rsvp-status で確認する）。
+    """
+    STATUS_CHOICES = [
+        ("queued",  "受付済（未確定）"),
+        ("joined",  "参加確定"),
+        ("waiting", "ウェイトリスト"),
+        ("already", "登録済み"),
+    ]
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="rsvp_requests")
+    user_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default="queued")
+    requested_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # 連打しても1ユーザー1件
+            models.UniqueConstraint(fields=["event", "user_id"], name="uniq_rsvprequest_event_user"),
+        ]
+        indexes = [
+            # 未確定分をイベントごとに受付順で取り出す
+            models.Index(fields=["status", "event", "id"], name="rsvprequest_status_event_idx"),
+        ]
 
 # ---- イベント作成の進行状態を保存する下書き ---- #
 class EventDraft(models.Model):
@@ -64,6 +124,13 @@ class EventDraft(models.Model):
     )
     end_time = models.DateTimeField(null=True, blank=True)
     capacity = models.IntegerField(null=True, blank=True)
+    # 最後に操作した時刻（DB へは書き戻し時に反映）。放置された下書きは drafts.sweep_expired で削除する
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["touched_at"], name="eventdraft_touched_idx"),
+        ]
 
 
 # ---- イベント編集の進行状態を保存する下書き ---- #
@@ -95,3 +162,109 @@ class EventEditDraft(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     end_time_has_clock = models.BooleanField(default=False)
     capacity = models.IntegerField(null=True, blank=True)
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["touched_at"], name="eventeditdraft_touched_idx"),
+        ]
+
+
+# ---- Webhook 受付キュー（非同期処理モード） ---- #
+class WebhookInbox(models.Model):
+    """
+    /callback で受け取ったイベントを1件ずつ保存する受付キュー。
+    callback は署名検証と保存だけで 200 を返し、ワーカーが scope_id 単位で受信順に処理する。
+    """
+    STATUS_CHOICES = [
+        ("pending",    "未処理"),
+        ("processing", "処理中"),
+        ("done",       "処理済"),
+        ("failed",     "失敗（リトライ上限）"),
+    ]
+    scope_id = models.CharField(max_length=128, blank=True, default="")
+    destination = models.CharField(max_length=64, blank=True, default="")
+    payload = models.TextField()  # Webhookイベント1件分のJSON
+    request_host = models.CharField(max_length=255, blank=True, default="")
+
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(default=0)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # 失敗後の再試行はこの時刻以降
+
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "scope_id", "id"], name="inbox_status_scope_idx"),
+        ]
+
+
+# ---- 処理済み Webhook イベント（再送の重複排除） ---- #
+class ProcessedWebhookEvent(models.Model):
+    """
+    受け付けた webhookEventId を記録する。一意制約で再送（isRedelivery）を O(1) で弾く。
+    一定期間を過ぎた行は webhook_dedup.prune() で削除する。
+    """
+    webhook_event_id = models.CharField(max_length=64, unique=True)
+    is_redelivery = models.BooleanField(default=False)
+    received_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+# ---- プッシュ通知の送信待ち（トランザクショナル・アウトボックス） ---- #
+class PushOutbox(models.Model):
+    """
+    push メッセージ1件＝1行。イベント作成/更新と同じトランザクションで積み、
+    run_push_dispatcher がレート制限・再試行・宛先ごとのまとめ送信（最大5件）を行う。
+    """
+    STATUS_CHOICES = [
+        ("pending", "未送信"),
+        ("sending", "送信中"),
+        ("sent",    "送信済"),
+        ("failed",  "失敗（リトライ上限/恒久エラー）"),
+    ]
+    to = models.CharField(max_length=64)
+    message = models.TextField()  # Messaging API のメッセージオブジェクト1件分のJSON
+    # multicast のときの宛先ユーザーIDのJSON配列（to は行ごとに一意の "multicast:..." にして他とまとめない）
+    recipients = models.TextField(blank=True, default="")
+
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # 同じ push の再送に付ける X-Line-Retry-Key（まとめ送信した行で共有する）
+    retry_key = models.CharField(max_length=36, blank=True, default="")
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="outbox_status_idx"),
+        ]
+
+
+# ---- グループ在籍の記録（groups_suggest の only_my 用） ---- #
+class GroupMembership(models.Model):
+    """
+    (scope_id, user_id) の在籍状況を最後に確認した時刻つきで持つ。
+    Webhook（発言者・MemberJoined/MemberLeft）とプロフィール取得の結果から埋め、
+    期限内の行があれば LINE API に問い合わせずに在籍判定する。
+    """
+    scope_id = models.CharField(max_length=64)
+    user_id = models.CharField(max_length=64)
+    is_member = models.BooleanField(default=True)
+    last_verified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope_id", "user_id"], name="uniq_membership_scope_user"),
+        ]
+        indexes = [
+            models.Index(fields=["user_id", "scope_id"], name="membership_user_scope_idx"),
+        ]
@@ -0,0 +1,87 @@
+# events/pagination.py
+# 役割: 一覧APIのキーセット（カーソル）ページング。
+#       並び順のキー（例: (start_time, id)）の最後の値を不透明なカーソルにして返し、
+#       次ページは「そのキーより後」を索引で引く。OFFSET を使わないので各ページは O(ページサイズ)。
+
+import base64, json
+from datetime import date, datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _jsonable(v):
+    return v.isoformat() if isinstance(v, (datetime, date)) else v
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_jsonable(v) for v in values], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, n: int, fields=None) -> list:
+    """
+    カーソルをキー値のリストに戻す。形式不正は InvalidCursor。
+    fields（モデルのフィールド）を渡すと、各値をその型（datetime/int/bool）に変換する。変換できない値も InvalidCursor。
+    """
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + pad))
+    except Exception as ex:
+        raise InvalidCursor("invalid cursor") from ex
+    if not isinstance(values, list) or len(values) != n:
+        raise InvalidCursor("invalid cursor")
+    if fields is not None:
+        try:
+            values = [field.to_python(v) for field, v in zip(fields, values)]
+        except Exception as ex:  # ValidationError / TypeError（dict 等）
+            raise InvalidCursor("invalid cursor") from ex
+        if any(v is None for v in values):
+            raise InvalidCursor("invalid cursor")
+    return values
+
+
+def parse_limit(raw, *, default: int, maximum: int) -> int:
+    """limit パラメータを 1..maximum に丸める（未指定/不正は default）。"""
+    try:
+        n = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(n, maximum))
+
+
+def _after(keys, values, descending: bool) -> Q:
+    """(k0, k1, ...) > (v0, v1, ...) を辞書式に展開した条件（降順なら <）。"""
+    op = "lt" if descending else "gt"
+    cond = Q()
+    for i, key in enumerate(keys):
+        cond |= Q(**dict(zip(keys[:i], values[:i]))) & Q(**{f"{key}__{op}": values[i]})
+    return cond
+
+
+def _key_of(row, keys):
+    if isinstance(row, dict):
+        return [row[k] for k in keys]
+    return [getattr(row, k) for k in keys]
+
+
+def keyset_page(qs, keys, *, cursor: str | None = None, limit: int, descending: bool = False):
+    """
+    qs を keys の順（descending なら逆順）で1ページ分返す。
+    戻り値: (行のリスト, 次ページのカーソル or None)
+    keys の最後は一意なカラム（id）にすること。
+    """
+    keys = list(keys)
+    if cursor:
+        fields = [qs.model._meta.get_field(k) for k in keys]
+        qs = qs.filter(_after(keys, decode_cursor(cursor, len(keys), fields), descending))
+    order = [f"-{k}" if descending else k for k in keys]
+    rows = list(qs.order_by(*order)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_key_of(rows[-1], keys))
+    return rows, next_cursor
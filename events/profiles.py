@@ -0,0 +1,143 @@
+# events/profiles.py
+# 役割: グループ/ルームのメンバープロフィール（表示名・アイコン）のキャッシュと並列取得。
+#       (scope_id, user_id) 単位で TTL 付きLRUに保持し、未キャッシュ分だけを上限付きスレッドプールで
+#       並列に取りに行く。リクエスト毎の締め切りまでに揃わなかった分は部分結果として返す。
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .ttlcache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+class _Failure:
+    """取得失敗の負キャッシュ値（偽として扱う）。not_found=True は 404＝在籍していないことが確定。"""
+    __slots__ = ("not_found",)
+
+    def __init__(self, not_found: bool):
+        self.not_found = not_found
+
+    def __bool__(self):
+        return False
+
+
+_cache = TTLCache(maxsize=int(getattr(settings, "LINE_PROFILE_CACHE_SIZE", 10000)),
+                  ttl=int(getattr(settings, "LINE_PROFILE_CACHE_TTL", 3600)))
+_lock = threading.Lock()
+_inflight = {}  # (scope_id, user_id) -> Future（同時リクエスト間で同じ取得を共有）
+_executor = None
+
+
+def _negative_ttl() -> int:
+    return int(getattr(settings, "LINE_PROFILE_NEGATIVE_TTL", 60))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = int(getattr(settings, "LINE_PROFILE_FETCH_WORKERS", 8))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="member-profile")
+    return _executor
+
+
+def _api():
+    # LineBotApi は views が共有プール付きで保持している
+    from . import views
+    return views.line_bot_api
+
+
+def fetch_profile(scope_id: str, user_id: str, api=None) -> dict:
+    """LINE API で1件取得する（C...: グループ / R...: ルーム）。失敗は例外。"""
+    api = api or _api()
+    if scope_id.startswith("C"):
+        prof = api.get_group_member_profile(scope_id, user_id)
+    else:
+        prof = api.get_room_member_profile(scope_id, user_id)
+    return {
+        "name": getattr(prof, "display_name", None) or getattr(prof, "displayName", None) or "",
+        "pictureUrl": getattr(prof, "picture_url", None) or getattr(prof, "pictureUrl", None) or "",
+    }
+
+
+def _load(key: tuple[str, str], api):
+    """ワーカースレッドで実行。締め切り後に完了してもキャッシュは温まる。"""
+    try:
+        prof = fetch_profile(*key, api=api)
+        _cache.set(key, prof)
+        return prof
+    except Exception as ex:
+        logger.info("member profile failed: scope=%s user=%s %s", key[0], key[1], ex)
+        failure = _Failure(getattr(ex, "status_code", None) == 404)
+        _cache.set(key, failure, ttl=_negative_ttl())
+        return failure
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def remember(scope_id: str, user_id: str, profile: dict) -> None:
+    """他の経路（Webhook等）で得たプロフィールをキャッシュに入れる。"""
+    _cache.set((scope_id, user_id), profile)
+
+
+def resolve(keys, *, deadline: float | None = None, api=None) -> tuple[dict, set, list]:
+    """
+    (scope_id, user_id) の集合をキャッシュ優先で解決し、未キャッシュ分は並列取得する。
+    戻り値: (key -> プロフィール, 404（非在籍確定）の key 集合, 締め切りまでに揃わなかった key のリスト)
+    """
+    if deadline is None:
+        deadline = float(getattr(settings, "LINE_PROFILE_DEADLINE", 2.5))
+    api = api or _api()
+    executor = _get_executor()
+    found, not_found, futures = {}, set(), {}
+
+    def take(key, value):
+        if value:
+            found[key] = value
+        elif getattr(value, "not_found", False):
+            not_found.add(key)
+
+    for key in dict.fromkeys(keys):
+        cached = _cache.get(key)
+        if cached is not None:
+            take(key, cached)
+            continue
+        with _lock:
+            fut = _inflight.get(key)
+            if fut is None:
+                fut = _inflight[key] = executor.submit(_load, key, api)
+        futures[fut] = key
+
+    pending = []
+    if futures:
+        done, not_done = wait(futures, timeout=deadline)
+        for fut in done:
+            take(futures[fut], fut.result())
+        pending = [futures[fut] for fut in not_done]
+    return found, not_found, pending
+
+
+def get_profiles(scope_id: str, user_ids, *, deadline: float | None = None, api=None) -> tuple[dict, list]:
+    """
+    user_id -> {'name', 'pictureUrl'} を返す。
+    戻り値: (取得できたプロフィール, 締め切りまでに揃わなかった user_id のリスト)
+    取得に失敗した（退出済み等）ユーザーは結果に含めず、未完了扱いにもしない。
+    """
+    found, _, pending = resolve([(scope_id, uid) for uid in user_ids], deadline=deadline, api=api)
+    return {key[1]: prof for key, prof in found.items()}, [key[1] for key in pending]
+
+
+def cache_stats() -> dict:
+    out = _cache.stats()
+    with _lock:
+        out["inflight"] = len(_inflight)
+    return out
+
+
+def clear_cache() -> None:
+    _cache.clear()
@@ -0,0 +1,287 @@
+# events/push_outbox.py
+# 役割: push 通知のトランザクショナル・アウトボックス。
+#       リクエスト側は enqueue() で PushOutbox に積むだけ（Event と同じトランザクション）。
+#       ディスパッチャはトークンバケットで送信レートを抑え、失敗は指数バックオフで再試行し、
+#       同じ宛先の通知は最大5件まで1回の push にまとめる。
+
+import json, random, threading, time, uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import line_client
+from .models import PushOutbox
+
+import logging
+logger = logging.getLogger(__name__)
+
+PUSH_ENDPOINT = "https://api.line.me/v2/bot/message/push"
+MULTICAST_ENDPOINT = "https://api.line.me/v2/bot/message/multicast"
+MAX_MESSAGES_PER_PUSH = 5  # Messaging API の上限
+MAX_MULTICAST_RECIPIENTS = 500
+
+
+# =========================
+# 積む側（ビュー）
+# =========================
+
+def enqueue(to: str, message) -> PushOutbox:
+    """
+    push を1件積む。message は SDK の SendMessage か、メッセージオブジェクトの dict。
+    呼び出し側の transaction.atomic() 内で使えば、Event の保存と通知の記録が同時に確定する。
+    """
+    return PushOutbox.objects.create(to=to, message=_dump_message(message))
+
+
+def enqueue_multicast(user_ids, message) -> list[PushOutbox]:
+    """同じメッセージを複数ユーザーへ（multicast、500人ごとに1行）。"""
+    user_ids = list(dict.fromkeys(u for u in user_ids if u))
+    body = _dump_message(message)
+    rows = [
+        PushOutbox(to=f"multicast:{uuid.uuid4().hex}", message=body,
+                   recipients=json.dumps(user_ids[i:i + MAX_MULTICAST_RECIPIENTS], separators=(",", ":")))
+        for i in range(0, len(user_ids), MAX_MULTICAST_RECIPIENTS)
+    ]
+    return PushOutbox.objects.bulk_create(rows)
+
+
+def _dump_message(message) -> str:
+    if hasattr(message, "as_json_dict"):
+        message = message.as_json_dict()
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+# =========================
+# レート制限
+# =========================
+
+class TokenBucket:
+    """rate 件/秒で補充、最大 capacity 件まで溜まるトークンバケット（スレッドセーフ）。"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1.0))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self) -> float:
+        """取れたら 0、取れなければ次のトークンまでの待ち秒数を返す。"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def drain(self) -> None:
+        """429 を受けたときなどに手持ちのトークンを捨てる。"""
+        with self._lock:
+            self._tokens = 0.0
+            self._last = time.monotonic()
+
+
+def default_bucket() -> TokenBucket:
+    rate = float(getattr(settings, "LINE_PUSH_RATE", 10))
+    return TokenBucket(rate, float(getattr(settings, "LINE_PUSH_BURST", rate)))
+
+
+# =========================
+# 送信
+# =========================
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, "LINE_PUSH_LEASE_SECONDS", 120))
+
+
+def _max_attempts() -> int:
+    return int(getattr(settings, "LINE_PUSH_MAX_ATTEMPTS", 8))
+
+
+def backoff_seconds(attempts: int) -> float:
+    """attempts 回失敗した後の待ち秒数（指数バックオフ＋ジッタ、上限 LINE_PUSH_BACKOFF_MAX）。"""
+    base = float(getattr(settings, "LINE_PUSH_BACKOFF_BASE", 2))
+    cap = float(getattr(settings, "LINE_PUSH_BACKOFF_MAX", 600))
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _default_send(to, messages: list[dict], retry_key: str) -> tuple[int, str]:
+    """
+    push API を直接呼ぶ（共有プール経由）。to がリストなら multicast。
+    戻り値は (HTTPステータス, レスポンス本文)。
+    """
+    # アクセストークンは views が .env から解決済みのものを使う
+    from . import views
+    resp = line_client.request(
+        "POST", MULTICAST_ENDPOINT if isinstance(to, list) else PUSH_ENDPOINT,
+        headers={
+            "Authorization": f"Bearer {views._ACCESS_TOKEN}",
+            "Content-Type": "application/json",
+            "X-Line-Retry-Key": retry_key,
+        },
+        data=json.dumps({"to": to, "messages": messages}, ensure_ascii=False).encode("utf-8"),
+    )
+    return resp.status_code, resp.text[:1000]
+
+
+def _is_retryable(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def requeue_stale() -> int:
+    """リース切れの sending 行を pending に戻す（retry_key は保持＝同じ push として再送）。"""
+    limit = timezone.now() - timedelta(seconds=_lease_seconds())
+    return (PushOutbox.objects
+            .filter(status="sending", locked_at__lt=limit)
+            .update(status="pending", locked_by="", locked_at=None))
+
+
+def _plan_batches(limit: int) -> list[tuple[list[int], str]]:
+    """
+    送信単位（行IDのリスト, retry_key）を作る。
+    - 宛先ごとに古い順。先頭行がバックオフ待ちならその宛先は丸ごと見送る（順序を保つ）
+    - 再試行中の行は前回と同じ組（同じ retry_key）のまま送る
+    - 新規は最大5件をまとめて新しい retry_key を振る
+    """
+    now = timezone.now()
+    rows = (PushOutbox.objects
+            .filter(status="pending")
+            .order_by("id")
+            .values_list("id", "to", "retry_key", "next_attempt_at")[:limit])
+    by_to = {}
+    for row in rows:
+        by_to.setdefault(row[1], []).append(row)
+
+    batches = []
+    for group in by_to.values():
+        head_id, _, head_key, head_due = group[0]
+        if head_due > now:
+            continue
+        if head_key:
+            ids = [r[0] for r in group if r[2] == head_key]
+        else:
+            ids = [r[0] for r in group if not r[2]]
+        batches.append((ids[:MAX_MESSAGES_PER_PUSH], head_key or uuid.uuid4().hex))
+    return batches
+
+
+def _claim(ids: list[int], retry_key: str, worker_id: str) -> list[PushOutbox]:
+    (PushOutbox.objects
+     .filter(id__in=ids, status="pending")
+     .update(status="sending", retry_key=retry_key, locked_by=worker_id, locked_at=timezone.now()))
+    return list(PushOutbox.objects
+                .filter(id__in=ids, status="sending", locked_by=worker_id)
+                .order_by("id"))
+
+
+def send_batch(rows: list[PushOutbox], *, send=None, bucket: TokenBucket | None = None) -> bool:
+    """確保済みの行（同じ宛先・同じ retry_key）を1回の push で送り、結果を反映する。"""
+    send = send or _default_send
+    if bucket is not None:
+        bucket.acquire()
+    ids = [r.id for r in rows]
+    to, retry_key = rows[0].to, rows[0].retry_key
+    if rows[0].recipients:
+        to = json.loads(rows[0].recipients)
+    try:
+        status, detail = send(to, [json.loads(r.message) for r in rows], retry_key)
+    except Exception as ex:  # タイムアウト/接続断は再試行
+        status, detail = 0, str(ex)
+
+    # 409 は同じ retry_key の push が受理済み＝送信済み扱い
+    if 200 <= status < 300 or status == 409:
+        PushOutbox.objects.filter(id__in=ids).update(
+            status="sent", sent_at=timezone.now(), locked_by="", locked_at=None, last_error="",
+        )
+        return True
+
+    if status == 429 and bucket is not None:
+        bucket.drain()
+    attempts = max(r.attempts for r in rows) + 1
+    retry = (status == 0 or _is_retryable(status)) and attempts < _max_attempts()
+    logger.warning("push to=%s failed status=%s attempt=%s: %s", rows[0].to, status, attempts, detail)
+    PushOutbox.objects.filter(id__in=ids).update(
+        status="pending" if retry else "failed",
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=backoff_seconds(attempts)),
+        last_error=f"{status}: {detail}"[:1000],
+        locked_by="", locked_at=None,
+    )
+    return False
+
+
+def dispatch_once(worker_id: str, *, limit: int = 200, send=None, bucket: TokenBucket | None = None) -> int:
+    """送信可能な分を1巡送る。戻り値は push 回数（まとめた分は1回）。"""
+    done = 0
+    for ids, retry_key in _plan_batches(limit):
+        rows = _claim(ids, retry_key, worker_id)
+        if not rows:
+            continue
+        send_batch(rows, send=send, bucket=bucket)
+        done += 1
+    return done
+
+
+def run_dispatcher(worker_id: str, *, limit: int = 200, idle_sleep: float = 1.0, stop=None, once: bool = False,
+                   send=None, bucket: TokenBucket | None = None) -> int:
+    """
+    アウトボックスを送り続けるループ。
+    - stop: threading.Event。セットされたら終了
+    - once: 送るものが無くなった時点で終了
+    """
+    bucket = bucket or default_bucket()
+    total = 0
+    while not (stop and stop.is_set()):
+        close_old_connections()
+        requeue_stale()
+        n = dispatch_once(worker_id, limit=limit, send=send, bucket=bucket)
+        total += n
+        if n == 0:
+            if once:
+                break
+            time.sleep(idle_sleep)
+    close_old_connections()
+    return total
+
+
+# =========================
+# 監視・掃除
+# =========================
+
+def outbox_stats() -> dict:
+    """状態別件数と、最古の未送信行の待ち秒数を返す。"""
+    counts = dict(PushOutbox.objects
+                  .exclude(status="sent")
+                  .values_list("status")
+                  .annotate(n=Count("id")))
+    oldest = PushOutbox.objects.filter(status="pending").aggregate(t=Min("created_at"))["t"]
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {
+        "pending": counts.get("pending", 0),
+        "sending": counts.get("sending", 0),
+        "failed": counts.get("failed", 0),
+        "lag_seconds": round(max(lag, 0.0), 3),
+    }
+
+
+def prune_sent(older_than_seconds: int = 86400) -> int:
+    """送信済み行を削除する。"""
+    limit = timezone.now() - timedelta(seconds=older_than_seconds)
+    deleted, _ = PushOutbox.objects.filter(status="sent", sent_at__lt=limit).delete()
+    return deleted
@@ -0,0 +1,163 @@
+# events/rsvp.py
+# 役割: 参加/キャンセル/繰り上げと、Event.confirmed_count / waitlist_count（非正規化した人数）の更新。
+#       定員の判定は「空きがあれば +1」の条件付き UPDATE 1文で行い、読んでから書く隙間を作らない。
+#       重複参加は (event, user_id) の一意制約で弾く。SQLite / PostgreSQL のどちらでも行ロック相当で直列化される。
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Event, Participant
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _field(is_waiting: bool) -> str:
+    return "waitlist_count" if is_waiting else "confirmed_count"
+
+
+def _bump(event_id: int, **deltas) -> int:
+    """人数カラムを F() で加減算する（0 未満にはしない）。更新行数を返す。"""
+    return Event.objects.filter(pk=event_id).update(
+        **{name: Greatest(F(name) + delta, 0) for name, delta in deltas.items()}
+    )
+
+
+def _has_seat() -> Q:
+    return Q(capacity__isnull=True) | Q(confirmed_count__lt=F("capacity"))
+
+
+def _claim_seat(event_id: int) -> bool:
+    """空きがあれば参加確定を1つ確保する（条件付き UPDATE 1文）。"""
+    return Event.objects.filter(_has_seat(), pk=event_id).update(confirmed_count=F("confirmed_count") + 1) == 1
+
+
+def _counts(event_id: int) -> dict:
+    confirmed, capacity = Event.objects.values_list("confirmed_count", "capacity").get(pk=event_id)
+    return {"confirmed_count": confirmed, "capacity": capacity}
+
+
+def lock_event(event_id: int) -> bool:
+    """
+    トランザクションの最初に呼び、イベント行の書き込みロック（SQLite ではDBの書き込みロック）を取る。
+    読んでから書く処理を、他の参加/取り消し/繰り上げと直列化するため。イベントが無ければ False。
+    """
+    return Event.objects.filter(pk=event_id).update(confirmed_count=F("confirmed_count")) == 1
+
+
+def promote_waiters(event_id: int, seats: int | None = None, *, notify: bool = True) -> list[str]:
+    """
+    空席の数だけ、ウェイトリストを joined_at の古い順に参加確定へ繰り上げる（1回の UPDATE）。
+    - seats: 空いた席数（None なら定員までの空きをすべて埋める）。定員を超えては繰り上げない
+    - notify: 繰り上がったユーザーへの通知をまとめて1件（multicast）アウトボックスに積む
+    戻り値は繰り上げた user_id（古い順）。
+    """
+    with transaction.atomic():
+        if not lock_event(event_id):
+            return []
+        name, capacity, confirmed = Event.objects.values_list("name", "capacity", "confirmed_count").get(pk=event_id)
+        free = None if capacity is None else max(capacity - confirmed, 0)
+        limits = [x for x in (free, seats) if x is not None]
+        n = min(limits) if limits else None
+        if n == 0:
+            return []
+        waiters = (Participant.objects
+                   .filter(event_id=event_id, is_waiting=True)
+                   .order_by("joined_at", "id")
+                   .values_list("pk", "user_id"))
+        waiters = list(waiters[:n] if n is not None else waiters)
+        if not waiters:
+            return []
+        Participant.objects.filter(pk__in=[pk for pk, _ in waiters]).update(is_waiting=False)
+        _bump(event_id, confirmed_count=len(waiters), waitlist_count=-len(waiters))
+        promoted = [user_id for _, user_id in waiters]
+        if notify:
+            _notify_promoted(name, promoted)
+    return promoted
+
+
+def _notify_promoted(event_name: str, user_ids: list[str]) -> None:
+    from . import push_outbox, ui
+    try:
+        with transaction.atomic():
+            push_outbox.enqueue_multicast(user_ids, ui.msg("rsvp.promoted", no_qr=True, event_name=event_name))
+    except Exception as ex:
+        # 通知の失敗で繰り上げ自体は巻き戻さない
+        logger.warning("promotion notify failed: %s", ex)
+
+
+def join(event_id: int, user_id: str) -> dict:
+    """
+    参加登録。満員ならウェイトリストへ。既に登録済みなら status='already'。
+    Event が無ければ Event.DoesNotExist。
+    """
+    try:
+        with transaction.atomic():
+            # 最初の文を書き込みにして、以降はこのイベント行（SQLite ではDB）の書き込みロックの下で進める
+            waiting = not _claim_seat(event_id)
+            if waiting and not _bump(event_id, waitlist_count=1):
+                raise Event.DoesNotExist(f"Event {event_id} does not exist")
+            Participant.objects.create(event_id=event_id, user_id=user_id, is_waiting=waiting)
+            counts = _counts(event_id)
+    except IntegrityError:
+        # 一意制約 (event, user_id) に当たった＝登録済み。人数の加算はロールバック済み
+        existed = Participant.objects.filter(event_id=event_id, user_id=user_id).values_list("is_waiting", flat=True).first()
+        if existed is None:
+            raise
+        return {"status": "already", "is_waiting": existed, **_counts(event_id)}
+    return {"status": "waiting" if waiting else "joined", "is_waiting": waiting, **counts}
+
+
+def cancel(event_id: int, user_id: str) -> dict:
+    """
+    参加取り消し。参加確定者が抜けて空きができたら、ウェイトリストの先頭を繰り上げる。
+    Event が無ければ Event.DoesNotExist。
+    """
+    with transaction.atomic():
+        # join / admit_batch と同じく、最初にイベント行のロックを取る（Participant → Event の順で取ると
+        # 並行する参加とデッドロックしうる）
+        if not lock_event(event_id):
+            raise Event.DoesNotExist(f"Event {event_id} does not exist")
+        # 削除できた行数で判定する（同じユーザーの取り消しが並んでも減算は1回だけ）
+        for is_waiting in (False, True):
+            deleted, _ = Participant.objects.filter(event_id=event_id, user_id=user_id, is_waiting=is_waiting).delete()
+            if deleted:
+                break
+        else:
+            return {"status": "not_joined"}
+
+        _bump(event_id, **{_field(is_waiting): -1})
+        promoted = [] if is_waiting else promote_waiters(event_id, 1)
+    return {"status": "canceled", "promoted_user_id": promoted[0] if promoted else None}
+
+
+# =========================
+# 修復
+# =========================
+
+def _count_of(is_waiting: bool):
+    rows = (Participant.objects
+            .filter(event=OuterRef("pk"), is_waiting=is_waiting)
+            .order_by()
+            .values("event")
+            .annotate(n=Count("id"))
+            .values("n"))
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def drifted(event_ids=None):
+    """人数カラムが Participant の実数とずれているイベントの QuerySet（確認用）。"""
+    qs = Event.objects.all()
+    if event_ids:
+        qs = qs.filter(pk__in=event_ids)
+    return (qs.annotate(actual_confirmed=_count_of(False), actual_waitlist=_count_of(True))
+              .exclude(confirmed_count=F("actual_confirmed"), waitlist_count=F("actual_waitlist")))
+
+
+def recount(event_ids=None) -> int:
+    """Participant から人数カラムを作り直す（1回の UPDATE）。戻り値は対象イベント数。"""
+    qs = Event.objects.all()
+    if event_ids:
+        qs = qs.filter(pk__in=event_ids)
+    return qs.update(confirmed_count=_count_of(False), waitlist_count=_count_of(True))
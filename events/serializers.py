@@ -0,0 +1,59 @@
+# events/serializers.py
+# 役割: API応答のイベント表現と JSON エンコードを1か所にまとめる。
+#       一覧は .values() の dict をそのまま、単体はモデルから同じキーで組み立て、
+#       datetime の整形はエンコーダに任せる（orjson があれば C 実装、無ければ標準 json）。
+
+import json
+from operator import attrgetter
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # 任意依存
+    orjson = None
+
+
+# API で返すイベントの項目（一覧・詳細・作成/更新で共通）
+EVENT_FIELDS = (
+    "id", "name", "start_time", "start_time_has_clock", "end_time", "capacity",
+    "created_by", "scope_id", "confirmed_count", "waitlist_count", "burst_mode",
+)
+
+_event_getter = attrgetter(*EVENT_FIELDS)
+
+
+def _default(o):
+    # date / datetime / time（orjson は自前で処理するので標準 json のときだけ呼ばれる）
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    return str(o)
+
+
+if orjson is not None:
+    def dumps(data) -> bytes:
+        return orjson.dumps(data, default=_default)
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(data) -> bytes:
+        return _encoder.encode(data).encode("utf-8")
+
+
+def encoder_name() -> str:
+    return "orjson" if orjson is not None else "json"
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    """JsonResponse の代わり（同じ Content-Type、エンコードだけ速い）。"""
+    return HttpResponse(dumps(data), content_type="application/json", status=status)
+
+
+def event_values(qs):
+    """イベント一覧用: 必要な列だけを dict で読む QuerySet。"""
+    return qs.values(*EVENT_FIELDS)
+
+
+def event_item(e) -> dict:
+    """モデルインスタンス1件を一覧と同じ形の dict にする。"""
+    return dict(zip(EVENT_FIELDS, _event_getter(e)))
@@ -9,6 +9,7 @@
   let scopeId = "";            // groupId or userId（URL or 復元）
   let currentUserId = "";      // IDトークンのsub
   let gItems = [];             // 直近のイベント一覧キャッシュ
+  let gCursor = null;          // 一覧の次ページのカーソル（null なら最後まで表示済み）
   const REL_LOGIN_FLAG = "didForceReloginOnce"; // 再ログイン一度だけ
   let lastValidatedGroupId = "";                 // 直近でOKだった groupId を保持
 
@@ -69,7 +70,8 @@
       endmode: ($all('input[name="endmode"]').find(r => r.checked)?.value || "").trim(),
       end_time: ($("#f-end").value || "").trim(),
       duration: ($("#f-duration").value || "").trim(),
-      capacity: ($("#f-cap").value || "").trim()
+      capacity: ($("#f-cap").value || "").trim(),
+      burst_mode: !!$("#f-burst")?.checked
     };
     sessionStorage.setItem("eventDraft", JSON.stringify(draft));
   };
@@ -88,6 +90,7 @@
       $("#f-end").value = d.end_time || "";
       $("#f-duration").value = d.duration || "";
       $("#f-cap").value = d.capacity || "";
+      if ($("#f-burst")) $("#f-burst").checked = !!d.burst_mode;
       sessionStorage.removeItem("eventDraft");
       showDialog(); // 復帰時にモーダル再表示
       return true;
@@ -183,110 +186,149 @@
     return true;
   };
 
+  // ==============================
+  // 2.5) サーバ発行セッション（id_token は交換時の1回だけ送る）
+  // ==============================
+  let gSession = "";      // 署名付きセッション（Authorization: Bearer）
+  let gSessionExp = 0;    // 有効期限（epoch秒）
+
+  const ensureSession = async (force = false) => {
+    const now = Math.floor(Date.now() / 1000);
+    if (!force && gSession && now < gSessionExp - 30) return gSession;
+    const token = await ensureFreshIdToken();
+    if (!token) return "";
+    const res = await fetch(`/api/auth/session`, {
+      method: "POST", credentials: "same-origin",
+      headers: { "Content-Type": "application/json", "Accept": "application/json" },
+      body: JSON.stringify({ id_token: token }),
+    });
+    const data = await res.json().catch(() => ({}));
+    if (!res.ok || !data.ok || !data.session) return "";
+    gSession = data.session;
+    gSessionExp = now + Number(data.expires_in || 0);
+    return gSession;
+  };
+
+  // セッション付きでAPIを呼ぶ（401なら一度だけセッションを取り直して再送）
+  const authFetch = async (url, { method = "POST", payload } = {}) => {
+    const send = (session) => fetch(url, {
+      method, credentials: "same-origin",
+      headers: {
+        "Content-Type": "application/json", "Accept": "application/json",
+        "Authorization": `Bearer ${session}`,
+      },
+      body: payload === undefined ? undefined : JSON.stringify(payload),
+    });
+    let session = await ensureSession();
+    if (!session) throw new Error("id_token missing");
+    let res = await send(session);
+    if (res.status === 401) {
+      session = await ensureSession(true);
+      if (!session) throw new Error("id_token missing");
+      res = await send(session);
+    }
+    return res;
+  };
+
   // ==============================
   // 3) サーバAPIラッパ
   // ==============================
+  // 一覧は1ページずつ取得し、続きは「もっと見る」で取りに行く（next_cursor）
+  const withCursor = (url, cursor) =>
+    cursor ? `${url}${url.includes("?") ? "&" : "?"}cursor=${encodeURIComponent(cursor)}` : url;
+  // 参加者一覧は全ページを集めて表示する（回数に上限、超えた分は truncated として表示）
+  const MAX_PAGES = 20;
+
   const api = {
-    async fetchEvents() {
-      const url = (scopeId && String(scopeId).trim())
+    async fetchEvents(cursor = null) {
+      const base = (scopeId && String(scopeId).trim())
         ? `/api/events?scope_id=${encodeURIComponent(scopeId)}`
         : `/api/events`;
-      const res = await fetch(url, { credentials: "same-origin", headers: { "Accept": "application/json" } });
+      const res = await fetch(withCursor(base, cursor), { credentials: "same-origin", headers: { "Accept": "application/json" } });
       if (!res.ok) throw new Error(`fetch events failed: ${res.status}`);
-      return await res.json();
+      const data = await res.json();
+      return { ok: true, items: data.items || [], next_cursor: data.next_cursor || null };
     },
-    async fetchMyEvents() {
-      const token = await ensureFreshIdToken();
-      if (!token) { forceReloginOnce(false); throw new Error("id_token missing"); }
-      const res = await fetch(`/api/events/mine`, {
-        method: "POST", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ id_token: token }),
-      });
+    async fetchMyEvents(cursor = null) {
+      const session = await ensureSession();
+      if (!session) { forceReloginOnce(false); throw new Error("id_token missing"); }
+      const res = await authFetch(withCursor(`/api/events/mine`, cursor), { method: "GET" });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data?.reason || `HTTP ${res.status}`);
-      return { items: data.items || [] };
+      return { items: data.items || [], next_cursor: data.next_cursor || null };
     },
     async createEvent(payload) {
-      const res = await fetch(`/api/events`, {
-        method: "POST", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify(payload),
-      });
+      const res = await authFetch(`/api/events`, { method: "POST", payload });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data.reason ? (typeof data.reason === "string" ? data.reason : JSON.stringify(data.reason)) : `HTTP ${res.status}`);
       return data;
     },
     async updateEvent(id, payload) {
-      const res = await fetch(`/api/events/${id}`, {
-        method: "PATCH", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify(payload),
-      });
+      const res = await authFetch(`/api/events/${id}`, { method: "PATCH", payload });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data.reason ? (typeof data.reason === "string" ? data.reason : JSON.stringify(data.reason)) : `HTTP ${res.status}`);
       return data;
     },
-    async deleteEvent(id, idToken) {
-      const res = await fetch(`/api/events/${id}`, {
-        method: "DELETE", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ id_token: idToken }),
-      });
+    async deleteEvent(id) {
+      const res = await authFetch(`/api/events/${id}`, { method: "DELETE" });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data.reason ? (typeof data.reason === "string" ? data.reason : JSON.stringify(data.reason)) : `HTTP ${res.status}`);
       return data;
     },
     async joinEvent(id) {
-      const token = await ensureFreshIdToken();
-      if (!token) { forceReloginOnce(false); throw new Error("id_token missing"); }
-      const res = await fetch(`/api/events/${id}/rsvp`, {
-        method: "POST", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ id_token: token }),
-      });
+      const session = await ensureSession();
+      if (!session) { forceReloginOnce(false); throw new Error("id_token missing"); }
+      const res = await authFetch(`/api/events/${id}/rsvp`, { method: "POST" });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data.reason ? (typeof data.reason === "string" ? data.reason : JSON.stringify(data.reason)) : `HTTP ${res.status}`);
       return data;
     },
     async cancelRsvp(id) {
-      const token = await ensureFreshIdToken();
-      if (!token) throw new Error("id_token missing");
-      const res = await fetch(`/api/events/${id}/rsvp`, {
-        method: "DELETE", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ id_token: token }),
-      });
+      const res = await authFetch(`/api/events/${id}/rsvp`, { method: "DELETE" });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) throw new Error(data.reason ? (typeof data.reason === "string" ? data.reason : JSON.stringify(data.reason)) : `HTTP ${res.status}`);
       return data;
     },
     async fetchRsvpStatus(ids) {
-      const token = await ensureFreshIdToken();
-      if (!token) throw new Error("id_token missing");
-      const res = await fetch(`/api/events/rsvp-status`, {
-        method: "POST", credentials: "same-origin",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ id_token: token, ids }),
-      });
+      const res = await authFetch(`/api/events/rsvp-status`, { method: "POST", payload: { ids } });
       const data = await res.json().catch(() => ({}));
       if (!res.ok || !data.ok) return {};
       return data.statuses || {};
     },
+    // 先着受付モード: 申込（status=queued）が確定するまで rsvp-status をポーリングする
+    async waitAdmission(id, { interval = 1000, timeout = 30000 } = {}) {
+      const until = Date.now() + timeout;
+      while (Date.now() < until) {
+        await new Promise(r => setTimeout(r, interval));
+        const st = (await api.fetchRsvpStatus([id]))[String(id)];
+        if (st && !st.queued) return st;
+      }
+      return null;
+    },
   };
 
   // 参加者一覧（作成者向け）
   const fetchParticipants = async (eventId) => {
-    const token = await ensureFreshIdToken();
-    if (!token) { if (forceReloginOnce(false)) return null; return null; }
-    const res = await fetch(`/api/events/${eventId}/participants`, {
-      method: 'POST', credentials: 'same-origin',
-      headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
-      body: JSON.stringify({ id_token: token })
-    });
-    const data = await res.json().catch(() => ({}));
-    if (!res.ok || !data.ok) throw new Error((data && (data.reason || data.message)) || `HTTP ${res.status}`);
-    return data;
+    const session = await ensureSession();
+    if (!session) { if (forceReloginOnce(false)) return null; return null; }
+    let merged = null;
+    let cursor = null;
+    for (let page = 0; page < MAX_PAGES; page++) {
+      const res = await authFetch(withCursor(`/api/events/${eventId}/participants`, cursor), { method: 'GET' });
+      const data = await res.json().catch(() => ({}));
+      if (!res.ok || !data.ok) throw new Error((data && (data.reason || data.message)) || `HTTP ${res.status}`);
+      if (!merged) {
+        merged = data;
+      } else {
+        merged.participants.push(...(data.participants || []));
+        merged.waitlist.push(...(data.waitlist || []));
+        merged.partial = merged.partial || data.partial;
+      }
+      cursor = data.next_cursor;
+      if (!cursor) break;
+    }
+    if (merged && cursor) merged.truncated = true; // 上限まで取っても続きがある
+    return merged;
   };
 
   // ==============================
@@ -327,14 +369,12 @@
 
 
   async function fetchGroupSuggest(keyword = "") {
-    const token = await ensureFreshIdToken();
+    const session = await ensureSession();
 
-    if (!token) { forceReloginOnce(false); throw new Error("id_token missing"); }
+    if (!session) { forceReloginOnce(false); throw new Error("id_token missing"); }
 
-    const res = await fetch("/api/groups/suggest", {
-      method: "POST",
-      headers: { "Content-Type": "application/json", "Accept": "application/json" },
-      body: JSON.stringify({ id_token: token, q: keyword, limit: 20, only_my: false }),
+    const res = await authFetch("/api/groups/suggest", {
+      method: "POST", payload: { q: keyword, limit: 20, only_my: false },
     });
     const data = await res.json().catch(() => ({}));
     if (!res.ok || !data.ok) return [];
@@ -482,6 +522,7 @@
     $("#f-end").value = item.end_time ? isoToLocalHhmm(item.end_time) : "";
     $("#f-duration").value = "";
     $("#f-cap").value = (item.capacity == null ? "" : String(item.capacity));
+    if ($("#f-burst")) $("#f-burst").checked = !!item.burst_mode;
 
     // 共通コンポーネントで初期化
     await groupShare.resetForEdit((item.scope_id || "").trim());
@@ -493,10 +534,10 @@
 
   const confirmDelete = async (id, name) => {
     if (!window.confirm(`「${name || '（無題）'}」を削除する？`)) return;
-    const token = await ensureFreshIdToken();
-    if (!token) { if (forceReloginOnce(false)) return; return; }
+    const session = await ensureSession();
+    if (!session) { if (forceReloginOnce(false)) return; return; }
     try {
-      await api.deleteEvent(id, token);
+      await api.deleteEvent(id);
       alert("削除したよ");
       await loadAndRender();
     } catch (err) {
@@ -511,10 +552,10 @@
   const validateGroupSelection = async ({ silent = true } = {}) => {
     const typed = ($("#f-group")?.value || "").trim();
     const urlGrp = new URLSearchParams(location.search).get("groupId") || "";
-    const token = await ensureFreshIdToken();
+    const session = await ensureSession();
 
     // トークン欠落/期限切れは「ログイン更新」扱いで早期リターン
-    if (!token) {
+    if (!session) {
       const rn = $("#row-notify"), fn = $("#f-notify"), gp = $("#group-preview");
       if (rn) rn.style.display = "none";
       if (fn) { fn.checked = false; fn.disabled = true; }
@@ -546,10 +587,8 @@
     }
 
     // サーバ検証
-    const res = await fetch(`/api/groups/validate`, {
-      method: "POST", credentials: "same-origin",
-      headers: { "Content-Type": "application/json", "Accept": "application/json" },
-      body: JSON.stringify({ id_token: token, group_id: candidate }),
+    const res = await authFetch(`/api/groups/validate`, {
+      method: "POST", payload: { group_id: candidate },
     });
     const data = await res.json().catch(() => ({}));
 
@@ -612,8 +651,8 @@
     if (!date) { showError("#err-date");  hasError = true; } else { hideError("#err-date"); }
     if (hasError) return;
 
-    const token = await ensureFreshIdToken();
-    if (!token) { if (forceReloginOnce(true)) return; return; }
+    const session = await ensureSession();
+    if (!session) { if (forceReloginOnce(true)) return; return; }
 
     const urlHasGroup = /[?&]groupId=/.test(location.search);
     const { scope_id: inputGroup, notify: notifyChecked } = groupShare.getValue();
@@ -659,9 +698,9 @@
     }
 
     const payload = {
-      id_token: token,
       name, date, start_time, endmode, end_time, duration,
       capacity: capacity ? Number(capacity) : null,
+      burst_mode: !!$("#f-burst")?.checked,
       scope_id: chosenScopeId,
       notify,
     };
@@ -688,81 +727,114 @@
     }
   };
 
+  // 1:1（U〜）は「自分が作成したイベント」
+  const isMyScope = () => !!(scopeId && /^U/.test(scopeId));
+  const fetchEventPage = (cursor) => isMyScope() ? api.fetchMyEvents(cursor) : api.fetchEvents(cursor);
+
+  const renderEventCard = (e, statuses) => {
+    const name = e.name || "（無題）";
+    const range = buildLocalRange(e.start_time, !!e.start_time_has_clock, e.end_time);
+    const cap = (e.capacity == null) ? "定員なし" : `定員: ${e.capacity}`;
+    const isCreator = !!e.created_by && !!currentUserId && (e.created_by === currentUserId);
+
+    const st = statuses[String(e.id)] || { joined: false, is_waiting: false, queued: false };
+    const joined = !!st.joined;
+    const waiting = !!st.is_waiting;
+    const queued = !!st.queued;
+
+    const rsvpButtons = (joined || queued)
+      ? `<button class="btn-outline" data-act="rsvp-cancel" data-id="${e.id}">キャンセル</button>`
+      : `<button class="btn-primary" data-act="rsvp-join" data-id="${e.id}">参加</button>`;
+
+    const _cntRaw = (e.confirmed_count !== undefined && e.confirmed_count !== null) ? Number(e.confirmed_count) : NaN;
+    const memberLabel = Number.isFinite(_cntRaw)
+      ? `参加者 ${_cntRaw}`
+      : "参加者";
+
+    const actionsHtml = isCreator
+      ? `<div class="actions">
+          <button class="btn-secondary" data-act="members" data-id="${e.id}">${memberLabel}</button>
+          <button class="btn-outline" data-act="edit" data-id="${e.id}">編集</button>
+          <button class="btn-outline dangerous" data-act="delete" data-id="${e.id}" data-name="${escapeHtml(name)}">削除</button>
+        </div>
+        <div class="att-box" id="att-${e.id}" hidden>
+          <p class="muted">読み込み中だよ...</p>
+        </div>`
+      : `<div class="actions">${rsvpButtons}</div>`;
+
+    const waitingNote = (joined && waiting) ? `<p class="muted">※ウェイトリスト登録中</p>`
+      : queued ? `<p class="muted">※受付中（順番に確定するよ）</p>` : ``;
+
+    return `
+      <article class="card" data-id="${e.id}">
+        <h3>${escapeHtml(name)}</h3>
+        <p>${escapeHtml(range)}</p>
+        <p>${escapeHtml(cap)}</p>
+        ${waitingNote}
+        ${actionsHtml}
+      </article>`;
+  };
+
+  // 自分の参加状態をまとめて取得してカードを作る
+  const renderEventCards = async (items) => {
+    let statuses = {};
+    try {
+      statuses = await api.fetchRsvpStatus(items.map(x => x.id));
+    } catch { statuses = {}; }
+    return items.map((e) => renderEventCard(e, statuses)).join("");
+  };
+
+  const moreButtonHtml = () => gCursor
+    ? `<div class="actions" id="event-more"><button class="btn-outline" data-act="more">もっと見る</button></div>`
+    : ``;
+
   const loadAndRender = async () => {
     const listEl = $("#event-list");
     listEl.innerHTML = `<p class="muted">読み込み中…</p>`;
     try {
-      // 1:1（U〜）は「自分が作成したイベント」
-      const data = (scopeId && /^U/.test(scopeId))
-        ? await api.fetchMyEvents()
-        : await api.fetchEvents();
-
+      const data = await fetchEventPage(null);
       const items = data?.items || [];
 
       // 1:1（ユーザーIDスコープ）の時に文言を表示
-      const isMyList = !!(scopeId && /^U/.test(scopeId)); 
       if (!items.length) {
-        listEl.innerHTML = isMyList
+        gItems = [];
+        gCursor = null;
+        listEl.innerHTML = isMyScope()
           ? `<p class="muted">作成したイベントはまだないよ</p>`
           : ``;
         return;
       }
       gItems = items;
+      gCursor = data.next_cursor;
 
-      // 自分の参加状態をまとめて取得
-      let statuses = {};
-      try {
-        const ids = items.map(x => x.id);
-        statuses = await api.fetchRsvpStatus(ids);
-      } catch { statuses = {}; }
-
-      listEl.innerHTML = items.map((e) => {
-        const name = e.name || "（無題）";
-        const range = buildLocalRange(e.start_time, !!e.start_time_has_clock, e.end_time);
-        const cap = (e.capacity == null) ? "定員なし" : `定員: ${e.capacity}`;
-        const isCreator = !!e.created_by && !!currentUserId && (e.created_by === currentUserId);
-
-        const st = statuses[String(e.id)] || { joined: false, is_waiting: false };
-        const joined = !!st.joined;
-        const waiting = !!st.is_waiting;
-
-        const rsvpButtons = joined
-          ? `<button class="btn-outline" data-act="rsvp-cancel" data-id="${e.id}">キャンセル</button>`
-          : `<button class="btn-primary" data-act="rsvp-join" data-id="${e.id}">参加</button>`;
-
-        const _cntRaw = (e.confirmed_count !== undefined && e.confirmed_count !== null) ? Number(e.confirmed_count) : NaN;
-        const memberLabel = Number.isFinite(_cntRaw)
-          ? `参加者 ${_cntRaw}`
-          : "参加者";
-
-        const actionsHtml = isCreator
-          ? `<div class="actions">
-              <button class="btn-secondary" data-act="members" data-id="${e.id}">${memberLabel}</button>
-              <button class="btn-outline" data-act="edit" data-id="${e.id}">編集</button>
-              <button class="btn-outline dangerous" data-act="delete" data-id="${e.id}" data-name="${escapeHtml(name)}">削除</button>
-            </div>
-            <div class="att-box" id="att-${e.id}" hidden>
-              <p class="muted">読み込み中だよ...</p>
-            </div>`
-          : `<div class="actions">${rsvpButtons}</div>`;
-
-        const waitingNote = (joined && waiting) ? `<p class="muted">※ウェイトリスト登録中</p>` : ``;
-
-        return `
-          <article class="card" data-id="${e.id}">
-            <h3>${escapeHtml(name)}</h3>
-            <p>${escapeHtml(range)}</p>
-            <p>${escapeHtml(cap)}</p>
-            ${waitingNote}
-            ${actionsHtml}
-          </article>`;
-      }).join("");
+      listEl.innerHTML = (await renderEventCards(items)) + moreButtonHtml();
     } catch (err) {
       console.error(err);
       listEl.innerHTML = `<p class="muted">読み込みに失敗したよ</p>`;
     }
   };
 
+  // 「もっと見る」: 次のページを取得して一覧の末尾に足す
+  const loadMore = async (btn) => {
+    if (!gCursor) return;
+    btn.disabled = true;
+    btn.textContent = "読み込み中…";
+    try {
+      const data = await fetchEventPage(gCursor);
+      const items = data?.items || [];
+      gItems = gItems.concat(items);
+      gCursor = data.next_cursor;
+      const html = await renderEventCards(items);
+      const more = $("#event-more");
+      more.insertAdjacentHTML("beforebegin", html);
+      more.outerHTML = moreButtonHtml();
+    } catch (err) {
+      console.error(err);
+      btn.disabled = false;
+      btn.textContent = "もっと見る（再試行）";
+    }
+  };
+
   // ==============================
   // 5) DOMイベント登録 / 起動
   // ==============================
@@ -806,6 +878,7 @@
       $("#f-end").value = item.end_time ? isoToLocalHhmm(item.end_time) : "";
       $("#f-duration").value = "";
       $("#f-cap").value = (item.capacity == null ? "" : String(item.capacity));
+      if ($("#f-burst")) $("#f-burst").checked = !!item.burst_mode;
 
       // 共有UI：scope_id があればプレビュー表示、なければ候補表示
       showDialog("edit"); // 先に開く
@@ -878,10 +951,18 @@
       const id  = Number(btn.dataset.id);
 
       try {
+        if (act === "more") { await loadMore(btn); return; }
         if (act === "edit") { await openEditDialog(id); return; }
         if (act === "delete") { confirmDelete(id, btn.dataset.name || ""); return; }
         if (act === "rsvp-join") {
-          const res = await api.joinEvent(id);
+          let res = await api.joinEvent(id);
+          if (res.status === "queued") {
+            btn.disabled = true;
+            btn.textContent = `受付中（${res.position ?? "-"}番目）`;
+            const st = await api.waitAdmission(id);
+            if (!st || !st.joined) { alert("受付したよ。確定したら一覧に反映されるね"); await loadAndRender(); return; }
+            res = { status: st.is_waiting ? "waiting" : "joined" };
+          }
           if (res.status === "waiting") alert("ウェイトリストに登録したよ");
           else if (res.status === "already") alert("もう参加登録しているよ");
           else alert("参加登録したよ");
@@ -900,9 +981,7 @@
           if (!box.hidden) { box.hidden = true; return; } // トグル
           box.hidden = false;
           box.innerHTML = `<p class="muted">読み込み中だよ...</p>`;
-          try {
-            const data = await fetchParticipants(id);
-            if (!data) return;
+          const renderMembers = (data) => {
             const capLabel = (data.counts && data.counts.capacity != null) ? `${data.counts.capacity}名` : "定員なし";
             const listHtml = (arr) => (arr?.length
               ? `<ul class="att-grid">${
@@ -927,7 +1006,21 @@
               <div class="att-sec" style="margin-top:8px;">
                 <h4>ウェイトリスト (${data.waitlist.length})</h4>
                 ${listHtml(data.waitlist)}
-              </div>`;
+              </div>
+              ${data.truncated ? `<p class="muted">人数が多いため、先頭の一部だけ表示しているよ</p>` : ``}`;
+          };
+          try {
+            const data = await fetchParticipants(id);
+            if (!data) return;
+            renderMembers(data);
+            // プロフィール取得が締め切りに間に合わなかった分は、少し待って1回だけ取り直す
+            if (data.partial) {
+              setTimeout(async () => {
+                if (box.hidden) return;
+                const again = await fetchParticipants(id).catch(() => null);
+                if (again && !box.hidden) renderMembers(again);
+              }, 1500);
+            }
           } catch (err) {
             const msg = String(err?.message || err || "");
             box.innerHTML = `<p class="error">読み込みに失敗したよ: ${msg}</p>`;
@@ -1,3 +1,1317 @@
-from django.test import TestCase
+import base64, hashlib, hmac, json, time
+from datetime import timedelta
 
-# Create your tests here.
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from events import auth, idtoken, line_client, push_outbox, rsvp, webhook_dedup, webhook_queue
+from events.models import KnownGroup, PushOutbox, WebhookInbox
+from events.ttlcache import TTLCache
+
+
+# ---- テスト用: 代替鍵セット（HS256 / oct 鍵）でIDトークンを発行する ----
+_TEST_KEY = b"test-signing-key"
+_TEST_JWKS = {"keys": [{"kty": "oct", "kid": "test", "alg": "HS256",
+                        "k": base64.urlsafe_b64encode(_TEST_KEY).rstrip(b"=").decode()}]}
+
+
+def _b64(obj) -> str:
+    raw = json.dumps(obj, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def make_id_token(sub="U-test", *, key=_TEST_KEY, **claims) -> str:
+    now = int(time.time())
+    payload = {"iss": "https://access.line.me", "sub": sub, "aud": "1234567890",
+               "iat": now, "exp": now + 3600}
+    payload.update(claims)
+    signing_input = f"{_b64({'alg': 'HS256', 'typ': 'JWT', 'kid': 'test'})}.{_b64(payload)}"
+    sig = hmac.new(key, signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{base64.urlsafe_b64encode(sig).rstrip(b'=').decode()}"
+
+
+@override_settings(
+    MINIAPP_CHANNEL_ID="1234567890",
+    LINE_IDTOKEN_JWKS=json.dumps(_TEST_JWKS),
+    LINE_IDTOKEN_VERIFY_MODE="local",
+    LINE_IDTOKEN_REMOTE_FALLBACK=False,
+)
+class IdTokenVerifyTests(TestCase):
+    def test_valid_token(self):
+        claims = idtoken.verify_id_token(make_id_token(nonce="n1"), nonce="n1")
+        self.assertEqual(claims["sub"], "U-test")
+
+    def test_rejects_bad_signature(self):
+        with self.assertRaises(idtoken.IdTokenError):
+            idtoken.verify_id_token(make_id_token(key=b"other-key"))
+
+    def test_rejects_wrong_audience(self):
+        with self.assertRaises(idtoken.IdTokenError):
+            idtoken.verify_id_token(make_id_token(aud="999"))
+
+    def test_rejects_wrong_issuer(self):
+        with self.assertRaises(idtoken.IdTokenError):
+            idtoken.verify_id_token(make_id_token(iss="https://example.com"))
+
+    def test_rejects_expired(self):
+        with self.assertRaises(idtoken.IdTokenError):
+            idtoken.verify_id_token(make_id_token(exp=int(time.time()) - 3600))
+
+    def test_rejects_nonce_mismatch(self):
+        with self.assertRaises(idtoken.IdTokenError):
+            idtoken.verify_id_token(make_id_token(nonce="n1"), nonce="n2")
+
+    def test_unsupported_alg_without_fallback(self):
+        token = make_id_token()
+        h = _b64({"alg": "RS256", "kid": "test"})
+        with self.assertRaises(idtoken.IdTokenUnsupported):
+            idtoken.verify_id_token(h + token[token.index("."):])
+
+
+def _es256_key():
+    from cryptography.hazmat.primitives.asymmetric import ec
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def _es256_jwk(key, kid: str) -> dict:
+    nums = key.public_key().public_numbers()
+
+    def b64(n):
+        return base64.urlsafe_b64encode(n.to_bytes(32, "big")).rstrip(b"=").decode()
+    return {"kty": "EC", "crv": "P-256", "alg": "ES256", "kid": kid, "x": b64(nums.x), "y": b64(nums.y)}
+
+
+def make_es256_token(key, kid: str, sub="U-test") -> str:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+    now = int(time.time())
+    payload = {"iss": "https://access.line.me", "sub": sub, "aud": "1234567890", "iat": now, "exp": now + 3600}
+    signing_input = f"{_b64({'alg': 'ES256', 'typ': 'JWT', 'kid': kid})}.{_b64(payload)}"
+    r, s = decode_dss_signature(key.sign(signing_input.encode(), ec.ECDSA(hashes.SHA256())))
+    sig = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+    return f"{signing_input}.{base64.urlsafe_b64encode(sig).rstrip(b'=').decode()}"
+
+
+@skipUnless(idtoken.ec is not None, "cryptography is not installed")
+@override_settings(
+    MINIAPP_CHANNEL_ID="1234567890",
+    LINE_IDTOKEN_JWKS="",
+    LINE_IDTOKEN_VERIFY_MODE="local",
+    LINE_IDTOKEN_REMOTE_FALLBACK=False,
+)
+class IdTokenEs256Tests(SimpleTestCase):
+    """LIFF の実トークンと同じ ES256（EC P-256 の JWK）でのローカル検証。"""
+
+    def setUp(self):
+        idtoken.clear_signing_keys()
+        self.addCleanup(idtoken.clear_signing_keys)
+        self.key = _es256_key()
+        self.jwks = {"keys": [_es256_jwk(self.key, "k1")]}
+
+    def test_valid_token(self):
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", return_value=self.jwks):
+            claims = idtoken.verify_id_token(make_es256_token(self.key, "k1"))
+        self.assertEqual(claims["sub"], "U-test")
+
+    def test_rejects_bad_signature(self):
+        token = make_es256_token(_es256_key(), "k1")  # 別の鍵で署名
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", return_value=self.jwks):
+            with self.assertRaises(idtoken.IdTokenError) as cm:
+                idtoken.verify_id_token(token)
+        self.assertNotIsInstance(cm.exception, idtoken.IdTokenUnsupported)
+
+    @override_settings(LINE_IDTOKEN_JWKS_MIN_REFRESH=0)
+    def test_unknown_kid_refreshes_jwks(self):
+        rotated = _es256_key()
+        new_jwks = {"keys": [*self.jwks["keys"], _es256_jwk(rotated, "k2")]}
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", side_effect=[self.jwks, new_jwks]) as fetch:
+            idtoken.get_signing_keys()  # 鍵のローテーション前にキャッシュ済み
+            claims = idtoken.verify_id_token(make_es256_token(rotated, "k2"))
+        self.assertEqual(claims["sub"], "U-test")
+        self.assertEqual(fetch.call_count, 2)
+
+        # 取り直しても見つからない kid はローカルでは検証不能
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", return_value=new_jwks):
+            with self.assertRaises(idtoken.IdTokenUnsupported):
+                idtoken.verify_id_token(make_es256_token(rotated, "k3"))
+
+
+class IdTokenEs256CheckTests(SimpleTestCase):
+    def test_missing_cryptography_is_reported(self):
+        from events.checks import check_idtoken_es256
+        with mock.patch.object(idtoken, "ec", None):
+            with self.settings(LINE_IDTOKEN_VERIFY_MODE="local", LINE_IDTOKEN_REMOTE_FALLBACK=True):
+                self.assertEqual([e.id for e in check_idtoken_es256(None)], ["events.W001"])
+            with self.settings(LINE_IDTOKEN_VERIFY_MODE="local", LINE_IDTOKEN_REMOTE_FALLBACK=False):
+                self.assertEqual([e.id for e in check_idtoken_es256(None)], ["events.E002"])
+            with self.settings(LINE_IDTOKEN_VERIFY_MODE="remote"):
+                self.assertEqual(check_idtoken_es256(None), [])
+
+
+@override_settings(
+    MINIAPP_CHANNEL_ID="1234567890",
+    LINE_IDTOKEN_JWKS=json.dumps(_TEST_JWKS),
+    LINE_IDTOKEN_VERIFY_MODE="local",
+)
+class IdTokenCacheTests(TestCase):
+    def setUp(self):
+        idtoken.clear_cache()
+
+    def test_second_call_is_served_from_cache(self):
+        token = make_id_token()
+        with mock.patch.object(idtoken, "verify_id_token", wraps=idtoken.verify_id_token) as spy:
+            for _ in range(4):
+                self.assertEqual(idtoken.verify_id_token_cached(token)["sub"], "U-test")
+        self.assertEqual(spy.call_count, 1)
+        stats = idtoken.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 1))
+
+    def test_invalid_token_is_not_cached(self):
+        token = make_id_token(key=b"other-key")
+        for _ in range(2):
+            with self.assertRaises(idtoken.IdTokenError):
+                idtoken.verify_id_token_cached(token)
+        self.assertEqual(idtoken.cache_stats()["size"], 0)
+
+
+@override_settings(LINE_IDTOKEN_JWKS="", LINE_IDTOKEN_JWKS_MIN_REFRESH=60)
+class JwksRefreshTests(SimpleTestCase):
+    def setUp(self):
+        idtoken.clear_signing_keys()
+        self.addCleanup(idtoken.clear_signing_keys)
+
+    def test_forced_refresh_is_rate_limited(self):
+        jwks = {"keys": [{"kid": "k1", "kty": "EC"}]}
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", return_value=jwks) as fetch:
+            for _ in range(5):  # 未知の kid が続いても取り直すのは1回
+                self.assertEqual(list(idtoken.get_signing_keys(force=True)), ["k1"])
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_failed_fetch_is_recorded_and_not_retried_immediately(self):
+        with mock.patch.object(idtoken, "_fetch_remote_jwks", side_effect=OSError("down")) as fetch:
+            self.assertEqual(idtoken.get_signing_keys(), {})
+            self.assertEqual(idtoken.get_signing_keys(force=True), {})
+        self.assertEqual(fetch.call_count, 1)
+        stats = idtoken.jwks_stats()
+        self.assertIsNotNone(stats["failed_ago"])
+        self.assertEqual(stats["last_error"], "down")
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        c = TTLCache(maxsize=2)
+        c.set("a", 1); c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual((c.get("a"), c.get("c")), (1, 3))
+        self.assertEqual(c.stats()["evictions"], 1)
+
+    def test_expiry(self):
+        c = TTLCache(maxsize=2)
+        c.set("a", 1, expires_at=time.time() - 1)
+        self.assertIsNone(c.get("a"))
+
+
+@override_settings(
+    MINIAPP_CHANNEL_ID="1234567890",
+    LINE_IDTOKEN_JWKS=json.dumps(_TEST_JWKS),
+    LINE_IDTOKEN_VERIFY_MODE="local",
+    LINE_IDTOKEN_REMOTE_FALLBACK=False,
+)
+class SessionAuthTests(TestCase):
+    def test_session_roundtrip_and_tamper(self):
+        s = auth.issue_session("U-1")
+        self.assertEqual(auth.resolve_session(s), "U-1")
+        self.assertIsNone(auth.resolve_session(s[:-1] + ("A" if s[-1] != "A" else "B")))
+
+    def test_exchange_then_bearer(self):
+        res = self.client.post("/api/auth/session", data=json.dumps({"id_token": make_id_token("U-9")}),
+                               content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+        session = res.json()["session"]
+
+        with mock.patch.object(idtoken, "verify_id_token") as spy:
+            res = self.client.post("/api/events/rsvp-status", data=json.dumps({"ids": [1]}),
+                                   content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {session}")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["statuses"], {"1": {"joined": False, "is_waiting": False}})
+        spy.assert_not_called()
+
+    def test_missing_credentials(self):
+        res = self.client.post("/api/events/rsvp-status", data=json.dumps({"ids": [1]}),
+                               content_type="application/json")
+        self.assertEqual(res.status_code, 401)
+
+
+def _webhook_body(*events) -> str:
+    return json.dumps({"destination": "Ubot", "events": list(events)})
+
+
+def _text_event(scope: str, text: str) -> dict:
+    return {"type": "message", "webhookEventId": f"{scope}-{text}",
+            "source": {"type": "group", "groupId": scope, "userId": "U1"},
+            "message": {"type": "text", "id": "1", "text": text}, "replyToken": "r", "timestamp": 0}
+
+
+class WebhookQueueTests(TestCase):
+    def test_enqueue_splits_events_per_scope(self):
+        n = webhook_queue.enqueue(_webhook_body(_text_event("C1", "a"), _text_event("C2", "b")), host="h")
+        self.assertEqual(n, 2)
+        self.assertEqual(list(WebhookInbox.objects.values_list("scope_id", flat=True).order_by("id")), ["C1", "C2"])
+        self.assertEqual(webhook_queue.queue_stats()["pending"], 2)
+
+    def test_scope_order_is_preserved(self):
+        webhook_queue.enqueue(_webhook_body(*[_text_event("C1", str(i)) for i in range(3)]))
+        first, second = WebhookInbox.objects.order_by("id")[:2]
+        # 先頭が処理中の間、同じ scope の後続は確保できない
+        self.assertTrue(webhook_queue._try_claim(first.id, "C1", "w1"))
+        self.assertFalse(webhook_queue._try_claim(second.id, "C1", "w2"))
+
+        seen = []
+        WebhookInbox.objects.filter(id=first.id).update(status="pending")
+        webhook_queue.drain_once("w1", dispatch=lambda row: seen.append(json.loads(row.payload)["message"]["text"]))
+        self.assertEqual(seen, ["0", "1", "2"])
+        self.assertEqual(webhook_queue.queue_stats()["depth"], 0)
+
+    def test_failed_dispatch_is_retried_then_parked(self):
+        webhook_queue.enqueue(_webhook_body(_text_event("C1", "x")))
+
+        def boom(row):
+            raise RuntimeError("boom")
+        with override_settings(LINE_WEBHOOK_MAX_ATTEMPTS=2):
+            self.assertEqual(webhook_queue.drain_once("w", dispatch=boom), 1)
+            row = WebhookInbox.objects.get()
+            self.assertEqual(row.status, "pending")
+            self.assertGreater(row.next_attempt_at, timezone.now())
+            # バックオフ中は取り出さない
+            self.assertEqual(webhook_queue.drain_once("w", dispatch=boom), 0)
+            WebhookInbox.objects.update(next_attempt_at=timezone.now())
+            webhook_queue.drain_once("w", dispatch=boom)
+        self.assertEqual(WebhookInbox.objects.get().status, "failed")
+
+    def test_busy_scope_does_not_starve_others(self):
+        webhook_queue.enqueue(_webhook_body(*[_text_event("C1", str(i)) for i in range(5)], _text_event("C2", "x")))
+        seen = []
+        webhook_queue.drain_once("w", batch=2, dispatch=lambda row: seen.append(row.scope_id))
+        self.assertEqual(seen, ["C1", "C2"])
+
+    def test_scope_waits_behind_a_head_in_backoff(self):
+        webhook_queue.enqueue(_webhook_body(_text_event("C1", "a"), _text_event("C1", "b"), _text_event("C2", "c")))
+        head = WebhookInbox.objects.order_by("id").first()
+        WebhookInbox.objects.filter(id=head.id).update(next_attempt_at=timezone.now() + timedelta(seconds=60))
+        seen = []
+        webhook_queue.drain_once("w", dispatch=lambda row: seen.append(json.loads(row.payload)["message"]["text"]))
+        self.assertEqual(seen, ["c"])
+
+
+def _sign(body: str) -> str:
+    from events import views
+    return base64.b64encode(hmac.new(views._CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()).decode()
+
+
+class WebhookCallbackTests(TestCase):
+    def setUp(self):
+        webhook_dedup.reset()
+
+    @override_settings(LINE_WEBHOOK_ASYNC=True)
+    def test_async_callback_enqueues_and_worker_dispatches(self):
+        KnownGroup.objects.create(group_id="C1", joined=True)
+        body = _webhook_body({"type": "leave", "webhookEventId": "e1", "timestamp": 0,
+                              "source": {"type": "group", "groupId": "C1"}})
+        res = self.client.post("/callback", data=body, content_type="application/json",
+                               HTTP_X_LINE_SIGNATURE=_sign(body))
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(KnownGroup.objects.get(group_id="C1").joined)  # まだ未処理
+
+        webhook_queue.drain_once("w")
+        self.assertFalse(KnownGroup.objects.get(group_id="C1").joined)
+
+    @override_settings(LINE_WEBHOOK_ASYNC=True)
+    def test_async_callback_rejects_bad_signature(self):
+        res = self.client.post("/callback", data=_webhook_body(), content_type="application/json",
+                               HTTP_X_LINE_SIGNATURE="bad")
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(WebhookInbox.objects.exists())
+
+
+class WebhookDedupTests(TestCase):
+    def setUp(self):
+        webhook_dedup.reset()
+
+    def test_redelivered_event_is_dropped(self):
+        ev = {"type": "leave", "webhookEventId": "e1", "timestamp": 0,
+              "source": {"type": "group", "groupId": "C1"}}
+        body, marked = webhook_dedup.drop_duplicates(_webhook_body(ev))
+        self.assertEqual(marked, ["e1"])
+
+        redelivered = dict(ev, deliveryContext={"isRedelivery": True})
+        body, marked = webhook_dedup.drop_duplicates(_webhook_body(redelivered, dict(ev, webhookEventId="e2")))
+        self.assertEqual([e["webhookEventId"] for e in json.loads(body)["events"]], ["e2"])
+        self.assertEqual(webhook_dedup.stats()["redelivered_duplicates"], 1)
+
+        # プロセス内LRUが消えてもDBの一意制約で弾ける
+        webhook_dedup.reset()
+        _, marked = webhook_dedup.drop_duplicates(_webhook_body(ev))
+        self.assertEqual(marked, [])
+
+    @override_settings(LINE_WEBHOOK_ASYNC=True)
+    def test_callback_enqueues_once(self):
+        body = _webhook_body({"type": "leave", "webhookEventId": "e9", "timestamp": 0,
+                              "source": {"type": "group", "groupId": "C1"}})
+        for _ in range(3):
+            res = self.client.post("/callback", data=body, content_type="application/json",
+                                   HTTP_X_LINE_SIGNATURE=_sign(body))
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(WebhookInbox.objects.count(), 1)
+
+    def test_forget_allows_reprocessing(self):
+        ev = {"type": "leave", "webhookEventId": "e3", "timestamp": 0, "source": {"type": "group", "groupId": "C1"}}
+        _, marked = webhook_dedup.drop_duplicates(_webhook_body(ev))
+        webhook_dedup.forget(marked)
+        _, marked = webhook_dedup.drop_duplicates(_webhook_body(ev))
+        self.assertEqual(marked, ["e3"])
+
+
+class RequestHostContextTests(SimpleTestCase):
+    def test_host_is_scoped_to_context(self):
+        import asyncio
+        from events import utils
+
+        async def worker(host):
+            with utils.request_host_context(host):
+                await asyncio.sleep(0)  # 他タスクに切り替わっても自分の Host が見える
+                return utils.get_request_host()
+
+        async def main():
+            return await asyncio.gather(*(worker(f"h{i}.example") for i in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [f"h{i}.example" for i in range(5)])
+        self.assertEqual(utils.get_request_host(), "")
+
+
+class GroupValidateAsyncTests(TestCase):
+    def test_summary_and_membership(self):
+        from events import views
+        api = mock.Mock()
+        api.get_group_summary.return_value = mock.Mock(group_name="G", picture_url="p")
+        api.get_group_member_profile.side_effect = RuntimeError("not a member")
+        with mock.patch.object(views, "line_bot_api", api):
+            res = self.client.post("/api/groups/validate", data=json.dumps({"group_id": "C1"}),
+                                   content_type="application/json",
+                                   HTTP_AUTHORIZATION=f"Bearer {auth.issue_session('U1')}")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["group"], {"id": "C1", "name": "G", "pictureUrl": "p"})
+        self.assertIs(res.json()["user_in_group"], False)
+
+
+class LineClientTests(SimpleTestCase):
+    def setUp(self):
+        line_client.stats.reset()
+
+    def test_endpoint_key_folds_ids(self):
+        key = line_client.endpoint_key(
+            "get", "https://api.line.me/v2/bot/group/C" + "a" * 32 + "/member/U" + "b" * 32 + "?x=1")
+        self.assertEqual(key, "GET /v2/bot/group/{id}/member/{id}")
+
+    def test_sdk_calls_share_session_and_record_latency(self):
+        from events import views
+        lb, _ = views.get_line_clients()
+        self.assertIs(lb, views.line_bot_api)
+
+        resp = mock.Mock(status_code=200, headers={}, content=b"{}", text="{}")
+        resp.json.return_value = {"groupId": "C1", "groupName": "G"}
+        with mock.patch.object(line_client.get_session(), "request", return_value=resp) as req:
+            lb.get_group_summary("C" + "0" * 32)
+            lb.get_group_summary("C" + "1" * 32, timeout=2)
+        self.assertEqual(req.call_count, 2)
+        self.assertEqual(req.call_args_list[0].kwargs["timeout"], line_client.default_timeout())
+        self.assertEqual(req.call_args.kwargs["timeout"], 2)
+        snap = line_client.stats.snapshot()
+        self.assertEqual(snap["GET /v2/bot/group/{id}/summary"]["count"], 2)
+
+
+class PushOutboxTests(TestCase):
+    def _post_event(self, **extra):
+        body = {"name": "BBQ", "date": "2030-05-01", "scope_id": "C1", "notify": True, **extra}
+        return self.client.post("/api/events", data=json.dumps(body), content_type="application/json",
+                                HTTP_AUTHORIZATION=f"Bearer {auth.issue_session('U1')}")
+
+    def test_create_writes_outbox_row_without_calling_line(self):
+        from events import views
+        with mock.patch.object(views.line_bot_api, "push_message") as push:
+            res = self._post_event()
+        self.assertEqual(res.status_code, 201)
+        push.assert_not_called()
+        row = PushOutbox.objects.get()
+        self.assertEqual((row.to, row.status), ("C1", "pending"))
+        self.assertEqual(json.loads(row.message)["type"], "flex")
+
+    def test_outbox_rolls_back_with_event(self):
+        with mock.patch.object(push_outbox, "enqueue", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self._post_event()
+        from events.models import Event
+        self.assertFalse(Event.objects.exists())
+
+    def test_coalesces_per_recipient_and_retries_with_same_key(self):
+        for i in range(7):
+            push_outbox.enqueue("C1", {"type": "text", "text": f"m{i}"})
+        push_outbox.enqueue("C2", {"type": "text", "text": "other"})
+        calls = []
+
+        def flaky(to, messages, retry_key):
+            calls.append((to, [m["text"] for m in messages], retry_key))
+            return (500, "oops") if len(calls) == 1 else (200, "{}")
+
+        self.assertEqual(push_outbox.dispatch_once("w", send=flaky), 2)
+        self.assertEqual(calls[0][1], ["m0", "m1", "m2", "m3", "m4"])
+        self.assertEqual(calls[1][0], "C2")
+        # 失敗した組はバックオフ中。C1 の後続は順序を守って待つ
+        self.assertEqual(push_outbox.dispatch_once("w", send=flaky), 0)
+
+        PushOutbox.objects.filter(status="pending").update(next_attempt_at=timezone.now())
+        push_outbox.dispatch_once("w", send=flaky)
+        self.assertEqual(calls[2][1:], (["m0", "m1", "m2", "m3", "m4"], calls[0][2]))
+        push_outbox.dispatch_once("w", send=flaky)
+        self.assertEqual(calls[3][1], ["m5", "m6"])
+        self.assertEqual(PushOutbox.objects.filter(status="sent").count(), 8)
+
+    def test_permanent_error_marks_failed(self):
+        push_outbox.enqueue("C1", {"type": "text", "text": "x"})
+        push_outbox.dispatch_once("w", send=lambda *a: (400, "bad request"))
+        self.assertEqual(PushOutbox.objects.get().status, "failed")
+
+    def test_token_bucket_limits_rate(self):
+        bucket = push_outbox.TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertGreater(bucket.try_acquire(), 0.5)
+
+
+class GroupSummaryCacheTests(TestCase):
+    def setUp(self):
+        from events import group_summary
+        self.gs = group_summary
+        self.api = mock.Mock()
+        self.api.get_group_summary.return_value = mock.Mock(group_name="New", picture_url="p2")
+        patches = [
+            mock.patch.object(group_summary, "_api", return_value=self.api),
+            # バックグラウンド実行をテスト内では同期実行にする
+            mock.patch.object(group_summary, "_submit", side_effect=lambda fn, *a: fn(*a)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_fresh_entry_is_served_without_line_call(self):
+        KnownGroup.objects.create(group_id="C1", name="Old", picture_url="p", last_summary_at=timezone.now())
+        res = self.client.get("/liff/?groupId=C1")
+        self.assertEqual(res.status_code, 200)
+        self.api.get_group_summary.assert_not_called()
+
+    def test_stale_entry_is_refreshed_once_per_ttl(self):
+        KnownGroup.objects.create(group_id="C1", name="Old", picture_url="p",
+                                  last_summary_at=timezone.now() - timedelta(days=2))
+        g = KnownGroup.objects.get(group_id="C1")
+        self.gs.ensure_fresh(g)
+        self.gs.ensure_fresh(g)  # 古いインスタンスのままでも DB の確保で2回目は叩かない
+        self.assertEqual(self.api.get_group_summary.call_count, 1)
+        g.refresh_from_db()
+        self.assertEqual((g.name, g.picture_url), ("New", "p2"))
+
+    def test_failure_backs_off_for_retry_interval(self):
+        self.api.get_group_summary.side_effect = RuntimeError("429")
+        KnownGroup.objects.create(group_id="C1")
+        self.assertFalse(self.gs.refresh("C1"))
+        g = KnownGroup.objects.get(group_id="C1")
+        self.assertFalse(self.gs.refresh("C1"))
+        self.assertEqual(self.api.get_group_summary.call_count, 1)
+        self.assertTrue(self.gs.is_stale(g, now=timezone.now() + timedelta(seconds=301)))
+
+    def test_refresh_all_bounded_concurrency(self):
+        for i in range(5):
+            KnownGroup.objects.create(group_id=f"C{i}")
+        KnownGroup.objects.create(group_id="Cx", joined=False)
+        # 並列スレッドからは DB に触らせない（テストDBはトランザクション内）
+        with mock.patch.object(self.gs, "_in_worker", side_effect=lambda fn, *a: fn(*a)), \
+                mock.patch.object(self.gs, "refresh", return_value=True) as refresh:
+            result = self.gs.refresh_all(concurrency=2)
+        self.assertEqual(result, {"targets": 5, "refreshed": 5, "failed_or_skipped": 0})
+        self.assertEqual(sorted(c.args[0] for c in refresh.call_args_list), [f"C{i}" for i in range(5)])
+
+
+class MemberProfileTests(SimpleTestCase):
+    def setUp(self):
+        from events import profiles
+        self.profiles = profiles
+        profiles.clear_cache()
+        self.addCleanup(profiles.clear_cache)
+
+    def test_misses_fetched_in_parallel_then_cached(self):
+        import threading
+        api = mock.Mock()
+        barrier = threading.Barrier(3, timeout=2)
+
+        def prof(scope_id, uid):
+            barrier.wait()  # 3件が同時に走らないと通らない
+            return mock.Mock(spec=["display_name", "picture_url"], display_name=f"n-{uid}", picture_url="")
+        api.get_group_member_profile.side_effect = prof
+
+        got, pending = self.profiles.get_profiles("C1", ["U1", "U2", "U3"], api=api, deadline=2)
+        self.assertEqual(pending, [])
+        self.assertEqual(got["U2"], {"name": "n-U2", "pictureUrl": ""})
+        got2, _ = self.profiles.get_profiles("C1", ["U1", "U2", "U3"], api=api)
+        self.assertEqual(got2, got)
+        self.assertEqual(api.get_group_member_profile.call_count, 3)
+
+    def test_deadline_returns_partial(self):
+        import threading
+        release = threading.Event()
+        self.addCleanup(release.set)
+        api = mock.Mock()
+
+        def prof(scope_id, uid):
+            if uid == "Uslow":
+                release.wait(2)
+            return mock.Mock(display_name=uid, picture_url="")
+        api.get_room_member_profile.side_effect = prof
+
+        got, pending = self.profiles.get_profiles("R1", ["Ufast", "Uslow"], api=api, deadline=0.2)
+        self.assertEqual(set(got), {"Ufast"})
+        self.assertEqual(pending, ["Uslow"])
+
+    def test_failures_are_negatively_cached(self):
+        api = mock.Mock()
+        api.get_group_member_profile.side_effect = RuntimeError("404")
+        for _ in range(2):
+            got, pending = self.profiles.get_profiles("C1", ["Ugone"], api=api)
+            self.assertEqual((got, pending), ({}, []))
+        self.assertEqual(api.get_group_member_profile.call_count, 1)
+
+
+class MembershipTests(TestCase):
+    def setUp(self):
+        from events import membership, profiles
+        self.membership = membership
+        profiles.clear_cache()
+        self.addCleanup(profiles.clear_cache)
+        for gid in ("C1", "C2", "C3"):
+            KnownGroup.objects.create(group_id=gid, name=gid, last_summary_at=timezone.now())
+
+    def _suggest(self, api):
+        from events import profiles
+        with mock.patch.object(profiles, "_api", return_value=api):
+            res = self.client.post("/api/groups/suggest", data=json.dumps({"only_my": True}),
+                                   content_type="application/json",
+                                   HTTP_AUTHORIZATION=f"Bearer {auth.issue_session('U1')}")
+        self.assertEqual(res.status_code, 200)
+        return sorted(i["id"] for i in res.json()["items"])
+
+    def test_fresh_records_answer_without_line_calls(self):
+        self.membership.record_many("C1", ["U1"])
+        self.membership.record_many("C2", ["U1"], is_member=False)
+        self.membership.record_many("C3", ["U1"], is_member=False)
+        api = mock.Mock()
+        self.assertEqual(self._suggest(api), ["C1"])
+        api.get_group_member_profile.assert_not_called()
+
+    def test_misses_are_checked_and_recorded(self):
+        from events.models import GroupMembership
+        self.membership.record_many("C1", ["U1"])
+        api = mock.Mock()
+        not_found = RuntimeError("not found")
+        not_found.status_code = 404
+
+        def prof(gid, uid):
+            if gid == "C3":
+                raise not_found
+            return mock.Mock(spec=["display_name", "picture_url"], display_name="u", picture_url="")
+        api.get_group_member_profile.side_effect = prof
+
+        self.assertEqual(self._suggest(api), ["C1", "C2"])
+        self.assertEqual(api.get_group_member_profile.call_count, 2)
+        self.assertEqual(dict(GroupMembership.objects.filter(user_id="U1").values_list("scope_id", "is_member")),
+                         {"C1": True, "C2": True, "C3": False})
+
+    def test_member_events_update_records(self):
+        from events import views
+        from events.models import GroupMembership
+        src = {"type": "group", "groupId": "C1", "userId": "U9"}
+        views.dispatch_webhook_body(_webhook_body(
+            {"type": "memberJoined", "timestamp": 0, "replyToken": "r", "source": src,
+             "joined": {"members": [{"type": "user", "userId": "U2"}, {"type": "user", "userId": "U3"}]}},
+            {"type": "memberLeft", "timestamp": 0, "source": src,
+             "left": {"members": [{"type": "user", "userId": "U3"}]}},
+        ))
+        self.assertEqual(dict(GroupMembership.objects.values_list("user_id", "is_member")),
+                         {"U2": True, "U3": False})
+
+    def test_forget_scope_keeps_other_groups_recent_entries(self):
+        from events.models import GroupMembership
+        self.membership.record_many("C1", ["U1"])
+        self.membership.record_many("C2", ["U1"])
+        self.membership.forget_scope("C1")
+        self.assertIsNone(self.membership._recent.get(("C1", "U1")))
+        self.assertTrue(self.membership._recent.get(("C2", "U1")))
+        with self.assertNumQueries(0):  # C2 は直近に記録済みのまま
+            self.membership.touch("C2", "U1")
+        self.assertEqual(list(GroupMembership.objects.values_list("scope_id", flat=True)), ["C2"])
+
+
+class EventListQueryCountTests(TestCase):
+    def setUp(self):
+        from events.models import Event, Participant
+        for i in range(12):
+            e = Event.objects.create(name=f"e{i}", start_time=timezone.now() + timedelta(days=i),
+                                     created_by="U1", scope_id="C1", capacity=2)
+            for j in range(i % 4):
+                Participant.objects.create(event=e, user_id=f"U{j}", is_waiting=j >= 2)
+        rsvp.recount()  # 人数カラムを Participant に合わせる
+
+    def test_events_list_is_one_query(self):
+        with self.assertNumQueries(1):
+            res = self.client.get("/api/events?scope_id=C1")
+        items = {i["name"]: i for i in res.json()["items"]}
+        self.assertEqual(len(items), 12)
+        self.assertEqual((items["e3"]["confirmed_count"], items["e3"]["waitlist_count"]), (2, 1))
+        self.assertEqual((items["e4"]["confirmed_count"], items["e4"]["waitlist_count"]), (0, 0))
+
+    def test_events_mine_is_one_query(self):
+        with self.assertNumQueries(1):
+            res = self.client.get("/api/events/mine", HTTP_AUTHORIZATION=f"Bearer {auth.issue_session('U1')}")
+        items = {i["name"]: i for i in res.json()["items"]}
+        self.assertEqual(len(items), 12)
+        self.assertEqual((items["e7"]["confirmed_count"], items["e7"]["waitlist_count"]), (2, 1))
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        from events.models import Event, Participant
+        start = timezone.now()
+        # 同じ開始時刻を混ぜて、id がタイブレークになることも確認する
+        self.events = [Event.objects.create(name=f"e{i}", start_time=start + timedelta(days=i // 2),
+                                            created_by="U1", scope_id="C1") for i in range(7)]
+        for j in range(5):
+            Participant.objects.create(event=self.events[0], user_id=f"U{j}", is_waiting=j % 2 == 1)
+        rsvp.recount()
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {auth.issue_session('U1')}"}
+
+    def _walk(self, url, key="items", **kw):
+        seen, cursor = [], None
+        for _ in range(10):
+            res = self.client.get(url, {"limit": 3, **({"cursor": cursor} if cursor else {})}, **kw)
+            self.assertEqual(res.status_code, 200)
+            data = res.json()
+            seen.append(data)
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        return seen
+
+    def test_events_list_pages_in_start_time_order(self):
+        pages = self._walk("/api/events?scope_id=C1")
+        self.assertEqual([len(p["items"]) for p in pages], [3, 3, 1])
+        names = [i["name"] for p in pages for i in p["items"]]
+        self.assertEqual(names, [e.name for e in self.events])
+
+    def test_events_mine_pages_descending(self):
+        pages = self._walk("/api/events/mine", **self.auth)
+        names = [i["name"] for p in pages for i in p["items"]]
+        self.assertEqual(names, [e.name for e in reversed(self.events)])
+
+    def test_participants_pages_confirmed_then_waitlist(self):
+        from events.models import Event
+        Event.objects.filter(pk=self.events[0].pk).update(scope_id="")
+        pages = self._walk(f"/api/events/{self.events[0].id}/participants", **self.auth)
+        self.assertEqual(len(pages), 2)
+        self.assertEqual([r["user_id"] for p in pages for r in p["participants"]], ["U0", "U2", "U4"])
+        self.assertEqual([r["user_id"] for p in pages for r in p["waitlist"]], ["U1", "U3"])
+        self.assertEqual(pages[-1]["counts"], {"participants": 3, "waitlist": 2, "capacity": None})
+
+    def test_bad_cursor_is_rejected(self):
+        from events import pagination
+        for cursor in ("not-a-cursor", pagination.encode_cursor(["garbage", 1]),
+                       pagination.encode_cursor([{"a": 1}, 1]), pagination.encode_cursor([timezone.now(), "x"])):
+            res = self.client.get("/api/events", {"scope_id": "C1", "cursor": cursor})
+            self.assertEqual(res.status_code, 400, cursor)
+
+
+class SerializerTests(TestCase):
+    def test_list_and_detail_share_one_shape(self):
+        from events import serializers
+        from events.models import Event
+        e = Event.objects.create(name="会", start_time=timezone.now(), created_by="U1", scope_id="C1", capacity=3)
+        listed = self.client.get("/api/events?scope_id=C1").json()["items"][0]
+        detail = self.client.get(f"/api/events/{e.id}").json()["item"]
+        self.assertEqual(listed, detail)
+        self.assertEqual(list(listed), list(serializers.EVENT_FIELDS))
+        self.assertEqual(listed["start_time"], e.start_time.isoformat())
+
+    def test_stdlib_fallback_matches(self):
+        import importlib, sys
+        from events import serializers
+        data = {"t": timezone.now(), "s": "日本語", "n": None}
+        with mock.patch.dict(sys.modules, {"orjson": None}):
+            fallback = importlib.reload(serializers)
+            try:
+                self.assertEqual(fallback.encoder_name(), "json")
+                self.assertEqual(json.loads(fallback.dumps(data)), {**data, "t": data["t"].isoformat()})
+            finally:
+                sys.modules.pop("orjson", None)
+        importlib.reload(serializers)
+
+
+class RsvpCounterTests(TestCase):
+    def setUp(self):
+        from events.models import Event
+        self.e = Event.objects.create(name="e", start_time=timezone.now(), capacity=1, created_by="U0")
+
+    def _rsvp(self, user, method="post"):
+        res = getattr(self.client, method)(f"/api/events/{self.e.id}/rsvp",
+                                           HTTP_AUTHORIZATION=f"Bearer {auth.issue_session(user)}")
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    def _counts(self):
+        self.e.refresh_from_db()
+        return self.e.confirmed_count, self.e.waitlist_count
+
+    def test_join_waitlist_cancel_and_promote(self):
+        self.assertEqual(self._rsvp("U1")["status"], "joined")
+        self.assertEqual(self._rsvp("U2")["status"], "waiting")
+        self.assertEqual(self._rsvp("U3")["status"], "waiting")
+        self.assertEqual(self._rsvp("U2")["status"], "already")
+        self.assertEqual(self._counts(), (1, 2))
+
+        # 待ちの人が抜けても定員は超えない
+        self.assertIsNone(self._rsvp("U3", "delete")["promoted_user_id"])
+        self.assertEqual(self._counts(), (1, 1))
+        self.assertEqual(self._rsvp("U1", "delete")["promoted_user_id"], "U2")
+        self.assertEqual(self._counts(), (1, 0))
+
+    def test_every_write_path_locks_the_event_first(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        rsvp.join(self.e.id, "U1")
+        for fn in (rsvp.join, rsvp.cancel):
+            with CaptureQueriesContext(connection) as ctx:
+                fn(self.e.id, "U2")
+            first = next(q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"])
+            self.assertTrue(first.startswith('UPDATE "events_event"'), (fn.__name__, first))
+
+    def test_patch_does_not_overwrite_counts(self):
+        stale = type(self.e).objects.get(pk=self.e.pk)
+        self._rsvp("U1")
+        stale.name = "renamed"
+        stale.save(update_fields=type(self.e).CONTENT_FIELDS)
+        self.assertEqual(self._counts(), (1, 0))
+
+    def test_repair_command_rebuilds_counts(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from events.models import Participant
+        Participant.objects.create(event=self.e, user_id="U1")
+        Participant.objects.create(event=self.e, user_id="U2", is_waiting=True)
+        out = StringIO()
+        call_command("repair_event_counts", stdout=out)
+        self.assertIn("drifted: 1", out.getvalue())
+        self.assertEqual(self._counts(), (1, 1))
+
+
+class WaitlistPromotionTests(TestCase):
+    def setUp(self):
+        from events.models import Event
+        self.e = Event.objects.create(name="e", start_time=timezone.now(), capacity=1, created_by="U0")
+        for i in range(1, 6):
+            rsvp.join(self.e.id, f"U{i}")
+
+    def _patch(self, **body):
+        return self.client.patch(f"/api/events/{self.e.id}", data=json.dumps(body), content_type="application/json",
+                                 HTTP_AUTHORIZATION=f"Bearer {auth.issue_session('U0')}")
+
+    def _confirmed(self):
+        from events.models import Participant
+        return list(Participant.objects.filter(event=self.e, is_waiting=False)
+                    .order_by("joined_at", "id").values_list("user_id", flat=True))
+
+    def test_raising_capacity_promotes_earliest_waiters_with_one_notification(self):
+        res = self._patch(capacity=3)
+        self.assertEqual(res.status_code, 200)
+        item = res.json()["item"]
+        self.assertEqual((item["confirmed_count"], item["waitlist_count"]), (3, 2))  # 繰り上げ後の人数を返す
+        self.assertEqual(self._confirmed(), ["U1", "U2", "U3"])
+        self.e.refresh_from_db()
+        self.assertEqual((self.e.confirmed_count, self.e.waitlist_count), (3, 2))
+        row = PushOutbox.objects.get()
+        self.assertEqual(json.loads(row.recipients), ["U2", "U3"])
+
+        # 定員を外すと残り全員、送信は multicast
+        self._patch(capacity="")
+        self.assertEqual(len(self._confirmed()), 5)
+        sent = []
+        push_outbox.dispatch_once("w", send=lambda to, messages, key: sent.append(to) or (200, "{}"))
+        self.assertEqual(sorted(sent), [["U2", "U3"], ["U4", "U5"]])
+
+    def test_promotion_is_set_based_and_bounded_by_seats(self):
+        from events.models import Event
+        Event.objects.filter(pk=self.e.pk).update(capacity=10)
+        # セーブポイント2 + ロック/読み取り/待ち行の取得/一括UPDATE/人数更新
+        with self.assertNumQueries(7):
+            self.assertEqual(rsvp.promote_waiters(self.e.id, 2, notify=False), ["U2", "U3"])
+        self.assertEqual(rsvp.promote_waiters(self.e.id, notify=False), ["U4", "U5"])
+        self.assertEqual(rsvp.promote_waiters(self.e.id, notify=False), [])
+        self.assertFalse(rsvp.drifted([self.e.id]).exists())
+
+    def test_edit_wizard_save_promotes(self):
+        from events.handlers import edit_wizard
+        from events.models import EventEditDraft
+        EventEditDraft.objects.create(user_id="U0", event=self.e, capacity=2)
+        edit_wizard.handle_edit_postback("U0", "U0", "edit=save", {})
+        self.assertEqual(self._confirmed(), ["U1", "U2"])
+
+
+class RsvpConcurrencyTests(TransactionTestCase):
+    """別スレッド（別接続）から同時に参加/取り消しを投げても定員を超えないこと。"""
+
+    def _parallel(self, fn, args, workers=16):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connections
+
+        def run(a):
+            try:
+                return fn(*a)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run, args))
+
+    def test_parallel_joins_never_exceed_capacity(self):
+        from events.models import Event, Participant
+        e = Event.objects.create(name="人気", start_time=timezone.now(), capacity=10)
+        users = [f"U{i}" for i in range(200)]
+        # 同じユーザーの二重送信も混ぜる
+        results = self._parallel(rsvp.join, [(e.id, u) for u in users + users[:20]])
+
+        statuses = [r["status"] for r in results]
+        self.assertEqual(statuses.count("joined"), 10)
+        self.assertEqual(statuses.count("waiting"), 190)
+        self.assertEqual(statuses.count("already"), 20)
+        e.refresh_from_db()
+        self.assertEqual((e.confirmed_count, e.waitlist_count), (10, 190))
+        self.assertEqual(Participant.objects.filter(event=e, is_waiting=False).count(), 10)
+        self.assertFalse(rsvp.drifted([e.id]).exists())
+
+        # 参加確定者の取り消しと繰り上げが並んでも、1席に2人は入らない
+        confirmed = list(Participant.objects.filter(event=e, is_waiting=False).values_list("user_id", flat=True))
+        results = self._parallel(rsvp.cancel, [(e.id, u) for u in confirmed * 2])
+        promoted = [r["promoted_user_id"] for r in results if r.get("promoted_user_id")]
+        self.assertEqual(len(promoted), 10)
+        self.assertEqual(len(set(promoted)), 10)
+        self.assertFalse(set(promoted) & set(confirmed))
+        e.refresh_from_db()
+        self.assertEqual((e.confirmed_count, e.waitlist_count), (10, 180))
+        self.assertEqual(Participant.objects.filter(event=e, is_waiting=False).count(), 10)
+        self.assertFalse(rsvp.drifted([e.id]).exists())
+
+
+class BurstAdmissionTests(TestCase):
+    def setUp(self):
+        from events.models import Event
+        self.e = Event.objects.create(name="先着", start_time=timezone.now(), capacity=2, burst_mode=True)
+
+    def _rsvp(self, user, method="post"):
+        return getattr(self.client, method)(f"/api/events/{self.e.id}/rsvp",
+                                            HTTP_AUTHORIZATION=f"Bearer {auth.issue_session(user)}")
+
+    def _status(self, user):
+        res = self.client.post("/api/events/rsvp-status", data=json.dumps({"ids": [self.e.id]}),
+                               content_type="application/json",
+                               HTTP_AUTHORIZATION=f"Bearer {auth.issue_session(user)}")
+        return res.json()["statuses"][str(self.e.id)]
+
+    def test_requests_are_queued_then_admitted_in_order(self):
+        from events import admission
+        from events.models import Participant
+        for i, user in enumerate(["U1", "U2", "U3", "U4"], start=1):
+            res = self._rsvp(user)
+            self.assertEqual(res.status_code, 202)
+            self.assertEqual(res.json()["position"], i)
+        self.assertEqual(self._rsvp("U2").json()["position"], 2)  # 連打しても1件
+        self.assertEqual(self._rsvp("U4", "delete").json()["status"], "canceled")  # 確定前の取り下げ
+        self.assertTrue(self._status("U1")["queued"])
+        self.assertFalse(Participant.objects.exists())
+
+        self.assertEqual(admission.admit_once(), 3)
+        self.assertEqual(dict(Participant.objects.values_list("user_id", "is_waiting")),
+                         {"U1": False, "U2": False, "U3": True})
+        self.e.refresh_from_db()
+        self.assertEqual((self.e.confirmed_count, self.e.waitlist_count), (2, 1))
+        self.assertEqual(self._status("U3"), {"joined": True, "is_waiting": True})
+        self.assertEqual(self._rsvp("U1").json()["status"], "joined")
+        self.assertEqual(admission.queue_stats()["queued"], 0)
+
+        # 確定後のキャンセルは通常どおり繰り上げ、再申込もできる
+        self.assertEqual(self._rsvp("U1", "delete").json()["promoted_user_id"], "U3")
+        self.assertEqual(self._rsvp("U1").status_code, 202)
+        self.assertEqual(admission.admit_batch(self.e.id), {"joined": 0, "waiting": 1, "already": 0})
+
+    def test_cancel_withdraws_queued_request_after_burst_mode_is_turned_off(self):
+        from events.models import Event, RsvpRequest
+        self.assertEqual(self._rsvp("U1").status_code, 202)
+        Event.objects.filter(pk=self.e.pk).update(burst_mode=False)
+        self.assertEqual(self._rsvp("U1", "delete").json()["status"], "canceled")
+        self.assertFalse(RsvpRequest.objects.exists())
+        self.assertEqual(self._rsvp("U1").json()["status"], "joined")  # 通常モードでそのまま参加できる
+
+    def test_admission_is_batched(self):
+        from events import admission
+        for i in range(30):
+            admission.enqueue(self.e.id, f"U{i}")
+        # セーブポイント2 + ロック/申込/既存/人数の読み取り、bulk insert、人数更新、結果ごとの状態更新
+        with self.assertNumQueries(10):
+            self.assertEqual(admission.admit_batch(self.e.id), {"joined": 2, "waiting": 28, "already": 0})
+
+
+class QueryPlanTests(TestCase):
+    """主要クエリが索引を使うこと（全件スキャンに落ちないこと）を EXPLAIN で確認する。"""
+
+    def assertUsesIndex(self, qs):
+        import re
+        from django.db import connection
+        plan = qs.explain()
+        if connection.vendor == "sqlite":
+            # "SCAN <table>" 単独は全件スキャン（"USING INDEX" 付きは索引順の走査なので可）
+            full = [ln for ln in plan.splitlines() if re.search(r"\bSCAN \w+$", ln.strip())]
+        else:
+            full = [ln for ln in plan.splitlines() if "Seq Scan" in ln]
+        self.assertFalse(full, f"full scan:\n{plan}")
+
+    def test_query_shapes_use_indexes(self):
+        from events import membership
+        from events.models import Event, Participant
+        self.assertUsesIndex(Event.objects.filter(created_by="U1").order_by("-start_time")[:200])
+        self.assertUsesIndex(Event.objects.filter(scope_id="C1").order_by("start_time", "id")[:100])
+        self.assertUsesIndex(Participant.objects.filter(event_id=1, is_waiting=True).order_by("joined_at", "id")[:1])
+        self.assertUsesIndex(Participant.objects.filter(user_id="U1", event_id__in=[1, 2, 3]))
+        self.assertUsesIndex(KnownGroup.objects.filter(joined=True).order_by("-last_seen_at")[:100])
+        self.assertUsesIndex(membership.annotate_membership(
+            KnownGroup.objects.filter(joined=True).order_by("-last_seen_at"), "U1")[:100])
+        from events.models import EventDraft
+        self.assertUsesIndex(EventDraft.objects.filter(touched_at__lt=timezone.now()).order_by("touched_at")
+                             .values_list("pk", flat=True)[:500])
+
+    def test_legacy_rows_are_normalized(self):
+        import importlib
+        from django.apps import apps
+        from django.db import connection
+        from events.models import Event
+        mig = importlib.import_module("events.migrations.0018_normalize_legacy_rows")
+        legacy = Event.objects.create(name="old", start_time=timezone.now(), created_by="", scope_id="U1")
+        group = Event.objects.create(name="grp", start_time=timezone.now(), created_by=None, scope_id="C1")
+        mig.fill_created_by(apps, connection.schema_editor())
+        legacy.refresh_from_db()
+        group.refresh_from_db()
+        self.assertEqual((legacy.created_by, group.created_by), ("U1", None))
+
+
+@override_settings(DB_READ_REPLICA="default", DB_READ_PIN_SECONDS=5)
+class DbRouterTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from events import db_router
+        cache.clear()
+        self.r = db_router
+        self.router = db_router.ReadReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replica_only_inside_context(self):
+        from events.models import Event
+        self.assertIsNone(self.router.db_for_read(Event))
+        with self.r.use_replica():
+            self.assertEqual(self.router.db_for_read(Event), "default")
+            with self.r.use_replica(False):
+                self.assertIsNone(self.router.db_for_read(Event))
+        self.assertEqual(self.router.db_for_write(Event), "default")
+        with override_settings(DB_READ_REPLICA=""), self.r.use_replica():
+            self.assertIsNone(self.router.db_for_read(Event))
+
+    def test_reads_stay_on_primary_inside_transaction(self):
+        from django.db import connection
+        from events.models import Event
+        with self.r.use_replica(), mock.patch.object(connection, "in_atomic_block", True):
+            self.assertIsNone(self.router.db_for_read(Event))
+
+    def test_writer_is_pinned_to_primary(self):
+        from django.http import JsonResponse
+        seen = []
+
+        @self.r.replica_reads
+        def read_view(request):
+            seen.append(self.r._reads_from_replica.get())
+            return JsonResponse({})
+
+        @self.r.pins_writer
+        def write_view(request):
+            return JsonResponse({}, status=int(request.GET.get("status", 200)))
+
+        def req(method, **params):
+            request = getattr(self.factory, method)("/x?" + "&".join(f"{k}={v}" for k, v in params.items()))
+            request.line_user_id = "U1"
+            return request
+
+        read_view(req("get"))
+        write_view(req("post", status=400))
+        read_view(req("get"))
+        self.assertEqual(seen, [True, True])
+        write_view(req("post"))
+        read_view(req("get"))
+        self.assertEqual(seen, [True, True, False])
+        self.assertTrue(self.r.is_pinned("U1"))
+        self.assertFalse(self.r.is_pinned("U2"))
+
+
+class ReplicaPinCacheCheckTests(SimpleTestCase):
+    def test_locmem_pin_cache_is_refused_with_replica_and_several_processes(self):
+        from django.conf import settings
+        from events.checks import check_replica_pin_cache
+        databases = {**settings.DATABASES, "replica": settings.DATABASES["default"]}
+        with self.settings(DATABASES=databases, DB_READ_REPLICA="replica"):
+            with self.settings(APP_PROCESSES=1):
+                self.assertEqual(check_replica_pin_cache(None), [])
+            with self.settings(APP_PROCESSES=2):
+                self.assertEqual([e.id for e in check_replica_pin_cache(None)], ["events.E003"])
+        with self.settings(DB_READ_REPLICA="", APP_PROCESSES=2):
+            self.assertEqual(check_replica_pin_cache(None), [])
+
+
+class ReplicaAliasTests(TransactionTestCase):
+    """プライマリとは別ファイルの SQLite をレプリカにして、読み取りの行き先と read-your-writes を確かめる。"""
+
+    alias = "replica_test"
+    databases = "__all__"  # setUpClass で足す alias も含める（テストランナーが集める時点ではまだ無い）
+
+    @classmethod
+    def setUpClass(cls):
+        import os, tempfile
+        from django.db import connections
+        fd, cls.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        connections.settings[cls.alias] = {**connections["default"].settings_dict, "NAME": cls.path}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        import os
+        from django.db import connections
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        os.remove(cls.path)
+
+    def test_reads_use_the_replica_until_the_user_is_pinned(self):
+        from django.db import connections
+        from django.http import JsonResponse
+        from django.test import RequestFactory
+        from events import db_router
+        from events.management.commands.sync_replica import sync_once
+        from events.models import Event
+
+        e = Event.objects.create(name="old", start_time=timezone.now(), created_by="U1")
+        sync_once(str(connections["default"].settings_dict["NAME"]), self.path)
+        Event.objects.filter(pk=e.pk).update(name="new")  # レプリカはまだ追従していない
+
+        @db_router.replica_reads
+        def read_view(request):
+            qs = Event.objects.filter(pk=e.pk)
+            return JsonResponse({"db": qs.db, "name": qs.get().name})
+
+        def read():
+            request = RequestFactory().get("/x")
+            request.line_user_id = "U1"
+            return json.loads(read_view(request).content)
+
+        with override_settings(DB_READ_REPLICA=self.alias, DB_READ_PIN_SECONDS=5):
+            from django.core.cache import cache
+            cache.delete(db_router._pin_key("U1"))
+            self.assertEqual(read(), {"db": self.alias, "name": "old"})
+            db_router.pin("U1")
+            self.assertEqual(read(), {"db": "default", "name": "new"})
+            cache.delete(db_router._pin_key("U1"))
+
+
+class DraftStoreTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from events import drafts
+        caches["drafts"].clear()
+        drafts._dirty.clear()
+        self.addCleanup(drafts._dirty.clear)
+
+    def test_create_wizard_steps_skip_the_database(self):
+        from events.handlers import create_wizard as cw
+        from events.models import Event, EventDraft
+        cw.handle_wizard_postback("U1", "home=create", {}, "C1")  # 開始時は DB にも書く
+        self.assertEqual(EventDraft.objects.get(user_id="U1").step, "title")
+        with self.assertNumQueries(0):
+            cw.handle_wizard_text("U1", "飲み会")
+            cw.handle_wizard_postback("U1", "pick=start_date", {"date": "2030-01-02"}, "C1")
+            cw.handle_wizard_postback("U1", "time=start&v=19:00", {}, "C1")
+            cw.handle_wizard_postback("U1", "endmode=duration", {}, "C1")
+            cw.handle_wizard_postback("U1", "dur=90m", {}, "C1")
+        self.assertEqual(EventDraft.objects.get(user_id="U1").step, "title")  # 途中のステップは DB に書かれていない
+        with self.assertNumQueries(2):  # Event の INSERT と下書きの DELETE
+            cw.handle_wizard_text("U1", "10")
+        e = Event.objects.get(scope_id="C1")
+        self.assertEqual((e.name, e.capacity, int((e.end_time - e.start_time).total_seconds())), ("飲み会", 10, 5400))
+        self.assertFalse(EventDraft.objects.exists())
+
+    def test_idle_drafts_are_written_behind(self):
+        from django.core.cache import caches
+        from events import drafts
+        from events.handlers import create_wizard as cw
+        from events.models import EventDraft
+        cw.handle_wizard_postback("U1", "home=create", {}, "C1")
+        cw.handle_wizard_text("U1", "読書会")
+        self.assertEqual(drafts.flush(), 0)  # まだ放置時間に達していない
+        self.assertEqual(drafts.flush(0), 1)
+        self.assertEqual(EventDraft.objects.get(user_id="U1").step, "start_date")
+        # キャッシュが消えても DB から続きを再開できる
+        caches["drafts"].clear()
+        self.assertEqual(drafts.get(EventDraft, "U1").name, "読書会")
+        cw.handle_wizard_postback("U1", "home=exit", {}, "C1")
+        self.assertFalse(EventDraft.objects.exists())
+        self.assertIsNone(drafts.get(EventDraft, "U1"))
+
+    def test_flush_does_not_resurrect_a_discarded_draft(self):
+        from events import drafts
+        from events.handlers import create_wizard as cw
+        from events.models import EventDraft
+        cw.handle_wizard_postback("U1", "home=create", {}, "C1")
+        cw.handle_wizard_text("U1", "読書会")
+        snapshot = dict(drafts._dirty)
+        # 別プロセスで終了された（行が消えた）後に、このプロセスの flush() が古いスナップショットを書こうとする
+        EventDraft.objects.filter(user_id="U1").delete()
+        from django.core.cache import caches
+        caches["drafts"].clear()
+        drafts._dirty.update(snapshot)
+        self.assertEqual(drafts.flush(0), 0)
+        self.assertFalse(EventDraft.objects.exists())
+
+    def test_locmem_draft_cache_is_refused_with_several_processes(self):
+        from events.checks import check_draft_cache
+        with self.settings(APP_PROCESSES=1):
+            self.assertEqual(check_draft_cache(None), [])
+        with self.settings(APP_PROCESSES=2):
+            self.assertEqual([e.id for e in check_draft_cache(None)], ["events.E001"])
+        file_cache = {"drafts": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/x"}}
+        with self.settings(APP_PROCESSES=2, CACHES=file_cache):
+            self.assertEqual(check_draft_cache(None), [])
+
+    def _postback_data(self, reply, label):
+        return next(a.data for a in reply.template.actions if a.label == label)
+
+    def test_button_steps_carry_signed_state(self):
+        from django.core.cache import caches
+        from events import drafts
+        from events.handlers import create_wizard as cw
+        from events.models import Event
+        cw.handle_wizard_postback("U1", "home=create", {}, "C" + "0" * 32)
+        cw.handle_wizard_text("U1", "バーベキュー大会")
+        reply = cw.handle_wizard_postback("U1", "pick=start_date", {"date": "2030-01-02"}, "C1")
+        data = self._postback_data(reply, "19:00")
+        self.assertTrue(data.startswith("time=start&v=19:00&s="))
+        self.assertLessEqual(len(data), 300)
+
+        # キャッシュが消えても（別プロセスなど）トークンだけで DB を読まずに進める
+        caches["drafts"].clear()
+        with self.assertNumQueries(0):
+            reply = cw.handle_wizard_postback("U1", data, {}, "C1")
+        data = self._postback_data(reply, "設定しない")
+        caches["drafts"].clear()
+        with self.assertNumQueries(0):
+            reply = cw.handle_wizard_postback("U1", data, {}, "C1")
+        skip_cap = self._postback_data(reply, "設定しない")
+        caches["drafts"].clear()
+        cw.handle_wizard_postback("U1", skip_cap, {}, "C1")
+        e = Event.objects.get()
+        self.assertEqual((e.name, e.start_time_has_clock, e.end_time), ("バーベキュー大会", True, None))
+        # 確定後に同じボタンを押しても二重に作られない
+        self.assertIsNone(cw.handle_wizard_postback("U1", skip_cap, {}, "C1"))
+        self.assertEqual(Event.objects.count(), 1)
+
+        # 他人のトークン・改ざんは受け付けない
+        _, token = drafts.split_token(skip_cap)
+        from events.models import EventDraft
+        self.assertIsNone(drafts.from_token(EventDraft, "U2", token))
+        self.assertIsNone(drafts.from_token(EventDraft, "U1", token[:-2] + "xx"))
+
+    def test_long_titles_fall_back_to_server_state(self):
+        from events.handlers import create_wizard as cw
+        cw.handle_wizard_postback("U1", "home=create", {}, "C1")
+        cw.handle_wizard_text("U1", "".join(chr(0x4E00 + i * 97 % 20000) for i in range(200)))
+        reply = cw.handle_wizard_postback("U1", "pick=start_date", {"date": "2030-01-02"}, "C1")
+        self.assertEqual(self._postback_data(reply, "19:00"), "time=start&v=19:00")
+
+    def test_edit_steps_write_only_changed_columns(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from events import drafts
+        from events.handlers import edit_wizard as ew
+        from events.models import Event, EventEditDraft
+        e = Event.objects.create(name="定例会", start_time=timezone.now(), capacity=5)
+        EventEditDraft.objects.create(user_id="U1", event=e, name=e.name, start_time=e.start_time, capacity=5)
+        with self.assertNumQueries(1):  # 最初だけ DB から読み込む
+            ew.handle_edit_postback("U1", "U1", "edit=cap", {})
+        for kind, payload in (("text", "abc"), ("text", "8"), ("postback", "edit=title"), ("text", "月例会")):
+            with self.assertNumQueries(0):
+                if kind == "text":
+                    ew.handle_edit_text("U1", payload)
+                else:
+                    ew.handle_edit_postback("U1", "U1", payload, {})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(drafts.flush(0), 1)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertTrue(sql.startswith("UPDATE"))
+        set_clause = sql.split(" SET ", 1)[1].split(" WHERE ", 1)[0]
+        self.assertEqual(sorted(c.split(" = ")[0].strip('"') for c in set_clause.split(", ")),
+                         ["capacity", "name", "step", "touched_at"])
+        row = EventEditDraft.objects.get(user_id="U1")
+        self.assertEqual((row.step, row.name, row.capacity), ("menu", "月例会", 8))
+
+    def test_step_tables_cover_every_postback_button(self):
+        from events.handlers import create_wizard as cw, edit_wizard as ew, steps
+        for data in ("time=start&v=19:00", "time=end&v=__skip__", "endmode=enddt", "endmode=duration",
+                     "endmode=skip", "dur=30m", "dur=skip", "cap=skip", "pick=start_date"):
+            key, _ = steps.postback_key(data)
+            self.assertIn(key, cw.POSTBACK_STEPS, data)
+            self.assertIn(key, ew.POSTBACK_STEPS, data)
+
+    def test_expired_drafts_are_swept_in_chunks(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from events import drafts
+        from events.models import Event, EventDraft, EventEditDraft
+        old = timezone.now() - timedelta(days=10)
+        EventDraft.objects.bulk_create([EventDraft(user_id=f"U{i}", touched_at=old) for i in range(5)])
+        EventDraft.objects.create(user_id="Ufresh")
+        e = Event.objects.create(name="e", start_time=timezone.now())
+        EventEditDraft.objects.create(user_id="U0", event=e, touched_at=old)
+        self.assertEqual(drafts.table_stats()["eventdraft"]["expired"], 5)
+
+        with self.assertNumQueries(3 * 2 + 2):  # 2件ずつ (SELECT + DELETE) x 3、編集下書きは1回
+            swept = drafts.sweep_expired(chunk=2)
+        self.assertEqual(swept, {"eventdraft": 5, "eventeditdraft": 1})
+        self.assertEqual(list(EventDraft.objects.values_list("user_id", flat=True)), ["Ufresh"])
+
+        out = StringIO()
+        call_command("sweep_drafts", "--dry-run", stdout=out)
+        self.assertIn("'live': 1", out.getvalue())
+        self.assertIn("'expired': 0", out.getvalue())
@@ -0,0 +1,87 @@
+# events/ttlcache.py
+# 役割: プロセス内で使う小さなキャッシュ（エントリ毎の有効期限＋件数上限のLRU追い出し）。
+
+import threading, time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    スレッドセーフな TTL 付き LRU キャッシュ。
+    - set() でエントリ毎に期限（epoch秒 or 相対秒）を持たせる
+    - maxsize を超えたら最も使われていないものから追い出す
+    - hits / misses / evictions を数えて stats() で返す
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl  # set() で期限を省略した場合の既定（秒）
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """有効なら値を返して LRU 先頭へ。期限切れ/未登録は default。"""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires_at, value = item
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, *, ttl: float | None = None, expires_at: float | None = None) -> None:
+        """
+        値を保存する。期限は expires_at（epoch秒）> ttl（相対秒）> 既定ttl の順で採用。
+        """
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = (time.time() + ttl) if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def pop_matching(self, predicate) -> int:
+        """predicate(key) が真のエントリをまとめて消す。戻り値は消した件数（全件を走査するので頻繁には呼ばない）。"""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
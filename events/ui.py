@@ -11,6 +11,20 @@ from linebot.models import (
     URIAction
 )
 
+# LINE の postback data の上限（文字数）
+POSTBACK_DATA_MAX = 300
+
+
+def _with_state(data: str, state: str = "") -> str:
+    """
+    data の末尾にウィザード下書きのトークン（drafts.to_token）を付ける。
+    上限を超える場合（長いタイトルなど）は付けず、サーバ側の下書きで処理させる。
+    """
+    if not state:
+        return data
+    full = f"{data}&s={state}"
+    return full if len(full) <= POSTBACK_DATA_MAX else data
+
 def msg_open_liff(text: str, liff_url: str) -> TextSendMessage:
     """
     LIFF を開くための「開く」クイックリプライ付きテキストを返す。
@@ -52,6 +66,14 @@ def ask_home_menu(data: str | None = None):
     return TextSendMessage(text=text, quick_reply=QuickReply(items=items))
 
 
+# ---- 参加人数の表示（Event の人数カラムをそのまま使う） ----
+def _participants_text(e) -> str:
+    confirmed = getattr(e, "confirmed_count", 0) or 0
+    waiting = getattr(e, "waitlist_count", 0) or 0
+    cap = f"/{e.capacity}" if getattr(e, "capacity", None) is not None else ""
+    return f"参加: {confirmed}{cap}人" + (f"（待ち {waiting}人）" if waiting else "")
+
+
 # ---- イベント一覧を表示 ----
 def build_event_list_carousel(events):
     """
@@ -66,7 +88,7 @@ def build_event_list_carousel(events):
     for e in events:
         title = (e.name or "（無題）")[:40]  # タイトル長ガード
         start_txt = utils.local_fmt(e.start_time, getattr(e, "start_time_has_clock", True))
-        text = f"開始: {start_txt}"[:60]    # 本文長ガード
+        text = f"開始: {start_txt}\n{_participants_text(e)}"[:60]    # 本文長ガード
         cols.append(CarouselColumn(
             title=title,
             text=text,
@@ -168,6 +190,9 @@ _MESSAGE_TEMPLATES = {
         "text": "{event_name} の参加をキャンセルしたよ",
         "qr": dict(show_home=True, show_exit=True)
     },
+    "rsvp.promoted": {
+        "text": "{event_name} に空きが出たので、ウェイトリストから参加確定になったよ",
+    },
 
     # 権限・バリデーション
     "auth.forbidden": {
@@ -250,14 +275,16 @@ def build_buttons(text: str, actions, alt_text: str = "選択メニュー", titl
 
 # ---- 日付ピッカー ----
 def ask_date_picker(data: str, min_dt=None, max_dt=None,
-                    with_back: bool = False, with_reset: bool = True, with_home: bool = True, with_exit: bool = True):
+                    with_back: bool = False, with_reset: bool = True, with_home: bool = True, with_exit: bool = True,
+                    state: str = ""):
     """
     役割: mode='date' の DatetimePicker を1つだけ持つメニューを返す。
     - data: 'pick=start_date' など識別子
     - min_dt/max_dt: 選択制約（例: 開始日以前を選ばせない など）
     - with_back/with_reset: QuickReplyの有無
+    - state: data に載せる下書きトークン（drafts.to_token）
     """
-    kwargs = {"label": "日付を選ぶ", "data": data, "mode": "date"}
+    kwargs = {"label": "日付を選ぶ", "data": _with_state(data, state), "mode": "date"}
     if min_dt:
         kwargs["min"] = utils._fmt_line_date(min_dt)
     if max_dt:
@@ -277,7 +304,8 @@ def ask_date_picker(data: str, min_dt=None, max_dt=None,
 def ask_time_menu(prefix: str,
                   times: tuple[str, ...] = ("09:00", "10:00", "19:00"),
                   allow_skip: bool = True,
-                  with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True):
+                  with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True,
+                  state: str = ""):
     """
     役割: 時刻候補（Postback）＋任意でスキップを提示する共通メニュー。
     ButtonsTemplate は actions 最大4件のため、候補数を丸める。
@@ -285,9 +313,9 @@ def ask_time_menu(prefix: str,
     max_time_buttons = 3 if allow_skip else 4
     times = tuple(times[:max_time_buttons])  # ← これで常に4件以内に収める
 
-    acts = [PostbackAction(label=t, data=f"time={prefix}&v={t}") for t in times]
+    acts = [PostbackAction(label=t, data=_with_state(f"time={prefix}&v={t}", state)) for t in times]
     if allow_skip:
-        acts.append(PostbackAction(label="設定しない", data=f"time={prefix}&v=__skip__"))
+        acts.append(PostbackAction(label="設定しない", data=_with_state(f"time={prefix}&v=__skip__", state)))
 
     qr = make_quick_reply(show_back=with_back, show_reset=with_reset, show_home=with_home, show_exit=with_exit)
     return build_buttons(
@@ -300,14 +328,15 @@ def ask_time_menu(prefix: str,
 
 
 # ---- 終了指定方法メニュー ----
-def ask_end_mode_menu(with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True):
+def ask_end_mode_menu(with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True,
+                      state: str = ""):
     """
     役割: 「終了時刻を入力/所要時間を入力/スキップ（入力しない）」を選ばせる。
     """
     acts = [
-        PostbackAction(label="終了時刻を入力", data="endmode=enddt"),
-        PostbackAction(label="所要時間を入力", data="endmode=duration"),
-        PostbackAction(label="設定しない", data="endmode=skip"),
+        PostbackAction(label="終了時刻を入力", data=_with_state("endmode=enddt", state)),
+        PostbackAction(label="所要時間を入力", data=_with_state("endmode=duration", state)),
+        PostbackAction(label="設定しない", data=_with_state("endmode=skip", state)),
     ]
     qr = make_quick_reply(show_back=with_back, show_reset=with_reset, show_home=with_home, show_exit=with_exit)
     
@@ -320,15 +349,16 @@ def ask_end_mode_menu(with_back: bool = True, with_reset: bool = True, with_home
     )
 
 # ---- 所要時間プリセットメニュー ----
-def ask_duration_menu(with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True):
+def ask_duration_menu(with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True,
+                      state: str = ""):
     """
     役割: 所要時間のプリセット（30/60/90分）と自由入力の案内を提示する。
     """
     acts = [
-        PostbackAction(label="30分", data="dur=30m"),
-        PostbackAction(label="60分", data="dur=60m"),
-        PostbackAction(label="1時間30分", data="dur=90m"),
-        PostbackAction(label="設定しない", data="dur=skip"),
+        PostbackAction(label="30分", data=_with_state("dur=30m", state)),
+        PostbackAction(label="60分", data=_with_state("dur=60m", state)),
+        PostbackAction(label="1時間30分", data=_with_state("dur=90m", state)),
+        PostbackAction(label="設定しない", data=_with_state("dur=skip", state)),
     ]
     qr = make_quick_reply(show_back=with_back, show_reset=with_reset, show_home=with_home, show_exit=with_exit)
     return build_buttons(
@@ -341,12 +371,13 @@ def ask_duration_menu(with_back: bool = True, with_reset: bool = True, with_home
 
 # ---- 定員入力メニュー ----
 def ask_capacity_menu(text: str = "定員を数字で入力してね",
-                      with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True):
+                      with_back: bool = True, with_reset: bool = True, with_home: bool = True, with_exit: bool = True,
+                      state: str = ""):
     """
     役割: 定員を数字で入力させる前提の案内と、スキップボタンのみを出す共通メニュー。
     - text: 文言を差し替えたい場合に指定
     """
-    acts = [PostbackAction(label="設定しない", data="cap=skip")]
+    acts = [PostbackAction(label="設定しない", data=_with_state("cap=skip", state))]
     qr = make_quick_reply(show_back=with_back, show_reset=with_reset, show_home=with_home, show_exit=with_exit)
     return build_buttons(
         text=text,
@@ -393,7 +424,7 @@ def build_event_summary(e, end_has_clock: bool | None = None, with_edit_button:
             end_text = f"終了時間: {utils.local_fmt(e.end_time, True)}"
 
     cap_text = "定員なし" if e.capacity is None else f"定員: {e.capacity}"
-    body = f"ID:{e.id}\nタイトル:{e.name}\n開始:{start_text}\n{end_text}\n{cap_text}"
+    body = f"ID:{e.id}\nタイトル:{e.name}\n開始:{start_text}\n{end_text}\n{cap_text}\n{_participants_text(e)}"
 
     if not with_edit_button:
         # 従来どおりテキストのみで返したい場合
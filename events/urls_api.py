@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('auth/verify-idtoken', views.verify_idtoken, name='verify_idtoken'),
+    path('auth/session', views.auth_session, name='auth_session'),
     path('events', views.events_list, name='events_list'),
     path('events/<int:event_id>', views.event_detail, name='event_detail'),
     path('events/<int:event_id>/participants', views.event_participants, name='event_participants'),
@@ -12,5 +13,6 @@ urlpatterns = [
     path('groups/suggest', views.groups_suggest, name='groups_suggest'),
     path('events/<int:event_id>/rsvp', views.event_rsvp, name='event_rsvp'),
     path('events/rsvp-status', views.rsvp_status, name='rsvp_status'),
+    path('ops/metrics', views.ops_metrics, name='ops_metrics'),
 ]
 
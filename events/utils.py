@@ -1,7 +1,8 @@
 # events/utils.py
 # 役割: UIに依存しない純ロジック（パース、日時合成、params→日付抽出）を集約する。
 
-import re, os, threading
+import re, os, contextvars
+from contextlib import contextmanager
 from urllib.parse import urlencode
 from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
@@ -89,15 +90,25 @@ def build_liff_deeplink_for_source(source_type: str, group_id: str | None = None
     return f"{base}?{urlencode(qs)}"
 
 
-_thread_locals = threading.local()
+# 現在処理中リクエストの Host（スレッドではなく実行コンテキスト単位で保持するため ASGI でも混ざらない）
+_request_host: contextvars.ContextVar[str] = contextvars.ContextVar("request_host", default="")
 
 def set_request_host(host: str | None):
-    """現在処理中リクエストの Host を保存/上書きする（Noneでクリア）"""
-    _thread_locals.host = (host or "").strip() if host else ""
+    """現在処理中リクエストの Host を保存/上書きする（Noneでクリア）。reset 用のトークンを返す"""
+    return _request_host.set((host or "").strip() if host else "")
 
 def get_request_host() -> str:
     """保存されている Host を取得（未設定なら空文字）"""
-    return getattr(_thread_locals, "host", "")
+    return _request_host.get()
+
+@contextmanager
+def request_host_context(host: str | None):
+    """with ブロックの間だけ Host を設定し、抜けたら元の値に戻す"""
+    token = set_request_host(host)
+    try:
+        yield
+    finally:
+        _request_host.reset(token)
 
 
 # ===== 以下、Chatbot用 ===== #
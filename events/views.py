@@ -1,8 +1,6 @@
 # events/views.py
-import os, json, unicodedata, requests
-from datetime import date, time, datetime
+import os, json, unicodedata, base64, hashlib, hmac, asyncio
 
-from django.apps import apps
 from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
@@ -10,17 +8,19 @@ from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 from django.utils import timezone
 from django.urls import reverse
-from django.db.models import Q
+from django.db import close_old_connections, transaction
 
-from linebot import LineBotApi, WebhookParser, WebhookHandler
+from asgiref.sync import sync_to_async
+
+from linebot import WebhookParser, WebhookHandler
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage,
     QuickReply, QuickReplyButton, URIAction, FlexSendMessage,
-    JoinEvent, LeaveEvent
+    JoinEvent, LeaveEvent, MemberJoinedEvent, MemberLeftEvent
 )
-from linebot.exceptions import InvalidSignatureError
 
-from . import ui, utils, policies
+from . import ui, utils, policies, idtoken, auth, webhook_queue, webhook_dedup, line_client, push_outbox, group_summary
+from . import profiles as member_profiles, membership, rsvp, pagination, serializers, admission, db_router, drafts
 from .models import KnownGroup, Event, Participant
 from .utils import build_liff_url_for_source, build_liff_deeplink_for_source  # 既存依存を維持
 # handlers.* は現状未使用だが、プロジェクト内参照があるため残置
@@ -47,7 +47,8 @@ _CHANNEL_SECRET = _get("LINE_CHANNEL_SECRET") or _get("MESSAGING_CHANNEL_SECRET"
 if not _ACCESS_TOKEN or not _CHANNEL_SECRET:
     raise RuntimeError("LINE channel credentials are not set. Check .env")
 
-line_bot_api = LineBotApi(_ACCESS_TOKEN)
+# 外向きHTTPは line_client の共有プール（keep-alive）を使う
+line_bot_api = line_client.get_line_bot_api(_ACCESS_TOKEN)
 handler = WebhookHandler(_CHANNEL_SECRET)
 
 
@@ -56,22 +57,21 @@ handler = WebhookHandler(_CHANNEL_SECRET)
 # =========================
 
 def _touch_known_group(group_id: str, *, refresh_summary: bool = False) -> None:
-    """KnownGroupをupsertし、既存行でもjoined=Trueに戻す。必要に応じて名前/アイコンも更新。"""
+    """
+    KnownGroupをupsertし、既存行でもjoined=Trueに戻す。
+    refresh_summary=True なら名前/アイコンが期限切れのときだけバックグラウンドで取り直す（待たない）。
+    """
     if not group_id:
         return
-    obj, _ = KnownGroup.objects.get_or_create(group_id=group_id, defaults={"joined": True})
-    if obj.joined is False:
-        obj.joined = True
-    obj.last_seen_at = timezone.now()
+    obj, created = KnownGroup.objects.get_or_create(group_id=group_id, defaults={"joined": True})
+    if not created:
+        KnownGroup.objects.filter(pk=obj.pk).update(joined=True, last_seen_at=timezone.now())
     if refresh_summary:
-        try:
-            s = line_bot_api.get_group_summary(group_id)
-            obj.name = getattr(s, "group_name", None) or getattr(s, "groupName", "") or obj.name
-            obj.picture_url = getattr(s, "picture_url", None) or getattr(s, "pictureUrl", "") or obj.picture_url
-            obj.last_summary_at = timezone.now()
-        except Exception:
-            pass
-    obj.save()
+        group_summary.ensure_fresh(obj)
+
+def _line_api_async(fn, *args, **kwargs):
+    """LINE API（同期SDK）呼び出しをスレッドプールで実行する awaitable を返す（async ビュー用）。"""
+    return sync_to_async(fn, thread_sensitive=False)(*args, **kwargs)
 
 def _is_home_menu_trigger(text: str) -> bool:
     """'ボット'系や'🤖'でホームトリガー判定。"""
@@ -99,7 +99,7 @@ def get_line_clients():
     )
     if not token or not secret:
         raise ImproperlyConfigured("LINEのトークン/シークレットが未設定だよ")
-    return LineBotApi(token), WebhookParser(secret)
+    return line_client.get_line_bot_api(token), WebhookParser(secret)
 
 def _resolve_scope_id(obj) -> str:
     """会話スコープID（group/room/user）を抽出。"""
@@ -108,28 +108,9 @@ def _resolve_scope_id(obj) -> str:
         or getattr(source, "room_id", None) \
         or getattr(source, "user_id", "")
 
-def _to_str(v):
-    """date/datetime/timeはisoformat、それ以外は安全なstr化。"""
-    if isinstance(v, (datetime, date, time)):
-        try:
-            return v.isoformat()
-        except Exception:
-            return str(v)
-    return v if isinstance(v, (int, float, bool)) else (str(v) if v is not None else None)
-
-def _verify_id_token_internal(id_token: str) -> dict:
-    """LIFFのIDトークンを MINIAPP_CHANNEL_ID で検証。OKでsub等を返す。NGで例外。"""
-    channel_id = getattr(settings, 'MINIAPP_CHANNEL_ID', '')
-    resp = requests.post(
-        'https://api.line.me/oauth2/v2.1/verify',
-        data={'id_token': id_token, 'client_id': channel_id},
-        timeout=10
-    )
-    data = resp.json()
-    if resp.status_code != 200 or not data.get('sub'):
-        logger.warning("verify status=%s body=%s", resp.status_code, data)
-        raise ValueError('verify failed')
-    return data
+def _verify_id_token_internal(id_token: str, nonce: str | None = None) -> dict:
+    """LIFFのIDトークンを検証（events.idtoken に委譲、検証済みはキャッシュ）。OKでsub等を返す。NGで例外。"""
+    return idtoken.verify_id_token_cached(id_token, nonce=nonce)
 
 def _build_event_created_flex(e, liff_url: str, *, action: str = "created") -> dict:
     """
@@ -164,28 +145,31 @@ def _build_event_created_flex(e, liff_url: str, *, action: str = "created") -> d
 
 def _push_event_created(scope_id: str, e, *, request_host: str, action: str = "created") -> None:
     """
-    イベント作成/更新通知Flexを該当グループへpushする。
+    イベント作成/更新通知Flexをアウトボックスに積む（送信は run_push_dispatcher）。
     - action: "created"（作成）|"updated"（更新）
     - request_host は LIFF URL 生成に必要（ngrok等の動的ホスト対応）
+    - Event の保存と同じ transaction.atomic() 内で呼ぶこと
     """
     if not scope_id:
         return
 
-    utils.set_request_host(request_host)
     try:
-        liff_url = utils.build_liff_url_for_source(source_type="group", group_id=scope_id)
-    finally:
-        utils.set_request_host(None)
+        with utils.request_host_context(request_host):
+            liff_url = utils.build_liff_url_for_source(source_type="group", group_id=scope_id)
 
-    contents = _build_event_created_flex(e, liff_url, action=action)
+        contents = _build_event_created_flex(e, liff_url, action=action)
 
-    if action == "updated":
-        alt_text = f"「{e.name}」が更新されました！グループのイベントは {liff_url} から見れるよ"
-    else:
-        alt_text = f"「{e.name}」が作成されました！グループのイベントは {liff_url} から見れるよ"
+        if action == "updated":
+            alt_text = f"「{e.name}」が更新されました！グループのイベントは {liff_url} から見れるよ"
+        else:
+            alt_text = f"「{e.name}」が作成されました！グループのイベントは {liff_url} から見れるよ"
+
+        msg = FlexSendMessage(alt_text=alt_text, contents=contents)
+    except Exception as ex:
+        logger.warning("notify build failed: %s", ex)
+        return
 
-    msg = FlexSendMessage(alt_text=alt_text, contents=contents)
-    line_bot_api.push_message(scope_id, msg)
+    push_outbox.enqueue(scope_id, msg)
 
 
 # =========================
@@ -193,24 +177,59 @@ def _push_event_created(scope_id: str, e, *, request_host: str, action: str = "c
 # =========================
 
 @csrf_exempt
-def callback(request):
-    """LINEからのWebhook受信。ハンドラに委譲。"""
+async def callback(request):
+    """
+    LINEからのWebhook受信。署名検証 → 再送（webhookEventId 重複）の除去 → 処理。
+    - 既定: ハンドラに委譲（LINE API 待ちはスレッドへ逃がし、イベントループは塞がない）
+    - LINE_WEBHOOK_ASYNC=True: キューに積んで即 200（処理はワーカー）
+    """
     signature = request.META.get('HTTP_X_LINE_SIGNATURE', '')
     body = request.body.decode('utf-8')
     logger.debug("Request body: %s", body)
-    utils.set_request_host(request.get_host())
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
+
+    if not handler.parser.signature_validator.validate(body, signature):
         logger.error("Invalid signature. Check your channel access token/channel secret.")
         return HttpResponse(status=400)
+
+    try:
+        body, marked = await sync_to_async(webhook_dedup.drop_duplicates)(body)
     except Exception as e:
         logger.error("Error: %s", str(e))
         return HttpResponseBadRequest()
-    finally:
-        utils.set_request_host(None)
+
+    host = request.get_host()
+    try:
+        if getattr(settings, 'LINE_WEBHOOK_ASYNC', False):
+            await sync_to_async(webhook_queue.enqueue)(body, host=host)
+        else:
+            await sync_to_async(_dispatch_in_worker_thread, thread_sensitive=False)(body, host)
+    except Exception as e:
+        logger.error("Error: %s", str(e))
+        await sync_to_async(webhook_dedup.forget)(marked)  # LINE側の再送で処理し直せるようにする
+        return HttpResponseBadRequest()
     return HttpResponse('OK')
 
+def _dispatch_in_worker_thread(body: str, host: str) -> None:
+    """スレッドプール上でハンドラを実行し、そのスレッドのDB接続を後始末する。"""
+    try:
+        dispatch_webhook_body(body, host=host)
+    finally:
+        close_old_connections()
+
+def dispatch_webhook_body(body: str, *, host: str = "") -> None:
+    """
+    署名検証済みのWebhookボディを登録済みハンドラへ流す（callback/ワーカー共通）。
+    重複除去でボディを組み直すため、自チャネルのシークレットで署名し直して handler.handle に渡す。
+    """
+    sig = base64.b64encode(hmac.new(_CHANNEL_SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest())
+    with utils.request_host_context(host):
+        handler.handle(body, sig.decode('utf-8'))
+    # 放置されたウィザード下書きをここでまとめて DB へ書く（write-behind のチェックポイント）
+    try:
+        drafts.flush()
+    except Exception:
+        logger.exception("draft flush failed")
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_text_message(event):
     """テキスト受信ハンドラ。簡易コマンドとLIFF起動誘導。"""
@@ -219,6 +238,8 @@ def handle_text_message(event):
 
     if getattr(source, "type", "") == "group":
         _touch_known_group(getattr(source, "group_id", ""), refresh_summary=False)
+        # 発言者はそのグループに在籍している
+        membership.touch(getattr(source, "group_id", ""), getattr(source, "user_id", ""))
 
     if text in ("グループID", "group id", "groupid", "gid"):
         if getattr(source, "type", "") == "group":
@@ -275,9 +296,24 @@ def handle_leave(event):
         gid = getattr(event.source, "group_id", "") or getattr(event.source, "room_id", "")
         if gid:
             KnownGroup.objects.filter(group_id=gid).update(joined=False, last_seen_at=timezone.now())
+            membership.forget_scope(gid)
     except Exception:
         pass
 
+@handler.add(MemberJoinedEvent)
+def handle_member_joined(event):
+    """メンバー参加を在籍記録に反映。"""
+    gid = getattr(event.source, "group_id", "")
+    members = getattr(getattr(event, "joined", None), "members", None) or []
+    membership.record_many(gid, [getattr(m, "user_id", "") for m in members], is_member=True)
+
+@handler.add(MemberLeftEvent)
+def handle_member_left(event):
+    """メンバー退出を在籍記録に反映。"""
+    gid = getattr(event.source, "group_id", "")
+    members = getattr(getattr(event, "left", None), "members", None) or []
+    membership.record_many(gid, [getattr(m, "user_id", "") for m in members], is_member=False)
+
 
 # =========================
 # LIFF（HTML/検証）
@@ -289,17 +325,12 @@ def liff_entry(request):
     abs_redirect = f"https://{host}{reverse('liff_entry')}"
     group_id = request.GET.get('groupId') or ""
     if group_id:
+        # 名前/アイコンは保存済みの値で描画し、期限切れなら裏で取り直す（LINE API を待たない）
         try:
-            obj, _ = KnownGroup.objects.get_or_create(group_id=group_id, defaults={"joined": True})
-            obj.last_seen_at = timezone.now()
-            try:
-                s = line_bot_api.get_group_summary(group_id)
-                obj.name = getattr(s, "group_name", None) or getattr(s, "groupName", "") or obj.name
-                obj.picture_url = getattr(s, "picture_url", None) or getattr(s, "pictureUrl", "") or obj.picture_url
-                obj.last_summary_at = timezone.now()
-            except Exception:
-                pass
-            obj.save()
+            obj, created = KnownGroup.objects.get_or_create(group_id=group_id, defaults={"joined": True})
+            if not created:
+                KnownGroup.objects.filter(pk=obj.pk).update(last_seen_at=timezone.now())
+            group_summary.ensure_fresh(obj)
         except Exception:
             pass
     return render(request, 'events/liff_app.html', {
@@ -317,128 +348,115 @@ def verify_idtoken(request):
         id_token = body.get('id_token')
         if not id_token:
             return HttpResponseBadRequest('id_token is required')
-        res = requests.post(
-            'https://api.line.me/oauth2/v2.1/verify',
-            data={'id_token': id_token, 'client_id': getattr(settings, 'MINIAPP_CHANNEL_ID', '')},
-            timeout=10
-        )
-        data = res.json()
-        if res.status_code != 200:
-            return JsonResponse({'ok': False, 'reason': data}, status=400)
+        try:
+            data = _verify_id_token_internal(id_token, nonce=body.get('nonce'))
+        except idtoken.IdTokenError as ex:
+            return JsonResponse({'ok': False, 'reason': str(ex)}, status=400)
         return JsonResponse({'ok': True, 'payload': data})
     except Exception as e:
         return JsonResponse({'ok': False, 'reason': str(e)}, status=500)
 
+@csrf_exempt
+async def auth_session(request):
+    """IDトークンを1回だけ検証し、以降のAPIで使う短命セッション（Bearer/Cookie）を発行する。"""
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
+    try:
+        body = auth.get_json_body(request)
+    except Exception:
+        return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
+
+    id_token = (body.get('id_token') or '').strip()
+    if not id_token:
+        return JsonResponse({'ok': False, 'reason': 'id_token required'}, status=400)
+    try:
+        # ローカル検証はCPUのみだが、リモートフォールバック時のI/Oでループを塞がないようスレッドで行う
+        payload = await sync_to_async(_verify_id_token_internal)(id_token, nonce=body.get('nonce'))
+    except Exception:
+        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
+
+    user_id = payload.get('sub')
+    session = auth.issue_session(user_id)
+    ttl = auth.session_ttl()
+    resp = JsonResponse({'ok': True, 'session': session, 'token_type': 'Bearer', 'expires_in': ttl, 'sub': user_id})
+    resp.set_cookie(auth.SESSION_COOKIE, session, max_age=ttl, httponly=True,
+                    secure=request.is_secure(), samesite='Lax')
+    return resp
+
 
 # =========================
 # REST API（イベント/グループ）
 # =========================
 
 @csrf_exempt
+@db_router.replica_reads
 def groups_suggest(request):
     """Bot参加グループを候補返却。only_my=True時はid_token検証＋在籍確認を行う。"""
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
     try:
-        body = json.loads(request.body.decode('utf-8'))
+        body = auth.get_json_body(request)
     except Exception:
         return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
 
-    id_token = (body.get('id_token') or '').strip()
     q = (body.get('q') or '').strip()
-    lim = body.get('limit', 20)
+    try:
+        lim = max(int(body.get('limit', 20)), 0)
+    except (TypeError, ValueError):
+        lim = 20
     only_my = bool(body.get('only_my', False))
 
     user_id = None
     if only_my:
-        try:
-            payload = _verify_id_token_internal(id_token)
-            user_id = payload.get('sub') or None
-        except Exception:
+        user_id = auth.resolve_line_user(request)
+        if not user_id:
             return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
 
     qs = KnownGroup.objects.filter(joined=True)
     if q:
         qs = qs.filter(name__icontains=q)
-    qs = qs.order_by('-last_seen_at')[:100]
+    qs = qs.order_by('-last_seen_at')
+
+    unchecked = 0
+    if only_my:
+        # 在籍記録を結合して判定し、記録が無い/古いグループだけ時間予算内で並列確認する
+        groups, unchecked = membership.filter_member_groups(
+            membership.annotate_membership(qs, user_id)[:100], user_id)
+    else:
+        groups = list(qs[:100])
 
     items = []
-    for g in qs:
-        if len(items) >= lim:
-            break
-        gid = g.group_id
-        if only_my:
-            try:
-                line_bot_api.get_group_member_profile(gid, user_id)
-            except Exception:
-                continue
-        name = g.name or ""
-        pic = g.picture_url or ""
-        if not name or not pic:
-            try:
-                s = line_bot_api.get_group_summary(gid)
-                name2 = getattr(s, "group_name", None) or getattr(s, "groupName", "") or ""
-                pic2 = getattr(s, "picture_url", None) or getattr(s, "pictureUrl", "") or ""
-                if name2 and name != name2:
-                    g.name = name = name2
-                if pic2 and pic != pic2:
-                    g.picture_url = pic = pic2
-                g.last_summary_at = timezone.now()
-                g.save(update_fields=["name", "picture_url", "last_summary_at"])
-            except Exception:
-                pass
-        items.append({'id': gid, 'name': name or gid, 'pictureUrl': pic or ''})
-
-    return JsonResponse({'ok': True, 'items': items, 'total': len(items)}, status=200)
+    for g in groups[:lim]:
+        # 保存済みの値をそのまま返し、期限切れ（未取得含む）は裏で取り直す
+        group_summary.ensure_fresh(g)
+        items.append({'id': g.group_id, 'name': g.name or g.group_id, 'pictureUrl': g.picture_url or ''})
+
+    return JsonResponse({'ok': True, 'items': items, 'total': len(items), 'unchecked': unchecked}, status=200)
 
 @csrf_exempt
+@auth.require_line_user
+@db_router.replica_reads
 def events_mine(request):
     """自分が作成したイベント一覧（LIFFの1:1ページ用）。"""
-    if request.method != 'POST':
+    if request.method not in ('GET', 'POST'):
         return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
-    try:
-        body = json.loads(request.body.decode('utf-8'))
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
-
-    id_token = (body.get('id_token') or '').strip()
-    if not id_token:
-        return JsonResponse({'ok': False, 'reason': 'missing_id_token'}, status=400)
+    user_id = request.line_user_id
 
+    # 旧データの created_by は 0018 で scope_id から補完済み → (created_by, start_time) 索引1本で引ける
+    limit = pagination.parse_limit(request.GET.get('limit'), default=100, maximum=200)
     try:
-        payload = _verify_id_token_internal(id_token)
-        user_id = payload.get('sub') or None
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-
-    qs = (Event.objects
-          .filter(Q(created_by=user_id) |
-                  Q(created_by__isnull=True, scope_id=user_id) |
-                  Q(created_by="", scope_id=user_id))
-          .order_by('-start_time')[:200])
+        items, next_cursor = pagination.keyset_page(
+            serializers.event_values(Event.objects.filter(created_by=user_id)), ('start_time', 'id'),
+            cursor=request.GET.get('cursor'), limit=limit, descending=True)
+    except pagination.InvalidCursor:
+        return JsonResponse({'ok': False, 'reason': 'invalid cursor'}, status=400)
 
-    items = []
-    for e in qs:
-        confirmed = e.participants.filter(is_waiting=False).count()
-        waiting   = e.participants.filter(is_waiting=True).count()
-        items.append({
-            'id': e.id,
-            'name': e.name,
-            'start_time': _to_str(e.start_time),
-            'start_time_has_clock': e.start_time_has_clock,
-            'end_time': _to_str(e.end_time),
-            'capacity': e.capacity,
-            'scope_id': e.scope_id,
-            'created_by': user_id,
-            'confirmed_count': confirmed,
-            'waitlist_count': waiting,
-        })
-
-    return JsonResponse({'ok': True, 'items': items}, status=200)
+    return serializers.json_response({'ok': True, 'items': items, 'next_cursor': next_cursor})
 
 @csrf_exempt
+@auth.require_line_user(methods=('POST',))
+@db_router.pins_writer
+@db_router.replica_reads(methods=('GET',))
 def events_list(request):
     """
     GET : 汎用イベント一覧（scope_id絞り込み対応）
@@ -447,76 +465,28 @@ def events_list(request):
     # GET
     if request.method == 'GET':
         scope_id = request.GET.get('scope_id') or None
+        limit = pagination.parse_limit(request.GET.get('limit'), default=100, maximum=200)
+        qs = Event.objects.all()
+        if scope_id:
+            qs = qs.filter(scope_id=scope_id)
+        # (scope_id, start_time) 索引に沿ったキーセットページング。行は .values() の dict をそのまま返す
         try:
-            EventModel = apps.get_model('events', 'Event')
-        except LookupError:
-            return JsonResponse({'ok': True, 'items': []}, status=200)
-
-        fields = {f.name for f in EventModel._meta.get_fields() if hasattr(f, 'attname')}
-        order_candidates = ['date', 'event_date', 'start_time', 'id']
-        order_keys = [k for k in order_candidates if k in fields]
-        try:
-            qs = EventModel.objects.all()
-            if scope_id and 'scope_id' in fields:
-                qs = qs.filter(scope_id=scope_id)
-            if order_keys:
-                qs = qs.order_by(*order_keys)
-            qs = qs[:100]
-        except Exception:
-            return JsonResponse({'ok': True, 'items': []}, status=200)
-
-        prefer = ['id', 'name', 'title', 'date', 'event_date',
-                  'start_time', 'start_time_has_clock', 'end_time', 'capacity']
-        items = []
-        for e in qs:
-            obj = {}
-            for key in prefer:
-                if key in fields:
-                    obj[key] = _to_str(getattr(e, key, None))
-            if 'name' not in obj and 'title' in obj:
-                obj['name'] = obj.get('title')
-            if 'created_by' in fields:
-                obj['created_by'] = getattr(e, 'created_by', None)
-            if 'scope_id' in fields:
-                obj['scope_id'] = getattr(e, 'scope_id', None)
-            
-            # 参加者件数
-            try:
-                obj['confirmed_count'] = e.participants.filter(is_waiting=False).count()
-                obj['waitlist_count']  = e.participants.filter(is_waiting=True).count()
-            except Exception:
-                pass
-            
-            items.append(obj)
-        return JsonResponse({'ok': True, 'items': items}, status=200)
+            items, next_cursor = pagination.keyset_page(serializers.event_values(qs), ('start_time', 'id'),
+                                                        cursor=request.GET.get('cursor'), limit=limit)
+        except pagination.InvalidCursor:
+            return JsonResponse({'ok': False, 'reason': 'invalid cursor'}, status=400)
+        return serializers.json_response({'ok': True, 'items': items, 'next_cursor': next_cursor})
 
     # POST（作成）
     if request.method != 'POST':
         return HttpResponseBadRequest('invalid method')
 
     try:
-        body = json.loads(request.body.decode('utf-8'))
+        body = auth.get_json_body(request)
     except Exception:
         return HttpResponseBadRequest('invalid json')
 
-    id_token = (body.get('id_token') or "").strip()
-    if not id_token:
-        return JsonResponse({'ok': False, 'reason': 'id_token required'}, status=401)
-
-    try:
-        res = requests.post(
-            'https://api.line.me/oauth2/v2.1/verify',
-            data={'id_token': id_token, 'client_id': getattr(settings, 'MINIAPP_CHANNEL_ID', '')},
-            timeout=10
-        )
-        vr = res.json()
-        if res.status_code != 200:
-            return JsonResponse({'ok': False, 'reason': vr}, status=401)
-        user_id = vr.get('sub') or ''
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'verify ok but no sub'}, status=401)
-    except Exception as e:
-        return JsonResponse({'ok': False, 'reason': str(e)}, status=500)
+    user_id = request.line_user_id
 
     name = (body.get('name') or '').strip()
     date_str = (body.get('date') or '').strip()
@@ -568,39 +538,28 @@ def events_list(request):
 
     scope_id = (body.get('scope_id') or '').strip() or None
 
-    e = Event.objects.create(
-        name=name,
-        start_time=start_dt,
-        end_time=end_dt,
-        capacity=capacity,
-        start_time_has_clock=start_has_clock,
-        created_by=user_id,
-        scope_id=scope_id,
-    )
-
     notify = bool(body.get('notify', False))
-    if notify and scope_id:
-        try:
+    with transaction.atomic():
+        e = Event.objects.create(
+            name=name,
+            start_time=start_dt,
+            end_time=end_dt,
+            capacity=capacity,
+            start_time_has_clock=start_has_clock,
+            created_by=user_id,
+            scope_id=scope_id,
+            burst_mode=bool(body.get('burst_mode', False)),
+        )
+        if notify and scope_id:
             _push_event_created(scope_id, e, request_host=request.get_host())
-        except Exception as ex:
-            logger.warning("notify push failed: %s", ex)
 
-    return JsonResponse({
-        'ok': True,
-        'item': {
-            'id': e.id,
-            'name': e.name,
-            'start_time': _to_str(e.start_time),
-            'start_time_has_clock': e.start_time_has_clock,
-            'end_time': _to_str(e.end_time),
-            'capacity': e.capacity,
-            'created_by': getattr(e, 'created_by', None),
-            'scope_id': getattr(e, 'scope_id', None),
-        }
-    }, status=201)
+    return serializers.json_response({'ok': True, 'item': serializers.event_item(e)}, status=201)
 
 
 @csrf_exempt
+@auth.require_line_user(methods=('PATCH', 'DELETE'))
+@db_router.pins_writer
+@db_router.replica_reads(methods=('GET',))
 def event_detail(request, event_id: int):
     """単一イベントのGET/PATCH/DELETE。更新はid_token検証＋権限チェック。"""
     try:
@@ -609,47 +568,18 @@ def event_detail(request, event_id: int):
         return JsonResponse({'ok': False, 'reason': 'not found'}, status=404)
 
     if request.method == 'GET':
-        return JsonResponse({
-            'ok': True,
-            'item': {
-                'id': e.id,
-                'name': e.name,
-                'start_time': _to_str(e.start_time),
-                'start_time_has_clock': getattr(e, 'start_time_has_clock', True),
-                'end_time': _to_str(e.end_time),
-                'capacity': e.capacity,
-                'created_by': getattr(e, 'created_by', None),
-                'scope_id': getattr(e, 'scope_id', None),
-            }
-        }, status=200)
+        return serializers.json_response({'ok': True, 'item': serializers.event_item(e)})
 
 
     if request.method not in ('PATCH', 'DELETE'):
         return HttpResponseBadRequest('invalid method')
 
     try:
-        body = json.loads(request.body.decode('utf-8')) if request.body else {}
+        body = auth.get_json_body(request)
     except Exception:
         return HttpResponseBadRequest('invalid json')
 
-    id_token = (body.get('id_token') or "").strip()
-    if not id_token:
-        return JsonResponse({'ok': False, 'reason': 'id_token required'}, status=401)
-
-    try:
-        res = requests.post(
-            'https://api.line.me/oauth2/v2.1/verify',
-            data={'id_token': id_token, 'client_id': getattr(settings, 'MINIAPP_CHANNEL_ID', '')},
-            timeout=10
-        )
-        vr = res.json()
-        if res.status_code != 200:
-            return JsonResponse({'ok': False, 'reason': vr}, status=401)
-        user_id = vr.get('sub') or ''
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'verify ok but no sub'}, status=401)
-    except Exception as ex:
-        return JsonResponse({'ok': False, 'reason': str(ex)}, status=500)
+    user_id = request.line_user_id
 
     if not policies.can_edit_event(user_id, e):
         return JsonResponse({'ok': False, 'reason': 'forbidden'}, status=403)
@@ -710,6 +640,7 @@ def event_detail(request, event_id: int):
             return JsonResponse({'ok': False, 'reason': 'capacity must be >=1'}, status=400)
         new_cap = cap_int
 
+    capacity_changed = (new_cap != e.capacity)
     e.name = name
     e.start_time = new_start
     e.start_time_has_clock = start_has_clock
@@ -717,86 +648,66 @@ def event_detail(request, event_id: int):
     e.capacity = new_cap
     new_scope_id = (body.get('scope_id') or '').strip() or e.scope_id
     e.scope_id = new_scope_id
-    e.save()
-
-    try:
-        notify = bool(body.get('notify', False))
+    if 'burst_mode' in body:
+        e.burst_mode = bool(body.get('burst_mode'))
+    notify = bool(body.get('notify', False))
+    with transaction.atomic():
+        # 人数カラムは RSVP 側で更新されるため書き戻さない
+        e.save(update_fields=Event.CONTENT_FIELDS)
+        if capacity_changed:
+            # 定員が増えた/無くなった分だけウェイトリストを繰り上げる
+            rsvp.promote_waiters(e.id)
         if notify and new_scope_id:
             _push_event_created(new_scope_id, e, request_host=request.get_host(), action="updated")
-    except Exception as ex:
-        logger.warning("notify push failed: %s", ex)
 
-    return JsonResponse({
-        'ok': True,
-        'item': {
-            'id': e.id,
-            'name': e.name,
-            'start_time': _to_str(e.start_time),
-            'start_time_has_clock': e.start_time_has_clock,
-            'end_time': _to_str(e.end_time),
-            'capacity': e.capacity,
-            'created_by': getattr(e, 'created_by', None),
-            'scope_id': getattr(e, 'scope_id', None),
-        }
-    }, status=200)
+    # 繰り上げ（promote_waiters）や並行する RSVP で変わった人数カラムを読み直して返す
+    e.refresh_from_db(fields=['confirmed_count', 'waitlist_count'])
+    return serializers.json_response({'ok': True, 'item': serializers.event_item(e)})
 
 
 @csrf_exempt
+@auth.require_line_user
 def event_participants(request, event_id: int):
     """作成者向けの参加者/ウェイトリスト一覧を返す。プロフィール付与（グループ/ルーム）。"""
-    if request.method != 'POST':
+    if request.method not in ('GET', 'POST'):
         return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
-    try:
-        body = json.loads(request.body.decode('utf-8'))
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
-
-    id_token = (body.get('id_token') or '').strip()
-    if not id_token:
-        return JsonResponse({'ok': False, 'reason': 'missing_id_token'}, status=400)
-
-    try:
-        payload = _verify_id_token_internal(id_token)
-        user_id = payload.get('sub') or None
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
+    user_id = request.line_user_id
 
     try:
         e = Event.objects.get(pk=event_id)
     except Event.DoesNotExist:
         return JsonResponse({'ok': False, 'reason': 'not_found'}, status=404)
 
-    is_creator = (
-        (getattr(e, 'created_by', None) == user_id) or
-        (not getattr(e, 'created_by', None) and getattr(e, 'scope_id', None) == user_id)
-    )
-    if not is_creator:
+    if getattr(e, 'created_by', None) != user_id:
         return JsonResponse({'ok': False, 'reason': 'forbidden'}, status=403)
 
-    qs = e.participants.all().order_by('joined_at', 'id')
+    # 参加確定 → ウェイトリストの順に、(event, is_waiting, joined_at) 索引に沿ってページング
+    params = request.GET
+    if request.method == 'POST':
+        try:
+            params = {**request.GET.dict(), **auth.get_json_body(request)}
+        except Exception:
+            return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
+    limit = pagination.parse_limit(params.get('limit'), default=100, maximum=500)
+    try:
+        qs, next_cursor = pagination.keyset_page(e.participants.all(), ('is_waiting', 'joined_at', 'id'),
+                                                 cursor=params.get('cursor'), limit=limit)
+    except pagination.InvalidCursor:
+        return JsonResponse({'ok': False, 'reason': 'invalid cursor'}, status=400)
     base_participants = [{'user_id': p.user_id, 'joined_at': p.joined_at.isoformat()} for p in qs if not p.is_waiting]
     base_waitlist = [{'user_id': p.user_id, 'joined_at': p.joined_at.isoformat()} for p in qs if p.is_waiting]
 
-    profiles = {}
+    # プロフィールはキャッシュ優先、未キャッシュ分だけ並列取得（締め切り超過分は部分結果）
+    profiles, pending = {}, []
     scope_id = getattr(e, 'scope_id', '') or ''
     if scope_id and (scope_id.startswith('C') or scope_id.startswith('R')):
+        uids = [r['user_id'] for r in (base_participants + base_waitlist)]
         try:
-            lb, _ = get_line_clients()
-        except Exception:
-            lb = None
-        if lb:
-            uids = {r['user_id'] for r in (base_participants + base_waitlist)}
-            for uid in uids:
-                try:
-                    prof = lb.get_group_member_profile(scope_id, uid) if scope_id.startswith('C') \
-                        else lb.get_room_member_profile(scope_id, uid)
-                    name = getattr(prof, 'display_name', None) or getattr(prof, 'displayName', None) or ''
-                    pic = getattr(prof, 'picture_url', None) or getattr(prof, 'pictureUrl', None) or ''
-                    profiles[uid] = {'name': name, 'pictureUrl': pic}
-                except Exception:
-                    pass
+            profiles, pending = member_profiles.get_profiles(scope_id, uids)
+            if scope_id.startswith('C'):
+                membership.record_many(scope_id, profiles.keys())
+        except Exception as ex:
+            logger.warning("member profiles failed: %s", ex)
 
     def enrich(rows):
         out = []
@@ -813,140 +724,114 @@ def event_participants(request, event_id: int):
         'event': {'id': e.id, 'name': e.name, 'capacity': e.capacity},
         'participants': participants,
         'waitlist': waitlist,
-        'counts': {'participants': len(participants), 'waitlist': len(waitlist), 'capacity': e.capacity},
+        'counts': {'participants': e.confirmed_count, 'waitlist': e.waitlist_count, 'capacity': e.capacity},
+        'next_cursor': next_cursor,
+        'partial': bool(pending),
+        'pending_profiles': len(pending),
     }, status=200)
 
 @csrf_exempt
+@auth.require_line_user
+@db_router.pins_writer
 def event_rsvp(request, event_id: int):
-    """参加/キャンセルAPI。満員時はウェイトリスト登録・繰り上げ昇格に対応。"""
+    """
+    参加/キャンセルAPI。満員時はウェイトリスト登録・繰り上げ昇格に対応（人数は Event のカラムで管理）。
+    先着受付モードのイベントは申込をキューに積んで 202（status='queued'）を返し、確定は run_rsvp_admitter が行う。
+    """
+    if request.method not in ('POST', 'DELETE'):
+        return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
     try:
-        e = Event.objects.get(id=event_id)
+        if request.method == 'DELETE':
+            # 受付モードを切り替えた後でも、キューに残った申込を取り下げられるよう常に admission 経由
+            result = admission.cancel(event_id, request.line_user_id)
+        else:
+            burst = Event.objects.values_list('burst_mode', flat=True).get(pk=event_id)
+            result = (admission.enqueue if burst else rsvp.join)(event_id, request.line_user_id)
     except Event.DoesNotExist:
         return JsonResponse({'ok': False, 'reason': 'not found'}, status=404)
-
-    try:
-        body = json.loads(request.body.decode('utf-8')) if request.body else {}
-    except Exception:
-        return HttpResponseBadRequest('invalid json')
-
-    id_token = (body.get('id_token') or "").strip()
-    if not id_token:
-        return JsonResponse({'ok': False, 'reason': 'id_token required'}, status=401)
-
-    try:
-        payload = _verify_id_token_internal(id_token)
-        user_id = payload.get('sub') or None
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-
-    if request.method == 'POST':
-        existed = Participant.objects.filter(user_id=user_id, event=e).first()
-        if existed:
-            return JsonResponse({
-                'ok': True, 'status': 'already',
-                'is_waiting': existed.is_waiting,
-                'confirmed_count': e.participants.filter(is_waiting=False).count(),
-                'capacity': e.capacity,
-            }, status=200)
-
-        confirmed_count = e.participants.filter(is_waiting=False).count()
-        waiting = (e.capacity is not None) and (confirmed_count >= e.capacity)
-        Participant.objects.create(user_id=user_id, event=e, is_waiting=waiting)
-        return JsonResponse({
-            'ok': True,
-            'status': 'waiting' if waiting else 'joined',
-            'is_waiting': waiting,
-            'confirmed_count': e.participants.filter(is_waiting=False).count(),
-            'capacity': e.capacity,
-        }, status=200)
-
-    if request.method == 'DELETE':
-        p = Participant.objects.filter(user_id=user_id, event=e).first()
-        if not p:
-            return JsonResponse({'ok': True, 'status': 'not_joined'}, status=200)
-        p.delete()
-        promoted_user_id = None
-        if e.capacity is not None:
-            w = Participant.objects.filter(event=e, is_waiting=True).order_by('joined_at').first()
-            if w:
-                w.is_waiting = False
-                w.save(update_fields=['is_waiting'])
-                promoted_user_id = w.user_id
-        return JsonResponse({'ok': True, 'status': 'canceled', 'promoted_user_id': promoted_user_id}, status=200)
-
-    return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
+    return JsonResponse({'ok': True, **result}, status=202 if result['status'] == 'queued' else 200)
 
 @csrf_exempt
+@auth.require_line_user
+@db_router.replica_reads
 def rsvp_status(request):
     """指定イベントID群に対する自分の参加状況をまとめて返す。"""
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
     try:
-        body = json.loads(request.body.decode('utf-8'))
+        body = auth.get_json_body(request)
     except Exception:
         return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
 
-    id_token = (body.get('id_token') or "").strip()
     ids = body.get('ids') or []
-    if not id_token or not isinstance(ids, list) or not ids:
+    if not isinstance(ids, list) or not ids:
         return JsonResponse({'ok': False, 'reason': 'missing_params'}, status=400)
-
-    try:
-        payload = _verify_id_token_internal(id_token)
-        user_id = payload.get('sub') or None
-        if not user_id:
-            return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
-    except Exception:
-        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
+    user_id = request.line_user_id
 
     rows = Participant.objects.filter(user_id=user_id, event_id__in=ids)
     mp = {str(r.event_id): {'joined': True, 'is_waiting': r.is_waiting} for r in rows}
+    # 先着受付モードで確定待ちの申込（queued=True）
+    for event_id in admission.queued_event_ids(user_id, ids):
+        mp.setdefault(str(event_id), {'joined': False, 'is_waiting': False, 'queued': True})
     for i in ids:
         mp.setdefault(str(i), {'joined': False, 'is_waiting': False})
     return JsonResponse({'ok': True, 'statuses': mp}, status=200)
 
 @csrf_exempt
-def group_validate(request):
-    """グループIDの有効性・Bot参加・ユーザー在籍（任意）を検証。"""
+@auth.require_line_user
+async def group_validate(request):
+    """グループIDの有効性・Bot参加・ユーザー在籍（任意）を検証。LINE APIの2呼び出しは並行に待つ。"""
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'reason': 'method_not_allowed'}, status=405)
     try:
-        body = json.loads(request.body.decode('utf-8'))
+        body = auth.get_json_body(request)
     except Exception:
         return JsonResponse({'ok': False, 'reason': 'bad_json'}, status=400)
 
-    id_token = (body.get('id_token') or '').strip()
     group_id = (body.get('group_id') or '').strip()
-    if not id_token or not group_id:
+    if not group_id:
         return JsonResponse({'ok': False, 'reason': 'missing_params'}, status=400)
+    user_id = request.line_user_id
 
-    try:
-        payload = _verify_id_token_internal(id_token)
-        user_id = payload.get('sub') or None
-    except Exception as ex:
-        logger.warning("verify failed: %s", ex)
-        return JsonResponse({'ok': False, 'reason': 'invalid_id_token'}, status=401)
+    calls = [_line_api_async(line_bot_api.get_group_summary, group_id)]
+    if user_id:
+        calls.append(_line_api_async(line_bot_api.get_group_member_profile, group_id, user_id))
+    results = await asyncio.gather(*calls, return_exceptions=True)
 
-    try:
-        summary = line_bot_api.get_group_summary(group_id)
-        group_name = getattr(summary, 'group_name', None) or getattr(summary, 'groupName', None) or ''
-        picture_url = getattr(summary, 'picture_url', None) or getattr(summary, 'pictureUrl', None) or ''
-    except Exception as ex:
-        logger.info("get_group_summary failed: %s", ex)
+    summary = results[0]
+    if isinstance(summary, Exception):
+        logger.info("get_group_summary failed: %s", summary)
         return JsonResponse({'ok': False, 'reason': 'not_joined_or_invalid'}, status=400)
+    group_name = getattr(summary, 'group_name', None) or getattr(summary, 'groupName', None) or ''
+    picture_url = getattr(summary, 'picture_url', None) or getattr(summary, 'pictureUrl', None) or ''
 
     user_in_group = None
     if user_id:
-        try:
-            _ = line_bot_api.get_group_member_profile(group_id, user_id)
-            user_in_group = True
-        except Exception:
-            user_in_group = False
+        user_in_group = not isinstance(results[1], Exception)
 
     return JsonResponse({
         'ok': True,
         'group': {'id': group_id, 'name': group_name, 'pictureUrl': picture_url},
         'user_in_group': user_in_group,
     }, status=200)
+
+
+# =========================
+# 運用メトリクス（DEBUG またはスタッフのみ）
+# =========================
+def ops_metrics(request):
+    """外向きLINE API のエンドポイント別レイテンシと、各キャッシュの状態を返す。"""
+    user = getattr(request, 'user', None)
+    if not (settings.DEBUG or (user is not None and user.is_staff)):
+        return JsonResponse({'ok': False, 'reason': 'forbidden'}, status=403)
+    return JsonResponse({
+        'ok': True,
+        'line_http': line_client.stats.snapshot(),
+        'idtoken_cache': idtoken.cache_stats(),
+        'idtoken_jwks': idtoken.jwks_stats(),
+        'webhook_dedup': webhook_dedup.stats(),
+        'push_outbox': push_outbox.outbox_stats(),
+        'member_profiles': member_profiles.cache_stats(),
+        'rsvp_admission': admission.queue_stats(),
+        'wizard_drafts': drafts.stats(),
+    }, status=200)
@@ -0,0 +1,113 @@
+# events/webhook_dedup.py
+# 役割: LINE の再送（deliveryContext.isRedelivery）で同じ Webhook イベントを二重処理しないよう、
+#       webhookEventId 単位で重複を落とす。プロセス内LRUを前段に、DBの一意制約で最終判定する。
+
+import json, threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ProcessedWebhookEvent
+from .ttlcache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _retention_seconds() -> int:
+    return int(getattr(settings, "LINE_WEBHOOK_DEDUP_RETENTION", 86400))
+
+
+_recent = TTLCache(maxsize=int(getattr(settings, "LINE_WEBHOOK_DEDUP_LRU_SIZE", 10000)),
+                   ttl=_retention_seconds())
+_stats_lock = threading.Lock()
+_stats = {"events": 0, "duplicates": 0, "redeliveries": 0, "redelivered_duplicates": 0}
+
+
+def _count(**inc) -> None:
+    with _stats_lock:
+        for k, v in inc.items():
+            _stats[k] += v
+
+
+def _mark_seen(event_id: str, redelivery: bool = False) -> bool:
+    """初見なら記録して True、既に記録済み（重複）なら False。"""
+    if _recent.get(event_id):
+        return False
+    try:
+        with transaction.atomic():
+            ProcessedWebhookEvent.objects.create(webhook_event_id=event_id, is_redelivery=redelivery)
+    except IntegrityError:
+        _recent.set(event_id, True)
+        return False
+    _recent.set(event_id, True)
+    return True
+
+
+def drop_duplicates(body: str) -> tuple[str, list[str]]:
+    """
+    Webhook ボディから処理済みイベントを取り除く。
+    戻り値: (重複除去後のボディ, 今回新たに記録した webhookEventId のリスト)
+    webhookEventId を持たないイベントはそのまま通す。
+    """
+    data = json.loads(body)
+    events = data.get("events") or []
+    kept, marked = [], []
+    for ev in events:
+        event_id = ev.get("webhookEventId") or ""
+        redelivery = bool((ev.get("deliveryContext") or {}).get("isRedelivery"))
+        _count(events=1, redeliveries=int(redelivery))
+        if event_id and not _mark_seen(event_id, redelivery):
+            _count(duplicates=1, redelivered_duplicates=int(redelivery))
+            logger.info("drop duplicate webhook event id=%s redelivery=%s", event_id, redelivery)
+            continue
+        if event_id:
+            marked.append(event_id)
+        kept.append(ev)
+
+    if len(kept) == len(events):
+        return body, marked
+    data["events"] = kept
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")), marked
+
+
+def forget(event_ids) -> None:
+    """処理に失敗したイベントの記録を取り消す（LINE の再送で再処理できるようにする）。"""
+    event_ids = [e for e in (event_ids or []) if e]
+    if not event_ids:
+        return
+    for e in event_ids:
+        _recent.pop(e)
+    ProcessedWebhookEvent.objects.filter(webhook_event_id__in=event_ids).delete()
+
+
+def prune(older_than_seconds: int | None = None) -> int:
+    """保持期間を過ぎた記録を削除する。"""
+    seconds = _retention_seconds() if older_than_seconds is None else older_than_seconds
+    limit = timezone.now() - timedelta(seconds=seconds)
+    deleted, _ = ProcessedWebhookEvent.objects.filter(received_at__lt=limit).delete()
+    return deleted
+
+
+def stats() -> dict:
+    """受信件数・重複件数・再送件数（プロセス起動以降）と LRU の状態を返す。"""
+    with _stats_lock:
+        out = dict(_stats)
+    out["lru"] = _recent.stats()
+    return out
+
+
+def db_stats() -> dict:
+    """保持期間内の記録件数と、そのうち再送で初めて届いた件数（全プロセス合算）。"""
+    qs = ProcessedWebhookEvent.objects.all()
+    return {"recorded": qs.count(), "first_seen_as_redelivery": qs.filter(is_redelivery=True).count()}
+
+
+def reset() -> None:
+    """プロセス内の状態を初期化する（主にテスト用）。"""
+    _recent.clear()
+    with _stats_lock:
+        for k in _stats:
+            _stats[k] = 0
@@ -0,0 +1,203 @@
+# events/webhook_queue.py
+# 役割: Webhook の非同期処理モード。
+#       callback は署名検証済みのイベントを WebhookInbox に積むだけにし、
+#       ワーカーが scope_id（group/room/user）ごとに受信順を守って処理する。
+
+import json, random, time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Exists, Min, OuterRef
+from django.utils import timezone
+
+from . import drafts
+from .models import WebhookInbox
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _scope_of(ev: dict) -> str:
+    src = ev.get("source") or {}
+    return src.get("groupId") or src.get("roomId") or src.get("userId") or ""
+
+
+# =========================
+# 受付（callback 側）
+# =========================
+
+def enqueue(body: str, *, host: str = "") -> int:
+    """
+    署名検証済みの Webhook ボディをイベント単位に分解して保存する。戻り値は保存件数。
+    1リクエスト = 1 INSERT（bulk_create）で済ませ、LINE への応答を待たせない。
+    """
+    data = json.loads(body)
+    destination = data.get("destination") or ""
+    rows = [
+        WebhookInbox(
+            scope_id=_scope_of(ev),
+            destination=destination,
+            payload=json.dumps(ev, ensure_ascii=False, separators=(",", ":")),
+            request_host=host or "",
+        )
+        for ev in (data.get("events") or [])
+    ]
+    if rows:
+        WebhookInbox.objects.bulk_create(rows)
+    return len(rows)
+
+
+# =========================
+# 取り出し（ワーカー側）
+# =========================
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, "LINE_WEBHOOK_LEASE_SECONDS", 300))
+
+
+def _max_attempts() -> int:
+    return int(getattr(settings, "LINE_WEBHOOK_MAX_ATTEMPTS", 5))
+
+
+def backoff_seconds(attempts: int) -> float:
+    """attempts 回失敗した後の待ち秒数（指数バックオフ＋ジッタ、上限 LINE_WEBHOOK_BACKOFF_MAX）。"""
+    base = float(getattr(settings, "LINE_WEBHOOK_BACKOFF_BASE", 2))
+    cap = float(getattr(settings, "LINE_WEBHOOK_BACKOFF_MAX", 300))
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _claimable(qs):
+    """
+    scope ごとの先頭（最古の pending）で、同じ scope に処理中の行が無く、バックオフ待ちでもない行に絞る。
+    先頭がバックオフ待ちの scope は後続も進めない＝scope内の順序を保証。
+    """
+    same_scope = WebhookInbox.objects.filter(scope_id=OuterRef("scope_id"))
+    busy = same_scope.filter(status="processing")
+    older = same_scope.filter(status="pending", id__lt=OuterRef("id"))
+    return (qs.filter(status="pending", next_attempt_at__lte=timezone.now())
+            .exclude(Exists(busy))
+            .exclude(Exists(older)))
+
+
+def _try_claim(row_id: int, scope_id: str, worker_id: str) -> bool:
+    """
+    1行を processing に遷移させる（1回の UPDATE で判定と確保を行う）。
+    同じ scope に処理中の行がある / より古い未処理行がある / バックオフ待ちの場合は確保しない。
+    """
+    updated = (_claimable(WebhookInbox.objects.filter(id=row_id, scope_id=scope_id))
+               .update(status="processing", locked_by=worker_id, locked_at=timezone.now()))
+    return updated == 1
+
+
+def requeue_stale() -> int:
+    """リース切れ（ワーカー停止など）の processing 行を pending に戻す。"""
+    limit = timezone.now() - timedelta(seconds=_lease_seconds())
+    return (WebhookInbox.objects
+            .filter(status="processing", locked_at__lt=limit)
+            .update(status="pending", locked_by="", locked_at=None))
+
+
+def _default_dispatch(row: WebhookInbox) -> None:
+    # views はハンドラ登録（@handler.add）を持つため遅延 import する
+    from . import views
+    body = json.dumps({"destination": row.destination, "events": [json.loads(row.payload)]},
+                      ensure_ascii=False, separators=(",", ":"))
+    views.dispatch_webhook_body(body, host=row.request_host)
+
+
+def process_row(row: WebhookInbox, dispatch=None) -> bool:
+    """
+    確保済みの1行を処理し、done / pending(再試行) / failed に遷移させる。
+    再試行は backoff_seconds() だけ待たせる（その間、同じ scope の後続も待つ）。
+    """
+    dispatch = dispatch or _default_dispatch
+    try:
+        dispatch(row)
+    except Exception as ex:
+        attempts = row.attempts + 1
+        status = "failed" if attempts >= _max_attempts() else "pending"
+        logger.warning("webhook row=%s failed (attempt %s): %s", row.id, attempts, ex)
+        WebhookInbox.objects.filter(id=row.id).update(
+            status=status, attempts=attempts, last_error=str(ex)[:1000], locked_by="", locked_at=None,
+            next_attempt_at=timezone.now() + timedelta(seconds=backoff_seconds(attempts)),
+        )
+        return False
+    WebhookInbox.objects.filter(id=row.id).update(
+        status="done", attempts=row.attempts + 1, processed_at=timezone.now(), locked_by="", locked_at=None,
+    )
+    return True
+
+
+def drain_once(worker_id: str, *, batch: int = 50, dispatch=None) -> int:
+    """
+    処理できる scope の先頭行を1件ずつ順に処理し、それを batch 件まで繰り返す。戻り値は処理件数。
+    1巡で各 scope から1件ずつ取るので、混んでいる scope（古い行が多いグループ）が他の scope を待たせない。
+    確保できなかった行（同scopeを他ワーカーが処理中）は次回以降に回す。
+    """
+    done = 0
+    while done < batch:
+        candidates = list(_claimable(WebhookInbox.objects.all())
+                          .order_by("id")
+                          .values_list("id", "scope_id")[:batch - done])
+        claimed = 0
+        for row_id, scope_id in candidates:
+            if not _try_claim(row_id, scope_id, worker_id):
+                continue
+            row = WebhookInbox.objects.get(id=row_id)
+            process_row(row, dispatch=dispatch)
+            claimed += 1
+        done += claimed
+        if not claimed:
+            break
+    return done
+
+
+def run_worker(worker_id: str, *, batch: int = 50, idle_sleep: float = 0.5, stop=None, once: bool = False,
+               dispatch=None) -> int:
+    """
+    キューを吸い出し続けるワーカーループ（スレッド/プロセスから呼ぶ）。
+    - stop: threading.Event。セットされたら終了
+    - once: 空になった時点で終了
+    """
+    total = 0
+    while not (stop and stop.is_set()):
+        close_old_connections()
+        n = drain_once(worker_id, batch=batch, dispatch=dispatch)
+        total += n
+        if n == 0:
+            if once:
+                break
+            drafts.flush()  # 手が空いたときに放置下書きを DB へ
+            time.sleep(idle_sleep)
+    close_old_connections()
+    return total
+
+
+# =========================
+# 監視・掃除
+# =========================
+
+def queue_stats() -> dict:
+    """キュー深さ（状態別件数）と遅延（最古の未処理行の待ち秒数）を返す。"""
+    counts = dict(WebhookInbox.objects
+                  .exclude(status="done")
+                  .values_list("status")
+                  .annotate(n=Count("id")))
+    oldest = WebhookInbox.objects.filter(status="pending").aggregate(t=Min("received_at"))["t"]
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {
+        "depth": counts.get("pending", 0) + counts.get("processing", 0),
+        "pending": counts.get("pending", 0),
+        "processing": counts.get("processing", 0),
+        "failed": counts.get("failed", 0),
+        "lag_seconds": round(max(lag, 0.0), 3),
+    }
+
+
+def prune_done(older_than_seconds: int = 86400) -> int:
+    """処理済み行を削除する（テーブル肥大の抑制）。"""
+    limit = timezone.now() - timedelta(seconds=older_than_seconds)
+    deleted, _ = WebhookInbox.objects.filter(status="done", processed_at__lt=limit).delete()
+    return deleted
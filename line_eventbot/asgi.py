@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'line_eventbot.settings')
+# settings 側で ASGI 向けの既定（DB_CONN_MAX_AGE=0 など）に切り替える
+os.environ.setdefault('APP_SERVER', 'asgi')
 
 application = get_asgi_application()
@@ -58,6 +58,27 @@ MINIAPP_CHANNEL_SECRET = pick("MINIAPP_CHANNEL_SECRET")
 # 運用メモとして保持（SDK自体はこの値を直接使わない）
 LIFF_ENDPOINT_URL = pick("LIFF_ENDPOINT_URL", "")
 
+# IDトークン検証（events/idtoken.py）
+# - local : サーバ内で署名/aud/iss/exp/nonce を検証（既定）
+# - remote: 毎回 api.line.me の verify エンドポイントで検証
+LINE_IDTOKEN_VERIFY_MODE = os.getenv("LINE_IDTOKEN_VERIFY_MODE", "local").lower()
+# ローカル検証できない場合（鍵不明/ライブラリ不足）に verify エンドポイントへ落とすか
+# ※ ES256 のローカル検証は任意依存の cryptography を入れたときだけ。無ければ ES256 はこのフォールバックで検証する
+#   （起動時チェック events.W001 で警告、フォールバックも無効なら events.E002 でエラー）
+LINE_IDTOKEN_REMOTE_FALLBACK = os.getenv("LINE_IDTOKEN_REMOTE_FALLBACK", "true").lower() == "true"
+LINE_IDTOKEN_JWKS_URL = os.getenv("LINE_IDTOKEN_JWKS_URL", "https://api.line.me/oauth2/v2.1/certs")
+LINE_IDTOKEN_JWKS_TTL = int(os.getenv("LINE_IDTOKEN_JWKS_TTL", "3600"))
+# JWKS を取り直す最小間隔（秒）。未知の kid による強制再取得や、取得失敗後の再試行もこの間隔に1回まで
+LINE_IDTOKEN_JWKS_MIN_REFRESH = float(os.getenv("LINE_IDTOKEN_JWKS_MIN_REFRESH", "60"))
+# テスト/オフライン用の代替鍵セット（JWKS形式のJSON）。設定時は JWKS_URL より優先
+LINE_IDTOKEN_JWKS = os.getenv("LINE_IDTOKEN_JWKS", "")
+LINE_IDTOKEN_ISSUER = os.getenv("LINE_IDTOKEN_ISSUER", "https://access.line.me")
+LINE_IDTOKEN_LEEWAY = int(os.getenv("LINE_IDTOKEN_LEEWAY", "30"))
+# 検証済みトークンのキャッシュ件数上限（トークンの exp まで保持、超過分はLRUで追い出し）
+LINE_IDTOKEN_CACHE_SIZE = int(os.getenv("LINE_IDTOKEN_CACHE_SIZE", "4096"))
+# auth/session で発行する LIFF 用セッション（SECRET_KEY で署名）の有効期間（秒）
+LIFF_SESSION_TTL = int(os.getenv("LIFF_SESSION_TTL", "3600"))
+
 # ============================================================
 # Messaging API（Bot通知）用設定
 # - プッシュ/リプライ送信にチャネルアクセストークンを使用
@@ -67,6 +88,57 @@ LIFF_ENDPOINT_URL = pick("LIFF_ENDPOINT_URL", "")
 MESSAGING_CHANNEL_ACCESS_TOKEN = pick("MESSAGING_CHANNEL_ACCESS_TOKEN")
 MESSAGING_CHANNEL_SECRET = pick("MESSAGING_CHANNEL_SECRET")
 
+# Webhook 非同期処理モード（events/webhook_queue.py）
+# True: /callback は署名検証とキュー保存のみで即 200。処理は run_webhook_workers が行う
+LINE_WEBHOOK_ASYNC = os.getenv("LINE_WEBHOOK_ASYNC", "false").lower() == "true"
+LINE_WEBHOOK_LEASE_SECONDS = int(os.getenv("LINE_WEBHOOK_LEASE_SECONDS", "300"))
+LINE_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("LINE_WEBHOOK_MAX_ATTEMPTS", "5"))
+# 処理に失敗した行の再試行待ち（指数バックオフの基数/上限 秒）。待っている間は同じ scope の後続も止める
+LINE_WEBHOOK_BACKOFF_BASE = float(os.getenv("LINE_WEBHOOK_BACKOFF_BASE", "2"))
+LINE_WEBHOOK_BACKOFF_MAX = float(os.getenv("LINE_WEBHOOK_BACKOFF_MAX", "300"))
+# 再送の重複排除（events/webhook_dedup.py）: webhookEventId の保持秒数とプロセス内LRU件数
+LINE_WEBHOOK_DEDUP_RETENTION = int(os.getenv("LINE_WEBHOOK_DEDUP_RETENTION", "86400"))
+LINE_WEBHOOK_DEDUP_LRU_SIZE = int(os.getenv("LINE_WEBHOOK_DEDUP_LRU_SIZE", "10000"))
+
+# グループ名/アイコンのキャッシュ（events/group_summary.py）
+# KnownGroup.last_summary_at からの有効秒数、取得失敗時の再試行間隔（秒）、裏で取り直すスレッド数
+LINE_GROUP_SUMMARY_TTL = int(os.getenv("LINE_GROUP_SUMMARY_TTL", "21600"))
+LINE_GROUP_SUMMARY_RETRY = int(os.getenv("LINE_GROUP_SUMMARY_RETRY", "300"))
+LINE_GROUP_SUMMARY_WORKERS = int(os.getenv("LINE_GROUP_SUMMARY_WORKERS", "2"))
+
+# メンバープロフィールのキャッシュ（events/profiles.py）
+# 件数上限・TTL・取得失敗の負キャッシュTTL（秒）、並列取得のスレッド数、1リクエストの待ち上限（秒）
+LINE_PROFILE_CACHE_SIZE = int(os.getenv("LINE_PROFILE_CACHE_SIZE", "10000"))
+LINE_PROFILE_CACHE_TTL = int(os.getenv("LINE_PROFILE_CACHE_TTL", "3600"))
+LINE_PROFILE_NEGATIVE_TTL = int(os.getenv("LINE_PROFILE_NEGATIVE_TTL", "60"))
+LINE_PROFILE_FETCH_WORKERS = int(os.getenv("LINE_PROFILE_FETCH_WORKERS", "8"))
+LINE_PROFILE_DEADLINE = float(os.getenv("LINE_PROFILE_DEADLINE", "2.5"))
+
+# グループ在籍の記録（events/membership.py）: 在籍/非在籍の記録を信用する秒数と、
+# 記録が無いグループを groups_suggest(only_my) で確認する時間予算（秒）
+LINE_MEMBERSHIP_TTL = int(os.getenv("LINE_MEMBERSHIP_TTL", "604800"))
+LINE_MEMBERSHIP_NEGATIVE_TTL = int(os.getenv("LINE_MEMBERSHIP_NEGATIVE_TTL", "21600"))
+LINE_MEMBERSHIP_CHECK_BUDGET = float(os.getenv("LINE_MEMBERSHIP_CHECK_BUDGET", "1.5"))
+
+# push 通知アウトボックス（events/push_outbox.py, run_push_dispatcher）
+# 送信レート（push/秒）とバースト、再試行回数、指数バックオフの基数/上限（秒）
+LINE_PUSH_RATE = float(os.getenv("LINE_PUSH_RATE", "10"))
+LINE_PUSH_BURST = float(os.getenv("LINE_PUSH_BURST", "10"))
+LINE_PUSH_MAX_ATTEMPTS = int(os.getenv("LINE_PUSH_MAX_ATTEMPTS", "8"))
+LINE_PUSH_BACKOFF_BASE = float(os.getenv("LINE_PUSH_BACKOFF_BASE", "2"))
+LINE_PUSH_BACKOFF_MAX = float(os.getenv("LINE_PUSH_BACKOFF_MAX", "600"))
+LINE_PUSH_LEASE_SECONDS = int(os.getenv("LINE_PUSH_LEASE_SECONDS", "120"))
+
+# 先着受付モード（events/admission.py）: run_rsvp_admitter が1回の確定でまとめる申込数
+LINE_RSVP_ADMIT_BATCH = int(os.getenv("LINE_RSVP_ADMIT_BATCH", "500"))
+
+# LINE への外向きHTTP（events/line_client.py）: keep-alive プールの最大接続数と既定タイムアウト（接続, 読み取り 秒）
+LINE_HTTP_POOL_SIZE = int(os.getenv("LINE_HTTP_POOL_SIZE", "20"))
+LINE_HTTP_TIMEOUT = (
+    float(os.getenv("LINE_HTTP_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("LINE_HTTP_READ_TIMEOUT", "10")),
+)
+
 # ============================================================
 # アプリケーション定義
 # ============================================================
@@ -112,13 +184,126 @@ TEMPLATES = [
 WSGI_APPLICATION = 'line_eventbot.wsgi.application'
 
 # ============================================================
-# データベース（既定：SQLite）
+# データベース（既定：SQLite / DB_ENGINE=postgres で PostgreSQL）
 # ============================================================
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
+
+# 起動方法（asgi.py が APP_SERVER=asgi を設定する。runserver / gunicorn+wsgi は wsgi）
+APP_SERVER = os.getenv("APP_SERVER", "wsgi").lower()
+
+# 接続の使い回し（秒）。0 でリクエスト毎に接続し直す（Django の既定）
+# ASGI では既定 0: async ビューの ORM は sync_to_async のスレッドで接続を開き、リクエスト終了時に閉じられないため
+# 使い回すと接続が溜まる。ASGI で接続を使い回すなら PostgreSQL の接続プール（DB_POOL_MAX_SIZE>0）を使うこと
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0" if APP_SERVER == "asgi" else "60"))
+
+# SQLite: ファイルは SQLITE_PATH（既定 db.sqlite3）。接続ごとに適用する PRAGMA
+# - WAL: 読み取りが書き込みを待たない / synchronous=NORMAL: WAL では電源断時に直近のコミットを失うだけで壊れない
+# - busy_timeout: ロック中は待つ（"database is locked" を即座に返さない）
+# - mmap_size: 読み取りをメモリマップで（0 で無効）
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+
+
+def sqlite_options(*, journal_mode=SQLITE_JOURNAL_MODE, synchronous=SQLITE_SYNCHRONOUS,
+                   busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS, mmap_size=SQLITE_MMAP_SIZE) -> dict:
+    """SQLite の OPTIONS（bench_db_writes でも別プロファイルを組むのに使う）。"""
+    return {
+        "init_command": ";".join([
+            f"PRAGMA journal_mode={journal_mode}",
+            f"PRAGMA synchronous={synchronous}",
+            f"PRAGMA busy_timeout={busy_timeout_ms}",
+            f"PRAGMA mmap_size={mmap_size}",
+        ]),
+        "timeout": busy_timeout_ms / 1000,
+        # 書き込むトランザクションは BEGIN IMMEDIATE で始め、読んでから書く途中のロック昇格失敗を無くす
+        "transaction_mode": "IMMEDIATE",
+    }
+
+
+if DB_ENGINE in ("postgres", "postgresql"):
+    # 接続プール（psycopg 3 の pool）を使う場合は DB_POOL_MAX_SIZE>0。プールと CONN_MAX_AGE は併用できない
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+    _pg_options = {"connect_timeout": int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "5"))}
+    if DB_POOL_MAX_SIZE > 0:
+        _pg_options["pool"] = {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("POSTGRES_DB", "line_eventbot"),
+            'USER': os.getenv("POSTGRES_USER", "postgres"),
+            'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+            'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+            'PORT': os.getenv("POSTGRES_PORT", "5432"),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE > 0 else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': _pg_options,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("SQLITE_PATH") or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': sqlite_options(),
+            # テストDBはファイルにする（共有キャッシュのインメモリDBは別スレッドの接続がロック待ちできず、並行テストが組めない）
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
+
+# 読み取りレプリカ（events/db_router.py）: LIFF の読み取り専用APIだけをレプリカへ向ける
+# - SQLite: SQLITE_REPLICA_PATH のファイル（sync_replica コマンドで default から複製する）
+# - PostgreSQL: POSTGRES_REPLICA_HOST（ストリーミングレプリケーション等で追従している前提）
+# 書き込んだユーザーは DB_READ_PIN_SECONDS 秒プライマリに固定する（CACHES['default'] に記録。
+# 複数プロセスでは共有キャッシュが必要で、locmem だと起動時チェック events.E003 でエラー）
+_replica = None
+if DB_ENGINE in ("postgres", "postgresql") and os.getenv("POSTGRES_REPLICA_HOST"):
+    _replica = {**DATABASES['default'], 'HOST': os.getenv("POSTGRES_REPLICA_HOST"),
+                'PORT': os.getenv("POSTGRES_REPLICA_PORT", DATABASES['default']['PORT'])}
+elif DB_ENGINE not in ("postgres", "postgresql") and os.getenv("SQLITE_REPLICA_PATH"):
+    _replica = {**DATABASES['default'], 'NAME': os.getenv("SQLITE_REPLICA_PATH")}
+if _replica:
+    # テスト中は default をそのまま使う
+    DATABASES['replica'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+DB_READ_REPLICA = 'replica' if _replica else ''
+DB_READ_PIN_SECONDS = int(os.getenv("DB_READ_PIN_SECONDS", "5"))
+DATABASE_ROUTERS = ['events.db_router.ReadReplicaRouter']
+
+# ============================================================
+# キャッシュ（DB固定の記録・ウィザード下書き）
+# ============================================================
+# CACHE_BACKEND: locmem（既定, プロセス内のみ）| file（CACHE_DIR 配下, 同一ホストの複数プロセスで共有）
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem").lower()
+CACHE_DIR = Path(os.getenv("CACHE_DIR") or BASE_DIR / '.cache')
+# アプリのプロセス数（gunicorn 等の WEB_CONCURRENCY）。2 以上で locmem だと起動時チェック events.E001/E003 でエラー
+APP_PROCESSES = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+def cache_config(name: str, timeout: int) -> dict:
+    """CACHE_BACKEND に応じた CACHES の1エントリを返す（name は locmem の領域名/file のサブディレクトリ）。"""
+    if CACHE_BACKEND == "file":
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(CACHE_DIR / name), 'TIMEOUT': timeout}
+    return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': name, 'TIMEOUT': timeout, 'OPTIONS': {'MAX_ENTRIES': 10000}}
+
+# 下書きはキャッシュ上で進め、DB（EventDraft/EventEditDraft）へは確定/終了/放置時だけ書く
+DRAFT_CACHE_TTL = int(os.getenv("DRAFT_CACHE_TTL", str(24 * 3600)))
+DRAFT_FLUSH_IDLE_SECONDS = int(os.getenv("DRAFT_FLUSH_IDLE_SECONDS", "300"))
+# ボタンの postback に載せる下書きトークンの有効期間（秒）。過ぎたらサーバ側の下書きで処理する
+DRAFT_TOKEN_MAX_AGE = int(os.getenv("DRAFT_TOKEN_MAX_AGE", "3600"))
+# 最後の操作からこの秒数を過ぎた下書きは sweep_drafts / run_webhook_workers が削除する（DRAFT_CACHE_TTL 以上にすること）
+DRAFT_EXPIRE_SECONDS = int(os.getenv("DRAFT_EXPIRE_SECONDS", str(3 * 24 * 3600)))
+CACHES = {
+    'default': cache_config('default', 300),
+    'drafts': cache_config('drafts', DRAFT_CACHE_TTL),
 }
 
 # ============================================================